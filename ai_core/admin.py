@@ -1,3 +1,61 @@
 from django.contrib import admin
+from django.template.response import TemplateResponse
+from django.urls import path
 
-# Register your models here.
+from .models import AIGeneration, LLMCall
+from .services.telemetry import summarize_calls
+
+# Longest window the telemetry dashboard accepts, in days
+MAX_DASHBOARD_DAYS = 90
+
+
+class AIGenerationAdmin(admin.ModelAdmin):
+    list_display = ["id", "topic", "document_file", "status", "attempts", "created_at"]
+    list_filter = ["status"]
+    readonly_fields = ["attempts", "available_at", "locked_until", "claim_token"]
+
+
+class LLMCallAdmin(admin.ModelAdmin):
+    list_display = [
+        "created_at", "provider", "model", "caller", "attempt", "outcome",
+        "latency_ms", "prompt_tokens", "completion_tokens",
+    ]
+    list_filter = ["outcome", "provider", "caller", "streamed"]
+    date_hierarchy = "created_at"
+    change_list_template = "admin/ai_core/llmcall/change_list.html"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                "dashboard/",
+                self.admin_site.admin_view(self.dashboard_view),
+                name="ai_core_llmcall_dashboard",
+            ),
+        ] + super().get_urls()
+
+    def dashboard_view(self, request):
+        """Latency percentiles and token use of recent LLM calls."""
+        try:
+            days = min(max(int(request.GET.get("days", 7)), 1), MAX_DASHBOARD_DAYS)
+        except ValueError:
+            days = 7
+        provider = request.GET.get("provider") or None
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "LLM call dashboard",
+            "days": days,
+            "provider": provider,
+            "summary": summarize_calls(days, provider),
+        }
+        return TemplateResponse(request, "admin/ai_core/llmcall/dashboard.html", context)
+
+
+admin.site.register(AIGeneration, AIGenerationAdmin)
+admin.site.register(LLMCall, LLMCallAdmin)
@@ -0,0 +1,127 @@
+"""Load generator for the ai_core services, used by the benchmark_ai command.
+
+Each scenario is a callable taking the request number; ``run_load`` calls
+it ``requests`` times from a pool of ``concurrency`` threads and summarises
+latency percentiles, throughput and errors.
+"""
+import logging
+import math
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.db import connection
+
+from ai_core.models import AIGeneration
+from ai_core.services import DocumentService, LessonService, QuizService
+
+logger = logging.getLogger("ai_core")
+
+SAMPLE_LESSON = (
+    "<h2>Hash tables</h2>"
+    "<p>A hash table maps keys to values through a hash function that picks a "
+    "bucket for each key. Lookups, inserts and deletes take constant time on "
+    "average.</p>"
+    "<table><tr><th>Strategy</th><th>Collision handling</th></tr>"
+    "<tr><td>Chaining</td><td>Each bucket keeps a list of entries</td></tr>"
+    "<tr><td>Open addressing</td><td>Probe for the next free slot</td></tr></table>"
+    "<p>When the load factor grows past a threshold the table is resized and "
+    "every entry is rehashed into the larger bucket array.</p>"
+)
+
+SAMPLE_DOCUMENT = "\n\n".join(
+    f"Section {i}. Balanced search trees keep their height logarithmic in the "
+    f"number of keys by rotating nodes after inserts and deletes. Red-black "
+    f"trees colour nodes, AVL trees track subtree heights."
+    for i in range(1, 41)
+)
+
+
+def percentile(values: list, q: float) -> float:
+    """Return the ``q``-th percentile (0-100) of sorted ``values``, nearest rank."""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[rank - 1]
+
+
+def run_load(task, requests: int, concurrency: int) -> dict:
+    """Call ``task(i)`` for ``i`` in ``range(requests)`` and summarise it.
+
+    Returns:
+        A dict with the request and error counts, errors by exception type,
+        latency percentiles and mean in milliseconds (successful calls
+        only), wall-clock seconds and throughput in requests per second.
+    """
+    def timed(i):
+        started = time.perf_counter()
+        try:
+            task(i)
+            return time.perf_counter() - started, None
+        except Exception as exc:
+            return time.perf_counter() - started, exc.__class__.__name__
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ai-bench") as pool:
+        outcomes = list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(seconds * 1000 for seconds, error in outcomes if error is None)
+    errors = Counter(error for _, error in outcomes if error is not None)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": sum(errors.values()),
+        "error_types": dict(errors),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def lesson_scenario(llm):
+    def task(i):
+        LessonService(llm).generate(f"Benchmark topic {i}", use_cache=False)
+    return task
+
+
+def quiz_scenario(llm, num_questions: int = 5):
+    def task(i):
+        QuizService(llm).generate(
+            f"{SAMPLE_LESSON}<p>Variant {i}.</p>", num_questions, use_cache=False
+        )
+    return task
+
+
+def upload_scenario(llm):
+    """Run the full upload pipeline (extract, chunk, store, prompt) per request.
+
+    Every request creates its own ``AIGeneration`` and deletes it, with its
+    file, afterwards.
+    """
+    def task(i):
+        generation = AIGeneration.objects.create(
+            topic=f"Benchmark upload {i}",
+            document_file=ContentFile(
+                f"Upload {i}.\n\n{SAMPLE_DOCUMENT}".encode(), name=f"benchmark_{i}.txt"
+            ),
+        )
+        try:
+            DocumentService(llm).process(generation)
+        finally:
+            generation.document_file.delete(save=False)
+            generation.delete()
+    return task
+
+
+SCENARIOS = {
+    "lesson": lesson_scenario,
+    "quiz": quiz_scenario,
+    "upload": upload_scenario,
+}
@@ -0,0 +1,46 @@
+"""View decorators for coroutine views.
+
+Django 4.0's ``login_required``, ``require_http_methods`` and ``csrf_exempt``
+wrap views in synchronous functions, which hides the coroutine from the
+request handler. These equivalents keep the wrapped view async.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponseNotAllowed
+
+
+def async_csrf_exempt(view_func):
+    """Mark a view as exempt from CSRF checks without wrapping it."""
+    view_func.csrf_exempt = True
+    return view_func
+
+
+def async_login_required(view_func):
+    """Redirect anonymous users to the login page."""
+
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        # request.user is loaded lazily from the session, i.e. the database
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_require_http_methods(methods):
+    """Return 405 for request methods not in ``methods``."""
+
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            return await view_func(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
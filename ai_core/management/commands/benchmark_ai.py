@@ -0,0 +1,88 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_core.benchmark import SCENARIOS, run_load
+from ai_core.services import get_llm_service
+from ai_core.services.cache import DummyResponseCache
+from ai_core.services.fake import FakeLLMService
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the lesson, quiz and upload pipelines and report latency "
+        "percentiles and throughput (offline by default)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenario", choices=sorted(SCENARIOS) + ["all"], default="all",
+        )
+        parser.add_argument("--requests", type=int, default=50)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--provider", default="fake",
+            help="Registered provider name; 'fake' builds a FakeLLMService "
+                 "from the options below",
+        )
+        parser.add_argument("--latency", type=float, help="Fake provider latency (s)")
+        parser.add_argument("--token-rate", type=float, help="Fake tokens per second")
+        parser.add_argument("--failure-rate", type=float, help="Fake failure share")
+        parser.add_argument("--malformed-rate", type=float, help="Fake malformed-JSON share")
+        parser.add_argument("--seed", type=int)
+        parser.add_argument("--json", action="store_true", help="Print results as JSON")
+        parser.add_argument(
+            "--max-p95", type=float,
+            help="Fail if any scenario's p95 latency exceeds this many milliseconds",
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be positive")
+
+        llm = self._provider(options)
+        names = sorted(SCENARIOS) if options["scenario"] == "all" else [options["scenario"]]
+
+        results = {}
+        for name in names:
+            results[name] = run_load(
+                SCENARIOS[name](llm), options["requests"], options["concurrency"]
+            )
+            if not options["json"]:
+                self.stdout.write(self._format(name, results[name]))
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+
+        limit = options["max_p95"]
+        if limit is not None:
+            slow = [name for name, result in results.items() if result["p95_ms"] > limit]
+            if slow:
+                raise CommandError(f"p95 latency above {limit} ms: {', '.join(slow)}")
+
+    @staticmethod
+    def _provider(options):
+        if options["provider"] != "fake":
+            return get_llm_service(options["provider"])
+
+        fake_options = {
+            key: options[key]
+            for key in ("latency", "token_rate", "failure_rate", "malformed_rate", "seed")
+            if options[key] is not None
+        }
+        llm = FakeLLMService(**fake_options)
+        # Measure the pipeline, not the response cache
+        llm.cache = DummyResponseCache()
+        return llm
+
+    @staticmethod
+    def _format(name: str, result: dict) -> str:
+        line = (
+            f"{name:<8} n={result['requests']} c={result['concurrency']} "
+            f"errors={result['errors']} p50={result['p50_ms']}ms "
+            f"p95={result['p95_ms']}ms p99={result['p99_ms']}ms "
+            f"{result['throughput_rps']} req/s"
+        )
+        if result["error_types"]:
+            line += f" {result['error_types']}"
+        return line
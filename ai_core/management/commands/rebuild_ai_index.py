@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from ai_core.models import DocumentChunk
+from ai_core.services.retrieval import VectorIndex
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-course vector indexes from stored document chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--course", type=int, action="append", help="Course id (repeatable)"
+        )
+
+    def handle(self, *args, **options):
+        course_ids = options["course"] or (
+            DocumentChunk.objects.filter(generation__course__isnull=False)
+            .values_list("generation__course_id", flat=True)
+            .distinct()
+        )
+        for course_id in course_ids:
+            rows = (
+                DocumentChunk.objects.filter(generation__course_id=course_id)
+                .order_by("generation_id", "index")
+                .values_list("pk", "generation_id", "generation__content_hash", "text")
+                .iterator()
+            )
+            count = VectorIndex.for_course(course_id).build(self._first_copies(rows))
+            self.stdout.write(f"Course {course_id}: {count} chunk(s) indexed")
+        self.stdout.write(self.style.SUCCESS("Done"))
+
+    @staticmethod
+    def _first_copies(rows):
+        """Drop the chunks of re-uploads whose content is already in the course."""
+        first = {}
+        for chunk_id, generation_id, content_hash, text in rows:
+            if content_hash and first.setdefault(content_hash, generation_id) != generation_id:
+                continue
+            yield chunk_id, generation_id, text
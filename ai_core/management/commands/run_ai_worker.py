@@ -0,0 +1,58 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from ai_core.worker import GenerationWorker
+
+
+class Command(BaseCommand):
+    help = "Process pending AIGeneration uploads from the database queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, help="Documents processed at the same time"
+        )
+        parser.add_argument(
+            "--provider", help="LLM provider to use (default: AI_DEFAULT_PROVIDER)"
+        )
+        parser.add_argument("--max-attempts", type=int)
+        parser.add_argument(
+            "--visibility-timeout",
+            type=int,
+            help="Seconds before a row claimed by a dead worker is retried",
+        )
+        parser.add_argument(
+            "--retry-backoff",
+            type=int,
+            help="Seconds before a failed document is retried, doubled on each attempt",
+        )
+        parser.add_argument("--poll-interval", type=float)
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of polling forever",
+        )
+
+    def handle(self, *args, **options):
+        worker = GenerationWorker(
+            concurrency=options["concurrency"],
+            provider=options["provider"],
+            max_attempts=options["max_attempts"],
+            visibility_timeout=options["visibility_timeout"],
+            retry_backoff=options["retry_backoff"],
+            poll_interval=options["poll_interval"],
+        )
+
+        def shutdown(signum, frame):
+            self.stdout.write("Shutting down after in-flight documents finish...")
+            worker.stop()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        self.stdout.write(
+            f"AI worker started (concurrency={worker.concurrency}, "
+            f"provider={worker.provider})"
+        )
+        processed = worker.run(once=options["once"])
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} document(s)"))
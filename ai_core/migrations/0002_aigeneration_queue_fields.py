@@ -0,0 +1,42 @@
+# Generated by Django 4.0.8 on 2026-10-17 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aigeneration',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='aigeneration',
+            name='available_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='aigeneration',
+            name='claim_token',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='aigeneration',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='aigeneration',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='aigeneration',
+            index=models.Index(fields=['status', 'available_at'], name='ai_core_aig_status_7d1142_idx'),
+        ),
+    ]
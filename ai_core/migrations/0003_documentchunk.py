@@ -0,0 +1,38 @@
+# Generated by Django 4.0.8 on 2026-10-17 01:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0002_aigeneration_queue_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aigeneration',
+            name='pipeline_stats',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.CreateModel(
+            name='DocumentChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('token_count', models.PositiveIntegerField()),
+                ('page_start', models.PositiveIntegerField(blank=True, null=True)),
+                ('page_end', models.PositiveIntegerField(blank=True, null=True)),
+                ('generation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='ai_core.aigeneration')),
+            ],
+            options={
+                'ordering': ['generation', 'index'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='documentchunk',
+            constraint=models.UniqueConstraint(fields=('generation', 'index'), name='unique_chunk_per_generation'),
+        ),
+    ]
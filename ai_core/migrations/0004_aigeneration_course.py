@@ -0,0 +1,20 @@
+# Generated by Django 4.0.8 on 2026-10-17 01:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0004_alter_course_code_alter_course_credit_and_more'),
+        ('ai_core', '0003_documentchunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aigeneration',
+            name='course',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ai_generations', to='course.course'),
+        ),
+    ]
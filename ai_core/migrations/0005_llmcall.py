@@ -0,0 +1,40 @@
+# Generated by Django 4.0.8 on 2026-10-17 02:19
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0004_aigeneration_course'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=50)),
+                ('model', models.CharField(blank=True, max_length=100)),
+                ('caller', models.CharField(blank=True, max_length=100)),
+                ('attempt', models.PositiveSmallIntegerField(default=1)),
+                ('outcome', models.CharField(choices=[('SUCCESS', 'Success'), ('FAILED', 'Failed'), ('CACHE_HIT', 'Cache hit'), ('CANCELLED', 'Cancelled')], max_length=20)),
+                ('streamed', models.BooleanField(default=False)),
+                ('latency_ms', models.FloatField()),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('tokens_estimated', models.BooleanField(default=False)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'LLM call',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='llmcall',
+            index=models.Index(fields=['provider', 'created_at'], name='ai_core_llm_provide_b5377b_idx'),
+        ),
+    ]
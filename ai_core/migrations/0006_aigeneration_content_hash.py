@@ -0,0 +1,41 @@
+# Generated by Django 4.0.8 on 2026-10-17 02:23
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_content_hash(apps, schema_editor):
+    """Hash the files of earlier uploads so re-uploads can reuse them."""
+    AIGeneration = apps.get_model("ai_core", "AIGeneration")
+    for generation in AIGeneration.objects.filter(document_file__gt="").only("document_file"):
+        hasher = hashlib.sha256()
+        try:
+            with generation.document_file.open("rb") as fh:
+                for chunk in fh.chunks():
+                    hasher.update(chunk)
+        except OSError:
+            continue
+        AIGeneration.objects.filter(pk=generation.pk).update(
+            content_hash=hasher.hexdigest()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0005_llmcall'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aigeneration',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='aigeneration',
+            index=models.Index(fields=['content_hash', 'status'], name='ai_core_aig_content_c07eed_idx'),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
@@ -1,24 +1,131 @@
 from django.db import models
+from django.utils import timezone
+
+from course.models import Course
+
+PENDING = "PENDING"
+PROCESSING = "PROCESSING"
+SUCCESS = "SUCCESS"
+FAILED = "FAILED"
+
+STATUS_CHOICES = (
+    (PENDING, "Pending"),
+    (PROCESSING, "Processing"),
+    (SUCCESS, "Success"),
+    (FAILED, "Failed"),
+)
+
+# Outcomes of an LLM call besides SUCCESS and FAILED
+CACHE_HIT = "CACHE_HIT"
+CANCELLED = "CANCELLED"
+
+OUTCOME_CHOICES = (
+    (SUCCESS, "Success"),
+    (FAILED, "Failed"),
+    (CACHE_HIT, "Cache hit"),
+    (CANCELLED, "Cancelled"),
+)
+
 
 # Create your models here.
 class AIGeneration(models.Model):
     topic = models.CharField(max_length=255, null=True, blank=True)
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="ai_generations",
+    )
     prompt = models.TextField(null=True, blank=True)
-    
+
     document_file = models.FileField(upload_to="ai_docs/", null=True, blank=True)
 
     html_content = models.TextField(null=True, blank=True)
 
     status = models.CharField(
         max_length=20,
-        choices=[
-            ("PENDING", "Pending"),
-            ("PROCESSING", "Processing"),
-            ("SUCCESS", "Success"),
-            ("FAILED", "Failed"),
-        ],
-        default="PENDING"
+        choices=STATUS_CHOICES,
+        default=PENDING
     )
 
     error_message = models.TextField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Work queue bookkeeping used by the run_ai_worker command
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    claim_token = models.CharField(max_length=64, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Per-stage timings and byte counts of the document pipeline
+    pipeline_stats = models.JSONField(default=dict, blank=True)
+
+    # SHA-256 of the uploaded file; uploads with the same content share work
+    content_hash = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "available_at"]),
+            models.Index(fields=["content_hash", "status"]),
+        ]
+
+    def __str__(self):
+        return f"AIGeneration #{self.pk} ({self.status})"
+
+
+class DocumentChunk(models.Model):
+    """A token-bounded slice of the text extracted from an uploaded document."""
+
+    generation = models.ForeignKey(
+        AIGeneration, on_delete=models.CASCADE, related_name="chunks"
+    )
+    index = models.PositiveIntegerField()
+    text = models.TextField()
+    token_count = models.PositiveIntegerField()
+    page_start = models.PositiveIntegerField(null=True, blank=True)
+    page_end = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["generation", "index"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["generation", "index"], name="unique_chunk_per_generation"
+            ),
+        ]
+
+    def __str__(self):
+        return f"Chunk {self.index} of AIGeneration #{self.generation_id}"
+
+
+class LLMCall(models.Model):
+    """One call made through ``BaseLLMService``, written in batches by
+    ``ai_core.services.telemetry``."""
+
+    provider = models.CharField(max_length=50)
+    model = models.CharField(max_length=100, blank=True)
+    # Service and method that made the call, e.g. "quiz.generate"
+    caller = models.CharField(max_length=100, blank=True)
+    # 1 for the first call of a request, higher for retries and repair rounds
+    attempt = models.PositiveSmallIntegerField(default=1)
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES)
+    streamed = models.BooleanField(default=False)
+    latency_ms = models.FloatField()
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    # Whether the token counts are local estimates rather than provider-reported
+    tokens_estimated = models.BooleanField(default=False)
+    error = models.CharField(max_length=255, blank=True)
+    # Set when the call finished, not when its batch was written
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = "LLM call"
+        indexes = [
+            models.Index(fields=["provider", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.caller or self.provider} ({self.outcome}, {self.latency_ms:.0f} ms)"
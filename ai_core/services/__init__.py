@@ -1,4 +1,9 @@
 from .base import BaseLLMService
-from .gemini import GeminiService
+from .fake import FakeLLMService
+from .gemini import GeminiLiteService, GeminiService
+from .document import DocumentService
 from .lesson import LessonService
 from .quiz import QuizGenerationError, QuizService
+from .quiz_import import QuizImportError, QuizImportService
+from .registry import default_provider, get_llm_service, register_provider, reset_llm_services
+from .resilient import ProviderUnavailableError, ResilientLLMService
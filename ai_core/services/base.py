@@ -1,14 +1,33 @@
 """Base LLM service interface."""
 import logging
+import time
 from abc import ABC, abstractmethod
+from asgiref.sync import sync_to_async
 from langchain_core.messages import HumanMessage, SystemMessage
 
+from ai_core.models import CACHE_HIT, CANCELLED, FAILED, SUCCESS
+
+from .budget import response_usage
+from .cache import get_response_cache, make_cache_key
+from .chunking import count_tokens
+from .limiter import get_call_limiter
+from .telemetry import record_call
+
 logger = logging.getLogger("ai_core")
 
+# Chat model attributes that change the completion and so belong in the cache key.
+GENERATION_PARAMS = ("temperature", "top_p", "top_k", "max_output_tokens", "max_tokens")
+
 
 class BaseLLMService(ABC):
     """Abstract base for all LLM providers."""
 
+    # Short provider name used in cache keys; defaults to the class name.
+    provider = None
+
+    # Response cache used by chat(); ``None`` means the process-wide cache.
+    cache = None
+
     @abstractmethod
     def _build_llm(self):
         """Return a LangChain chat model instance."""
@@ -18,15 +37,279 @@ class BaseLLMService(ABC):
         self.llm = self._build_llm()
         logger.info(f"{self.__class__.__name__} initialized")
 
-    def chat(self, message: str, system_prompt: str = None) -> str:
-        """Send a message and return the response text."""
+    @property
+    def model_name(self) -> str:
+        return str(getattr(self.llm, "model", None) or getattr(self.llm, "model_name", ""))
+
+    def generation_params(self) -> dict:
+        """Return the generation parameters of the underlying chat model."""
+        return {
+            name: getattr(self.llm, name)
+            for name in GENERATION_PARAMS
+            if getattr(self.llm, name, None) is not None
+        }
+
+    def get_cache(self):
+        return self.cache if self.cache is not None else get_response_cache()
+
+    def cache_key(self, message: str, system_prompt: str = None) -> str:
+        return make_cache_key(
+            self.provider or self.__class__.__name__,
+            self.model_name,
+            system_prompt,
+            message,
+            self.generation_params(),
+        )
+
+    def forget(self, message: str, system_prompt: str = None) -> None:
+        """Drop a cached response, e.g. one that later failed validation."""
+        self.get_cache().delete(self.cache_key(message, system_prompt))
+
+    def chat(self, message: str, system_prompt: str = None,
+             use_cache: bool = True, usage=None, caller: str = "",
+             attempt: int = 1) -> str:
+        """Send a message and return the response text.
+
+        Args:
+            message: The user message.
+            system_prompt: Optional system instructions.
+            use_cache: Set to ``False`` to skip the response cache lookup and
+                always call the provider (the fresh response is still stored).
+            usage: Optional ``TokenUsage`` the call's token counts are added to.
+            caller: Name of the calling operation, e.g. ``"quiz.generate"``,
+                stored with the call's telemetry record.
+            attempt: 1 for a first call, higher for the caller's retries.
+        """
+        call = _Call(self, message, system_prompt, usage, caller, attempt)
+        if use_cache and call.hit(call.cache.get(call.key)):
+            return call.cached
+
+        call.requested()
+        try:
+            with get_call_limiter():
+                response = self.llm.invoke(call.messages)
+        except Exception as exc:
+            call.failed(exc)
+            raise
+        call.succeeded(response.content, response_usage(response))
+        call.cache.set(call.key, response.content)
+        return response.content
+
+    def stream_chat(self, message: str, system_prompt: str = None,
+                    use_cache: bool = True, usage=None, caller: str = "",
+                    attempt: int = 1):
+        """Send a message and yield the response text as it is generated.
+
+        A cached response is yielded as a single chunk. The full response is
+        cached once the stream has been consumed to the end. A call slot of
+        the limiter is held from the request until the stream ends or is
+        closed, as the provider call is in flight all that time.
+        """
+        call = _Call(self, message, system_prompt, usage, caller, attempt, streamed=True)
+        if use_cache and call.hit(call.cache.get(call.key)):
+            yield call.cached
+            return
+
+        call.requested()
+        limiter = get_call_limiter()
+        limiter.__enter__()
+        chunks = None
+        try:
+            chunks = self.llm.stream(call.messages)
+            for chunk in chunks:
+                text = call.add_chunk(chunk)
+                if text:
+                    yield text
+        except GeneratorExit:
+            call.cancelled()
+            raise
+        except Exception as exc:
+            call.failed(exc)
+            raise
+        finally:
+            getattr(chunks, "close", lambda: None)()
+            limiter.__exit__(None, None, None)
+
+        content = call.succeeded()
+        call.cache.set(call.key, content)
+
+    async def achat(self, message: str, system_prompt: str = None,
+                    use_cache: bool = True, usage=None, caller: str = "",
+                    attempt: int = 1) -> str:
+        """Coroutine version of :meth:`chat`."""
+        call = _Call(self, message, system_prompt, usage, caller, attempt)
+        if use_cache and call.hit(await self._cache_call(call.cache.get, call.key)):
+            return call.cached
+
+        call.requested()
+        try:
+            async with get_call_limiter():
+                response = await self.llm.ainvoke(call.messages)
+        except Exception as exc:
+            call.failed(exc)
+            raise
+        call.succeeded(response.content, response_usage(response))
+        await self._cache_call(call.cache.set, call.key, response.content)
+        return response.content
+
+    async def astream_chat(self, message: str, system_prompt: str = None,
+                           use_cache: bool = True, usage=None, caller: str = "",
+                           attempt: int = 1):
+        """Async generator version of :meth:`stream_chat`."""
+        call = _Call(self, message, system_prompt, usage, caller, attempt, streamed=True)
+        if use_cache and call.hit(await self._cache_call(call.cache.get, call.key)):
+            yield call.cached
+            return
+
+        call.requested()
+        limiter = get_call_limiter()
+        await limiter.__aenter__()
+        chunks = None
+        try:
+            chunks = self.llm.astream(call.messages)
+            async for chunk in chunks:
+                text = call.add_chunk(chunk)
+                if text:
+                    yield text
+        except GeneratorExit:
+            call.cancelled()
+            raise
+        except Exception as exc:
+            call.failed(exc)
+            raise
+        finally:
+            if hasattr(chunks, "aclose"):
+                await chunks.aclose()
+            await limiter.__aexit__(None, None, None)
+
+        content = call.succeeded()
+        await self._cache_call(call.cache.set, call.key, content)
+
+    def _record_call(self, caller: str, attempt: int, started: float, outcome: str,
+                     streamed: bool = False, tokens: tuple = None,
+                     error: Exception = None) -> None:
+        """Buffer the telemetry record of a call that began at ``started``."""
+        prompt_tokens, completion_tokens, estimated = tokens or (0, 0, False)
+        record_call(
+            provider=self.provider or self.__class__.__name__,
+            model=self.model_name[:100],
+            caller=caller[:100],
+            attempt=attempt,
+            outcome=outcome,
+            streamed=streamed,
+            latency_ms=(time.perf_counter() - started) * 1000,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            tokens_estimated=estimated,
+            error=f"{error.__class__.__name__}: {error}"[:255] if error else "",
+        )
+
+    @staticmethod
+    def _record_usage(usage, message: str, system_prompt: str, content: str,
+                      reported: tuple = None) -> tuple:
+        """Log the token usage of a provider call and add it to ``usage``.
+
+        Counts reported by the provider are used when available; otherwise
+        both sides are estimated locally.
+
+        Returns:
+            ``(prompt_tokens, completion_tokens, estimated)``.
+        """
+        if reported:
+            prompt_tokens, completion_tokens = reported
+        else:
+            prompt_tokens = count_tokens(message) + count_tokens(system_prompt or "")
+            completion_tokens = count_tokens(content)
+        logger.info(
+            f"[USAGE] prompt={prompt_tokens} completion={completion_tokens}"
+            f"{'' if reported else ' (estimated)'}"
+        )
+        if usage is not None:
+            usage.add(prompt_tokens, completion_tokens, estimated=not reported)
+        return prompt_tokens, completion_tokens, not reported
+
+    @staticmethod
+    async def _cache_call(method, *args):
+        """Call a cache method, off the event loop if the backend does I/O."""
+        if getattr(method.__self__, "blocking", True):
+            return await sync_to_async(method, thread_sensitive=False)(*args)
+        return method(*args)
+
+    @staticmethod
+    def _build_messages(message: str, system_prompt: str = None) -> list:
         messages = []
         if system_prompt:
             messages.append(SystemMessage(content=system_prompt))
         messages.append(HumanMessage(content=message))
+        return messages
+
+
+class _Call:
+    """Cache, logging, usage and telemetry bookkeeping of one call.
+
+    Shared by :meth:`BaseLLMService.chat`, ``stream_chat``, ``achat`` and
+    ``astream_chat``, which only differ in how they reach the provider.
+    """
+
+    def __init__(self, service: BaseLLMService, message: str, system_prompt: str,
+                 usage, caller: str, attempt: int, streamed: bool = False):
+        self.service = service
+        self.message = message
+        self.system_prompt = system_prompt
+        self.usage = usage
+        self.caller = caller
+        self.attempt = attempt
+        self.streamed = streamed
+        self.started = time.perf_counter()
+        self.cache = service.get_cache()
+        self.key = service.cache_key(message, system_prompt)
+        self.messages = service._build_messages(message, system_prompt)
+        self.cached = None
+        self._parts = []
+        self._reported = None
+
+    def hit(self, cached) -> bool:
+        """Record a cache hit if ``cached`` is a response; return whether it is."""
+        if cached is None:
+            return False
+        logger.info(f"[CACHE HIT] {self.message[:100]}...")
+        if self.usage is not None:
+            self.usage.add_cached()
+        self._record(CACHE_HIT)
+        self.cached = cached
+        return True
+
+    def requested(self) -> None:
+        label = "STREAM REQUEST" if self.streamed else "REQUEST"
+        logger.info(f"[{label}] {self.message[:100]}...")
+
+    def add_chunk(self, chunk) -> str:
+        """Keep a streamed chunk's text and token counts; return its text."""
+        self._reported = response_usage(chunk) or self._reported
+        text = chunk.content if isinstance(chunk.content, str) else ""
+        if text:
+            self._parts.append(text)
+        return text
+
+    def succeeded(self, content: str = None, reported: tuple = None) -> str:
+        """Record a completed call; a stream's content is its chunks joined."""
+        if content is None:
+            content, reported = "".join(self._parts), self._reported
+        label = "STREAM RESPONSE" if self.streamed else "RESPONSE"
+        logger.info(f"[{label}] {content[:200]}...")
+        tokens = self.service._record_usage(
+            self.usage, self.message, self.system_prompt, content, reported
+        )
+        self._record(SUCCESS, tokens=tokens)
+        return content
+
+    def failed(self, error: Exception) -> None:
+        self._record(FAILED, error=error)
 
-        logger.info(f"[REQUEST] {message[:100]}...")
-        response = self.llm.invoke(messages)
-        logger.info(f"[RESPONSE] {response.content[:200]}...")
+    def cancelled(self) -> None:
+        self._record(CANCELLED)
 
-        return response.content
\ No newline at end of file
+    def _record(self, outcome: str, **fields) -> None:
+        self.service._record_call(
+            self.caller, self.attempt, self.started, outcome, streamed=self.streamed, **fields
+        )
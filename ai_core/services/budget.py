@@ -0,0 +1,189 @@
+"""Prompt token budgeting: HTML stripping, compaction and usage accounting."""
+import re
+from dataclasses import asdict, dataclass
+from html import unescape
+from html.parser import HTMLParser
+
+from django.conf import settings
+
+from .chunking import TOKEN_RE, count_tokens
+
+DEFAULT_QUIZ_CONTENT_MAX_TOKENS = 3000
+DEFAULT_QUIZ_BATCH_MAX_TOKENS = 24000
+DEFAULT_QUIZ_BATCH_MAX_LESSONS = 10
+
+HTML_TAG_RE = re.compile(r"<[a-zA-Z/!][^>]*>")
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Tags whose content never belongs in a prompt
+SKIP_TAGS = frozenset(("script", "style", "head", "nav", "footer", "noscript", "svg"))
+BLOCK_TAGS = frozenset((
+    "p", "div", "section", "article", "header", "br", "hr", "pre", "blockquote",
+    "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "li", "table", "tr",
+    "thead", "tbody", "dl", "dt", "dd", "figcaption",
+))
+CELL_TAGS = frozenset(("td", "th"))
+
+
+def budget_settings() -> dict:
+    options = getattr(settings, "AI_TOKEN_BUDGET", {})
+    return {
+        "quiz_content_max_tokens": options.get(
+            "QUIZ_CONTENT_MAX_TOKENS", DEFAULT_QUIZ_CONTENT_MAX_TOKENS
+        ),
+        "quiz_batch_max_tokens": options.get(
+            "QUIZ_BATCH_MAX_TOKENS", DEFAULT_QUIZ_BATCH_MAX_TOKENS
+        ),
+        "quiz_batch_max_lessons": options.get(
+            "QUIZ_BATCH_MAX_LESSONS", DEFAULT_QUIZ_BATCH_MAX_LESSONS
+        ),
+    }
+
+
+class _TextExtractor(HTMLParser):
+    """Collect the visible text of an HTML fragment, one block per line."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skipping += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n- " if tag == "li" else "\n")
+        elif tag in CELL_TAGS:
+            self.parts.append(" | ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+
+def html_to_text(content: str) -> str:
+    """Return the visible text of ``content``; plain text is returned as is."""
+    if not HTML_TAG_RE.search(content):
+        return unescape(content)
+    parser = _TextExtractor()
+    parser.feed(content)
+    parser.close()
+    return "".join(parser.parts)
+
+
+def compact_text(text: str) -> str:
+    """Collapse whitespace and drop empty, decorative and repeated lines.
+
+    Lines are compared case-insensitively, so headers, footers and other
+    boilerplate repeated across the document are kept only once.
+    """
+    lines, seen = [], set()
+    for line in text.splitlines():
+        line = " ".join(line.split()).strip(" |")
+        if not any(ch.isalnum() for ch in line):
+            continue
+        key = line.casefold()
+        if key in seen:
+            continue
+        seen.add(key)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut ``text`` to at most ``max_tokens`` tokens.
+
+    Whole lines are kept while they fit; the line that overflows is cut at
+    its last complete sentence, or at the token limit if it has none.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    kept, used = [], 0
+    for line in text.splitlines():
+        tokens = count_tokens(line)
+        if used + tokens <= max_tokens:
+            kept.append(line)
+            used += tokens
+            continue
+
+        remaining = max_tokens - used
+        partial = []
+        for sentence in SENTENCE_END_RE.split(line):
+            sentence_tokens = count_tokens(sentence)
+            if sentence_tokens > remaining:
+                break
+            partial.append(sentence)
+            remaining -= sentence_tokens
+        if not partial and not kept and remaining > 0:
+            # A single giant line: cut it mid-sentence
+            match = list(TOKEN_RE.finditer(line))[remaining - 1]
+            partial.append(line[:match.end()])
+        if partial:
+            kept.append(" ".join(partial))
+        break
+    return "\n".join(kept)
+
+
+def fit_to_budget(content: str, max_tokens: int) -> str:
+    """Strip, compact and truncate ``content`` to ``max_tokens`` tokens."""
+    return truncate_to_tokens(compact_text(html_to_text(content)), max_tokens)
+
+
+@dataclass
+class TokenUsage:
+    """Token counts accumulated over one or more LLM calls.
+
+    ``estimated`` is set when a provider did not report usage and the
+    counts come from :func:`count_tokens` instead.
+    """
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    calls: int = 0
+    cached_calls: int = 0
+    estimated: bool = False
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, prompt_tokens: int, completion_tokens: int,
+            estimated: bool = False) -> None:
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.calls += 1
+        self.estimated = self.estimated or estimated
+
+    def add_cached(self) -> None:
+        self.cached_calls += 1
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "total_tokens": self.total_tokens}
+
+
+def response_usage(response) -> tuple:
+    """Return ``(prompt_tokens, completion_tokens)`` reported for ``response``.
+
+    Reads LangChain's ``usage_metadata`` and falls back to the
+    ``response_metadata`` shapes used by Gemini and OpenAI. Returns
+    ``None`` when the provider reported nothing.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+    metadata = getattr(response, "response_metadata", None) or {}
+    usage = metadata.get("usage_metadata")
+    if usage:
+        return usage.get("prompt_token_count", 0), usage.get("candidates_token_count", 0)
+    usage = metadata.get("token_usage")
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return None
@@ -0,0 +1,311 @@
+"""Content-addressed cache for LLM responses.
+
+Responses are keyed on everything that influences the completion: provider,
+model, system prompt, user message and generation parameters. Identical
+requests are then answered from the cache instead of a model round trip.
+
+The backend is selected with the ``AI_RESPONSE_CACHE`` setting::
+
+    AI_RESPONSE_CACHE = {
+        "BACKEND": "lru",       # "lru", "django", "sqlite" or "dummy"
+        "TTL": 86400,           # seconds, 0 disables expiry
+        "MAX_ENTRIES": 512,
+        "LOCATION": "",         # cache alias ("django") or file path ("sqlite")
+    }
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger("ai_core")
+
+DEFAULT_TTL = 60 * 60 * 24
+DEFAULT_MAX_ENTRIES = 512
+KEY_PREFIX = "ai_core:llm:"
+
+
+def make_cache_key(provider: str, model: str, system_prompt: str, message: str,
+                   params: dict = None) -> str:
+    """Return a stable hash identifying a single completion request."""
+    payload = json.dumps(
+        {
+            "provider": provider,
+            "model": model,
+            "system": system_prompt or "",
+            "message": message,
+            "params": params or {},
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class BaseResponseCache:
+    """Common interface and hit/miss accounting for cache backends."""
+
+    # Whether lookups do I/O; async callers run blocking backends in a thread.
+    blocking = True
+
+    def __init__(self, ttl: int = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str):
+        """Return the cached response for ``key`` or ``None``."""
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self._set(key, value)
+
+    def delete(self, key: str) -> None:
+        self._delete(key)
+
+    def clear(self) -> None:
+        self._clear()
+        with self._stats_lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.__class__.__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _expires_at(self):
+        return time.time() + self.ttl if self.ttl else None
+
+    # -- Backend hooks ------------------------------------------------------
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value):
+        raise NotImplementedError
+
+    def _delete(self, key):
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+
+class DummyResponseCache(BaseResponseCache):
+    """Cache that never stores anything."""
+
+    blocking = False
+
+    def _get(self, key):
+        return None
+
+    def _set(self, key, value):
+        pass
+
+    def _delete(self, key):
+        pass
+
+    def _clear(self):
+        pass
+
+
+class LRUResponseCache(BaseResponseCache):
+    """In-process least-recently-used cache with per-entry expiry."""
+
+    blocking = False
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, self._expires_at())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def _delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoResponseCache(BaseResponseCache):
+    """Store responses in one of the project's configured Django caches.
+
+    Size-based eviction is left to the Django backend (its own
+    ``MAX_ENTRIES`` option).
+    """
+
+    def __init__(self, location: str = "", **kwargs):
+        super().__init__(**kwargs)
+        from django.core.cache import caches
+
+        self.cache = caches[location or "default"]
+
+    def _get(self, key):
+        return self.cache.get(KEY_PREFIX + key)
+
+    def _set(self, key, value):
+        self.cache.set(KEY_PREFIX + key, value, timeout=self.ttl or None)
+
+    def _delete(self, key):
+        self.cache.delete(KEY_PREFIX + key)
+
+    def _clear(self):
+        # Only our own keys can be removed reliably across backends, and
+        # they are not enumerable, so clearing means clearing the cache.
+        self.cache.clear()
+
+
+class SQLiteResponseCache(BaseResponseCache):
+    """Persist responses in a standalone SQLite file shared by all workers."""
+
+    def __init__(self, location: str = "", **kwargs):
+        super().__init__(**kwargs)
+        self.location = location or str(settings.BASE_DIR) + "/ai_cache.sqlite3"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.location, check_same_thread=False, timeout=10
+        )
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_response ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS llm_response_accessed "
+                "ON llm_response (accessed_at)"
+            )
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_response WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM llm_response WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE llm_response SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            return value
+
+    def _set(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_response "
+                "(key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, self._expires_at(), time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM llm_response WHERE key IN ("
+                "SELECT key FROM llm_response ORDER BY accessed_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def _delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_response WHERE key = ?", (key,))
+
+    def _clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_response")
+
+
+BACKENDS = {
+    "lru": LRUResponseCache,
+    "django": DjangoResponseCache,
+    "sqlite": SQLiteResponseCache,
+    "dummy": DummyResponseCache,
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def build_response_cache(options: dict = None) -> BaseResponseCache:
+    """Build a cache backend from an ``AI_RESPONSE_CACHE``-style dict."""
+    options = options or {}
+    backend = options.get("BACKEND", "lru")
+    try:
+        cache_class = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown AI response cache backend: {backend}") from None
+
+    kwargs = {
+        "ttl": options.get("TTL", DEFAULT_TTL),
+        "max_entries": options.get("MAX_ENTRIES", DEFAULT_MAX_ENTRIES),
+    }
+    if cache_class in (DjangoResponseCache, SQLiteResponseCache):
+        kwargs["location"] = options.get("LOCATION", "")
+    return cache_class(**kwargs)
+
+
+def get_response_cache() -> BaseResponseCache:
+    """Return the process-wide response cache configured in settings."""
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = build_response_cache(
+                    getattr(settings, "AI_RESPONSE_CACHE", None)
+                )
+                logger.info(f"AI response cache: {_cache.__class__.__name__}")
+    return _cache
+
+
+def reset_response_cache() -> None:
+    """Forget the process-wide cache so the next call rebuilds it from settings."""
+    global _cache
+
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,76 @@
+"""Token-bounded, overlapping text chunking."""
+import re
+from collections import deque
+from dataclasses import dataclass
+
+DEFAULT_MAX_TOKENS = 800
+DEFAULT_OVERLAP_TOKENS = 100
+
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate the token count of ``text``.
+
+    Counts words and punctuation marks, which tracks subword tokenizers
+    closely enough for budgeting without depending on one.
+    """
+    return len(TOKEN_RE.findall(text))
+
+
+@dataclass
+class Chunk:
+    index: int
+    text: str
+    token_count: int
+    page_start: int
+    page_end: int
+
+
+def chunk_pages(pages, max_tokens: int = DEFAULT_MAX_TOKENS,
+                overlap_tokens: int = DEFAULT_OVERLAP_TOKENS):
+    """Split ``(page_number, text)`` pairs into overlapping chunks.
+
+    Consumes ``pages`` lazily and only ever holds one chunk's worth of
+    words, so memory use does not depend on document length.
+
+    Yields:
+        ``Chunk`` objects of at most ``max_tokens`` tokens (a single word
+        longer than that becomes its own chunk). Consecutive chunks share
+        about ``overlap_tokens`` tokens of text.
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+
+    window = deque()  # (word, tokens, page)
+    window_tokens = 0
+    index = 0
+
+    def emit():
+        return Chunk(
+            index=index,
+            text=" ".join(word for word, _, _ in window),
+            token_count=window_tokens,
+            page_start=window[0][2],
+            page_end=window[-1][2],
+        )
+
+    for page, text in pages:
+        for word in text.split():
+            tokens = count_tokens(word) or 1
+            if window and window_tokens + tokens > max_tokens:
+                yield emit()
+                index += 1
+                # Keep the tail of the chunk as the start of the next one.
+                tail, tail_tokens = deque(), 0
+                for item in reversed(window):
+                    if tail_tokens + item[1] > overlap_tokens:
+                        break
+                    tail.appendleft(item)
+                    tail_tokens += item[1]
+                window, window_tokens = tail, tail_tokens
+            window.append((word, tokens, page))
+            window_tokens += tokens
+
+    if window:
+        yield emit()
@@ -0,0 +1,187 @@
+"""Uploaded document processing service."""
+import logging
+import os
+import time
+
+from django.conf import settings
+
+from ai_core.models import DocumentChunk
+from .base import BaseLLMService
+from .chunking import DEFAULT_MAX_TOKENS, DEFAULT_OVERLAP_TOKENS, chunk_pages
+from .embeddings import get_embedder
+from .extraction import UnsupportedDocumentError, get_extractor
+from .lesson import LessonService
+from .retrieval import VectorIndex, top_k
+
+logger = logging.getLogger("ai_core")
+
+DEFAULT_CONTEXT_MAX_TOKENS = 6000
+STORE_BATCH_SIZE = 200
+
+
+def chunking_settings() -> dict:
+    options = getattr(settings, "AI_CHUNKING", {})
+    return {
+        "max_tokens": options.get("MAX_TOKENS", DEFAULT_MAX_TOKENS),
+        "overlap_tokens": options.get("OVERLAP_TOKENS", DEFAULT_OVERLAP_TOKENS),
+        "context_max_tokens": options.get("CONTEXT_MAX_TOKENS", DEFAULT_CONTEXT_MAX_TOKENS),
+    }
+
+
+class DocumentService:
+    """Turn an uploaded ``AIGeneration`` document into an HTML lesson."""
+
+    def __init__(self, llm_service: BaseLLMService):
+        self.llm_service = llm_service
+
+    def process(self, generation) -> str:
+        """Generate the lesson HTML for ``generation`` and return it."""
+        topic = generation.topic or self.topic_from_filename(generation.document_file.name)
+
+        try:
+            self.ingest(generation)
+        except UnsupportedDocumentError as exc:
+            logger.warning(f"AIGeneration #{generation.pk}: {exc}")
+
+        parts = []
+        if generation.prompt:
+            parts.append(f"Upload settings: {generation.prompt}")
+        text = self.build_context(generation, query=f"{topic} {generation.prompt or ''}")
+        if text:
+            parts.append(text)
+
+        context = "\n\n".join(parts) or None
+        return LessonService(self.llm_service).generate(topic, context)
+
+    def ingest(self, generation) -> dict:
+        """Extract, chunk and store the document text as ``DocumentChunk`` rows.
+
+        Pages stream from the extractor through the chunker into batched
+        inserts, so memory stays bounded for any document size. Timings and
+        byte counts per stage are saved on ``generation.pipeline_stats``.
+
+        Raises:
+            UnsupportedDocumentError: If the file type cannot be extracted.
+        """
+        document = generation.document_file
+        extractor = get_extractor(document.name)
+        options = chunking_settings()
+        stats = {
+            "extract": {"seconds": 0.0, "bytes_in": document.size, "pages": 0, "chars": 0},
+            "chunk": {"seconds": 0.0, "chunks": 0, "tokens": 0},
+            "store": {"seconds": 0.0, "rows": 0, "bytes": 0},
+            "index": {"seconds": 0.0, "rows": 0},
+        }
+
+        DocumentChunk.objects.filter(generation=generation).delete()
+
+        with document.open("rb") as fh:
+            pages = self._timed_pages(extractor(fh), stats["extract"])
+            chunks = chunk_pages(pages, options["max_tokens"], options["overlap_tokens"])
+            batch = []
+            while True:
+                started = time.perf_counter()
+                extract_before = stats["extract"]["seconds"]
+                chunk = next(chunks, None)
+                # Time spent pulling pages is extraction, not chunking.
+                stats["chunk"]["seconds"] += (
+                    time.perf_counter() - started
+                    - (stats["extract"]["seconds"] - extract_before)
+                )
+                if chunk is None:
+                    break
+
+                stats["chunk"]["chunks"] += 1
+                stats["chunk"]["tokens"] += chunk.token_count
+                batch.append(
+                    DocumentChunk(
+                        generation=generation,
+                        index=chunk.index,
+                        text=chunk.text,
+                        token_count=chunk.token_count,
+                        page_start=chunk.page_start,
+                        page_end=chunk.page_end,
+                    )
+                )
+                if len(batch) >= STORE_BATCH_SIZE:
+                    self._store(batch, stats["store"])
+                    batch = []
+            self._store(batch, stats["store"])
+
+        if generation.course_id:
+            started = time.perf_counter()
+            VectorIndex.for_course(generation.course_id).add_generation(
+                generation.pk, generation.chunks.values_list("pk", "text").iterator()
+            )
+            stats["index"]["seconds"] = time.perf_counter() - started
+            stats["index"]["rows"] = stats["store"]["rows"]
+
+        for stage in stats.values():
+            stage["seconds"] = round(stage["seconds"], 4)
+        generation.pipeline_stats = stats
+        generation.save(update_fields=["pipeline_stats", "updated_at"])
+        logger.info(
+            f"AIGeneration #{generation.pk}: {stats['extract']['pages']} page(s) -> "
+            f"{stats['chunk']['chunks']} chunk(s)"
+        )
+        return stats
+
+    def build_context(self, generation, query: str = None) -> str:
+        """Return the document text to send as lesson context.
+
+        When the whole document fits in the context budget it is sent as is.
+        Otherwise, with a ``query``, the chunks most similar to it are
+        chosen (kept in document order); without one the document is cut at
+        the budget.
+        """
+        budget = chunking_settings()["context_max_tokens"]
+        rows = list(generation.chunks.values_list("text", "token_count"))
+
+        selected = range(len(rows))
+        if query and sum(tokens for _, tokens in rows) > budget:
+            embedder = get_embedder()
+            ranked, _ = top_k(
+                embedder.embed([text for text, _ in rows]),
+                embedder.embed_query(query),
+                len(rows),
+            )
+            selected = ranked
+
+        chosen, used = [], 0
+        for i in selected:
+            if used + rows[i][1] > budget:
+                continue
+            chosen.append(i)
+            used += rows[i][1]
+        return "\n\n".join(rows[i][0] for i in sorted(chosen))
+
+    # -- Private helpers --------------------------------------------------
+
+    @staticmethod
+    def topic_from_filename(name: str) -> str:
+        stem = os.path.splitext(os.path.basename(name or ""))[0]
+        return stem.replace("_", " ").replace("-", " ").strip() or "Uploaded document"
+
+    @staticmethod
+    def _timed_pages(pages, stats: dict):
+        """Yield from ``pages`` while accumulating extraction time and sizes."""
+        pages = iter(pages)
+        while True:
+            started = time.perf_counter()
+            page = next(pages, None)
+            stats["seconds"] += time.perf_counter() - started
+            if page is None:
+                return
+            stats["pages"] += 1
+            stats["chars"] += len(page[1])
+            yield page
+
+    @staticmethod
+    def _store(batch: list, stats: dict) -> None:
+        if not batch:
+            return
+        started = time.perf_counter()
+        DocumentChunk.objects.bulk_create(batch)
+        stats["seconds"] += time.perf_counter() - started
+        stats["rows"] += len(batch)
+        stats["bytes"] += sum(len(chunk.text.encode("utf-8")) for chunk in batch)
@@ -0,0 +1,124 @@
+"""Text embedders used by the local vector index.
+
+An embedder turns a list of texts into an ``(n, dimension)`` float32 matrix
+of L2-normalised rows, so a dot product between rows is their cosine
+similarity. ``HashingEmbedder`` works fully offline; ``LangChainEmbedder``
+adapts any LangChain ``Embeddings`` object (e.g. a hosted model).
+"""
+import hashlib
+import math
+import re
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_EMBEDDER = "ai_core.services.embeddings.HashingEmbedder"
+
+WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+# Frequent English function words carry no topical signal.
+STOP_WORDS = frozenset(
+    "a an and are as at be been but by can for from has have in into is it its "
+    "of on or that the their there these this to was were which will with".split()
+)
+
+
+class BaseEmbedder:
+    """Interface shared by all embedders."""
+
+    dimension = None
+
+    @property
+    def name(self) -> str:
+        """Identifies the vector space; indexes built by another embedder are rebuilt."""
+        return f"{self.__class__.__name__}:{self.dimension}"
+
+    def embed(self, texts: list) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+    @staticmethod
+    def normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (matrix / norms).astype(np.float32, copy=False)
+
+
+class HashingEmbedder(BaseEmbedder):
+    """Deterministic bag-of-words embedder using the hashing trick.
+
+    Words (and adjacent word pairs) are hashed into ``dimension`` signed
+    buckets with sublinear term-frequency weights. Identical text always
+    produces identical vectors, across processes and machines.
+    """
+
+    def __init__(self, dimension: int = 1024):
+        self.dimension = dimension
+
+    def embed(self, texts: list) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            words = [
+                w for w in WORD_RE.findall(text.lower()) if w not in STOP_WORDS
+            ]
+            features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            for feature in features:
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                bucket = value % self.dimension
+                sign = 1.0 if value >> 63 else -1.0
+                counts[bucket] = counts.get(bucket, 0.0) + sign
+            for bucket, count in counts.items():
+                if count:
+                    matrix[row, bucket] = math.copysign(1.0 + math.log(abs(count)), count)
+        return self.normalize(matrix)
+
+
+class LangChainEmbedder(BaseEmbedder):
+    """Adapter for LangChain ``Embeddings`` implementations."""
+
+    def __init__(self, embeddings, dimension: int):
+        self.embeddings = embeddings
+        self.dimension = dimension
+
+    @property
+    def name(self) -> str:
+        model = getattr(self.embeddings, "model", self.embeddings.__class__.__name__)
+        return f"{model}:{self.dimension}"
+
+    def embed(self, texts: list) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return self.normalize(np.asarray(self.embeddings.embed_documents(texts)))
+
+    def embed_query(self, text: str) -> np.ndarray:
+        vector = np.asarray([self.embeddings.embed_query(text)])
+        return self.normalize(vector)[0]
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> BaseEmbedder:
+    """Return the process-wide embedder named by ``AI_RETRIEVAL["EMBEDDER"]``."""
+    global _embedder
+
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                options = getattr(settings, "AI_RETRIEVAL", {})
+                _embedder = import_string(options.get("EMBEDDER", DEFAULT_EMBEDDER))()
+    return _embedder
+
+
+def reset_embedder() -> None:
+    global _embedder
+
+    with _embedder_lock:
+        _embedder = None
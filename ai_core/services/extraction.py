@@ -0,0 +1,116 @@
+"""Text extraction for uploaded documents.
+
+Each extractor yields ``(page_number, text)`` pairs one page (or slide, or
+block) at a time, so the whole document never has to sit in memory.
+"""
+import codecs
+import os
+import re
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DRAWING_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+
+TEXT_BLOCK_SIZE = 64 * 1024
+# Word documents have no stored page numbers; paragraphs are grouped into
+# blocks of roughly this many characters unless an explicit break comes first.
+DOCX_BLOCK_CHARS = 4000
+
+
+class UnsupportedDocumentError(ValueError):
+    """Raised for file types no extractor can handle."""
+
+
+def extract_pdf(fh):
+    from pypdf import PdfReader
+
+    reader = PdfReader(fh)
+    for number, page in enumerate(reader.pages, start=1):
+        yield number, page.extract_text() or ""
+
+
+def extract_docx(fh):
+    with zipfile.ZipFile(fh) as archive, archive.open("word/document.xml") as xml:
+        page, block, size = 1, [], 0
+        for _, elem in iterparse(xml, events=("end",)):
+            if elem.tag == WORD_NS + "br" and elem.get(WORD_NS + "type") == "page":
+                if block:
+                    yield page, "\n".join(block)
+                    page, block, size = page + 1, [], 0
+            elif elem.tag == WORD_NS + "p":
+                text = "".join(t.text or "" for t in elem.iter(WORD_NS + "t"))
+                if text:
+                    block.append(text)
+                    size += len(text)
+                # Free the finished paragraph; the tree would otherwise grow
+                # to the size of the whole document.
+                elem.clear()
+                if size >= DOCX_BLOCK_CHARS:
+                    yield page, "\n".join(block)
+                    page, block, size = page + 1, [], 0
+        if block:
+            yield page, "\n".join(block)
+
+
+def extract_pptx(fh):
+    with zipfile.ZipFile(fh) as archive:
+        slides = [
+            name for name in archive.namelist()
+            if re.fullmatch(r"ppt/slides/slide\d+\.xml", name)
+        ]
+        slides.sort(key=lambda name: int(re.search(r"(\d+)\.xml$", name).group(1)))
+        for number, name in enumerate(slides, start=1):
+            with archive.open(name) as xml:
+                lines = []
+                for _, elem in iterparse(xml, events=("end",)):
+                    if elem.tag == DRAWING_NS + "p":
+                        text = "".join(t.text or "" for t in elem.iter(DRAWING_NS + "t"))
+                        if text:
+                            lines.append(text)
+                        elem.clear()
+            yield number, "\n".join(lines)
+
+
+def extract_text(fh):
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    number, pending = 1, ""
+    while True:
+        data = fh.read(TEXT_BLOCK_SIZE)
+        pending += decoder.decode(data, final=not data)
+        if not data:
+            break
+        # Cut at the last line break so words are never split across blocks.
+        cut = pending.rfind("\n")
+        if cut != -1:
+            yield number, pending[:cut]
+            number, pending = number + 1, pending[cut + 1:]
+    if pending:
+        yield number, pending
+
+
+EXTRACTORS = {
+    ".pdf": extract_pdf,
+    ".docx": extract_docx,
+    ".pptx": extract_pptx,
+    ".txt": extract_text,
+    ".md": extract_text,
+    ".csv": extract_text,
+    ".html": extract_text,
+    ".htm": extract_text,
+}
+
+
+def get_extractor(name: str):
+    """Return the extractor for a file name, based on its extension.
+
+    Raises:
+        UnsupportedDocumentError: If the extension is not supported.
+    """
+    extension = os.path.splitext(name or "")[1].lower()
+    try:
+        return EXTRACTORS[extension]
+    except KeyError:
+        raise UnsupportedDocumentError(
+            f"Unsupported document type: {extension or name}"
+        ) from None
@@ -0,0 +1,238 @@
+"""Offline, deterministic LLM provider for tests and benchmarks.
+
+``FakeLLMService`` answers lesson, quiz and batched quiz prompts with
+well-formed content of the expected shape, while simulating provider
+latency, generation speed, failures and malformed JSON. Every random
+decision is seeded from the prompt (and how often it has been seen), so a
+run is reproducible regardless of thread scheduling.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from .base import BaseLLMService
+from .chunking import count_tokens
+
+DEFAULTS = {
+    # Seconds before the first token
+    "LATENCY": 0.05,
+    # Generated tokens per second; 0 means the whole answer arrives at once
+    "TOKEN_RATE": 0,
+    # Share of calls that raise FakeProviderError
+    "FAILURE_RATE": 0.0,
+    # Share of JSON answers that are mangled (see MALFORMATIONS)
+    "MALFORMED_RATE": 0.0,
+    # Paragraphs per generated lesson
+    "LESSON_PARAGRAPHS": 6,
+    "SEED": 0,
+}
+
+# Ways a JSON answer is mangled. The first two are recoverable by
+# QuizService._parse_response, the others are not.
+MALFORMATIONS = ("fenced", "prose", "truncated", "trailing_comma")
+
+WORDS = (
+    "algorithm analysis structure memory process network system model theory "
+    "function variable value method result example concept principle data "
+    "design pattern interface module layer protocol state event order graph"
+).split()
+
+LESSON_ID_RE = re.compile(r"=== LESSON (L\d+) ===")
+NUM_QUESTIONS_RE = re.compile(r"create exactly (\d+)")
+TOPIC_RE = re.compile(r"topic: (.+)")
+
+
+class FakeProviderError(ConnectionError):
+    """Simulated provider outage."""
+
+
+def fake_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "AI_FAKE_LLM", {})}
+
+
+class FakeChatModel:
+    """Stand-in for a LangChain chat model that never leaves the process."""
+
+    model = "fake-1"
+
+    def __init__(self, latency: float, token_rate: float, failure_rate: float,
+                 malformed_rate: float, lesson_paragraphs: int, seed: int):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.lesson_paragraphs = lesson_paragraphs
+        self.seed = seed
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def invoke(self, messages):
+        content, delay = self._answer(messages)
+        time.sleep(delay)
+        return self._message(AIMessage, messages, self._raise_if_failed(content))
+
+    async def ainvoke(self, messages):
+        content, delay = self._answer(messages)
+        await asyncio.sleep(delay)
+        return self._message(AIMessage, messages, self._raise_if_failed(content))
+
+    def stream(self, messages):
+        content, _ = self._answer(messages)
+        time.sleep(self.latency)
+        self._raise_if_failed(content)
+        for piece, delay in self._pieces(content):
+            time.sleep(delay)
+            yield AIMessageChunk(content=piece)
+        # Like real providers, usage for the whole answer comes last
+        yield self._message(AIMessageChunk, messages, "", usage_of=content)
+
+    async def astream(self, messages):
+        content, _ = self._answer(messages)
+        await asyncio.sleep(self.latency)
+        self._raise_if_failed(content)
+        for piece, delay in self._pieces(content):
+            await asyncio.sleep(delay)
+            yield AIMessageChunk(content=piece)
+        yield self._message(AIMessageChunk, messages, "", usage_of=content)
+
+    # -- Private helpers --------------------------------------------------
+
+    def _answer(self, messages) -> tuple:
+        """Return ``(content, delay)`` for a call; content is ``None`` for a failure."""
+        prompt = messages[-1].content
+        system = messages[0].content if len(messages) > 1 else ""
+        rng = self._rng(system + prompt)
+
+        if rng.random() < self.failure_rate:
+            return None, self.latency
+
+        if LESSON_ID_RE.search(prompt):
+            content = json.dumps({
+                key: self._questions(rng, self._num_questions(prompt), key)
+                for key in LESSON_ID_RE.findall(prompt)
+            })
+        elif "multiple-choice" in system:
+            content = json.dumps(self._questions(rng, self._num_questions(prompt)))
+        else:
+            content = self._lesson(rng, prompt)
+
+        if content[:1] in "[{" and rng.random() < self.malformed_rate:
+            content = self._malform(rng, content)
+        return content, self.latency + self._generation_time(content)
+
+    @staticmethod
+    def _raise_if_failed(content: str) -> str:
+        if content is None:
+            raise FakeProviderError("Simulated provider failure")
+        return content
+
+    def _rng(self, prompt: str) -> random.Random:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            seen = self._seen[digest] = self._seen.get(digest, 0) + 1
+        return random.Random(f"{self.seed}:{digest}:{seen}")
+
+    def _generation_time(self, content: str) -> float:
+        return count_tokens(content) / self.token_rate if self.token_rate else 0.0
+
+    def _pieces(self, content: str):
+        """Split ``content`` into streamed pieces with their delays."""
+        pieces = re.findall(r"\S+\s*|\s+", content)
+        for piece in pieces:
+            yield piece, self._generation_time(piece)
+
+    @staticmethod
+    def _message(message_class, messages, content: str, usage_of: str = None):
+        prompt_tokens = sum(count_tokens(message.content) for message in messages)
+        completion_tokens = count_tokens(content if usage_of is None else usage_of)
+        return message_class(
+            content=content,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        )
+
+    @staticmethod
+    def _num_questions(prompt: str) -> int:
+        match = NUM_QUESTIONS_RE.search(prompt)
+        return int(match.group(1)) if match else 5
+
+    @staticmethod
+    def _sentence(rng: random.Random, words: int) -> str:
+        text = " ".join(rng.choice(WORDS) for _ in range(words))
+        return text[0].upper() + text[1:] + "."
+
+    def _questions(self, rng: random.Random, count: int, prefix: str = "") -> list:
+        return [
+            {
+                "q": f"{prefix} {self._sentence(rng, 8)[:-1]}?".strip(),
+                "options": [self._sentence(rng, 3) for _ in range(4)],
+                "correct": rng.randrange(4),
+                "explain": self._sentence(rng, 10),
+            }
+            for _ in range(count)
+        ]
+
+    def _lesson(self, rng: random.Random, prompt: str) -> str:
+        match = TOPIC_RE.search(prompt)
+        topic = match.group(1).strip() if match else "Lesson"
+        parts = [f"<h2>{topic}</h2>"]
+        for i in range(self.lesson_paragraphs):
+            if i % 3 == 2:
+                items = "".join(f"<li>{self._sentence(rng, 6)}</li>" for _ in range(3))
+                parts.append(f"<ul>{items}</ul>")
+            else:
+                sentences = " ".join(self._sentence(rng, 12) for _ in range(4))
+                parts.append(f"<p>{sentences}</p>")
+        return "\n".join(parts)
+
+    @staticmethod
+    def _malform(rng: random.Random, content: str) -> str:
+        kind = rng.choice(MALFORMATIONS)
+        if kind == "fenced":
+            return f"```json\n{content}\n```"
+        if kind == "prose":
+            return f"Here are the questions you asked for:\n{content}\nGood luck!"
+        if kind == "truncated":
+            return content[: len(content) // 2]
+        return content[:-1] + ",]" if content.endswith("]") else content[:-1] + ",}"
+
+
+class FakeLLMService(BaseLLMService):
+    """Offline provider whose behaviour is set by ``AI_FAKE_LLM`` or keyword args.
+
+    Args:
+        latency: Seconds before the first token.
+        token_rate: Generated tokens per second (0 for instant answers).
+        failure_rate: Share of calls that raise ``FakeProviderError``.
+        malformed_rate: Share of JSON answers that are mangled.
+        lesson_paragraphs: Paragraphs per generated lesson.
+        seed: Seed mixed into every random decision.
+    """
+
+    provider = "fake"
+
+    def __init__(self, **options):
+        merged = fake_settings()
+        merged.update({key.upper(): value for key, value in options.items()})
+        self.options = merged
+        super().__init__()
+
+    def _build_llm(self):
+        return FakeChatModel(
+            latency=self.options["LATENCY"],
+            token_rate=self.options["TOKEN_RATE"],
+            failure_rate=self.options["FAILURE_RATE"],
+            malformed_rate=self.options["MALFORMED_RATE"],
+            lesson_paragraphs=self.options["LESSON_PARAGRAPHS"],
+            seed=self.options["SEED"],
+        )
@@ -7,8 +7,21 @@ from .base import BaseLLMService
 class GeminiService(BaseLLMService):
     """Google Gemini provider."""
 
+    provider = "gemini"
+    model = "gemini-2.5-flash"
+
     def _build_llm(self):
         return ChatGoogleGenerativeAI(
             google_api_key=config("GOOGLE_API_KEY"),
-            model="gemini-2.5-flash",
-        )
\ No newline at end of file
+            model=self.model,
+            # Ends a hung request in the client instead of leaving its thread
+            # stuck after the resilient layer gave up on it
+            timeout=config("AI_PROVIDER_TIMEOUT", default=60, cast=int),
+        )
+
+
+class GeminiLiteService(GeminiService):
+    """Smaller Gemini model, used as the failover backend."""
+
+    provider = "gemini-lite"
+    model = "gemini-2.5-flash-lite"
\ No newline at end of file
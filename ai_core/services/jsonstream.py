@@ -0,0 +1,86 @@
+"""Incremental parser for a JSON array arriving in fragments."""
+import json
+import logging
+
+logger = logging.getLogger("ai_core")
+
+
+class JSONArrayStreamParser:
+    """Pull complete elements out of a streamed top-level JSON array.
+
+    Text before the opening ``[`` (prose, a markdown fence) is skipped, and
+    everything after the closing ``]`` is ignored. Each element is decoded
+    as soon as its closing bracket arrives, so callers see items while the
+    rest of the array is still being generated. Elements that fail to
+    decode are skipped and described in ``errors``.
+
+    Example::
+
+        parser = JSONArrayStreamParser()
+        for fragment in fragments:
+            for item in parser.feed(fragment):
+                ...
+    """
+
+    def __init__(self):
+        self.started = False
+        self.done = False
+        self.errors = []
+        self.elements = 0
+        self._depth = 0  # nesting inside the top-level array
+        self._in_string = False
+        self._escaped = False
+        self._element = []  # text of the element being read
+
+    def feed(self, text: str) -> list:
+        """Consume ``text`` and return the elements it completed."""
+        items = []
+        start = 0
+        for i, char in enumerate(text):
+            if self.done:
+                break
+            if not self.started:
+                if char == "[":
+                    self.started = True
+                    start = i + 1
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "[{":
+                if self._depth == 0:
+                    # An element starts; drop separators read so far
+                    self._element, start = [], i
+                self._depth += 1
+            elif char in "]}":
+                if self._depth == 0:
+                    if char == "]":
+                        self.done = True
+                    continue
+                self._depth -= 1
+                if self._depth == 0:
+                    self._element.append(text[start:i + 1])
+                    self._decode("".join(self._element), items)
+                    self._element = []
+                    start = i + 1
+
+        if self.started and self._depth > 0 and not self.done:
+            self._element.append(text[start:])
+        return items
+
+    def _decode(self, raw: str, items: list) -> None:
+        self.elements += 1
+        try:
+            items.append(json.loads(raw))
+        except json.JSONDecodeError as exc:
+            self.errors.append(f"Element {self.elements}: {exc}")
+            logger.warning(f"Skipping undecodable streamed element: {exc}")
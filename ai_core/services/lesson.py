@@ -1,5 +1,6 @@
 """Lesson generation service."""
 import logging
+from asgiref.sync import sync_to_async
 from .base import BaseLLMService
 
 logger = logging.getLogger("ai_core")
@@ -17,16 +18,69 @@ LESSON_SYSTEM_PROMPT = (
 class LessonService:
     """Generate lesson content using a given LLM provider."""
 
-    def __init__(self, llm_service: BaseLLMService):
+    def __init__(self, llm_service: BaseLLMService, retriever=None):
         self.llm_service = llm_service
+        # Optional ``Retriever``; supplies context when none is passed in
+        self.retriever = retriever
 
-    def generate(self, topic: str, context: str = None) -> str:
+    def generate(self, topic: str, context: str = None, use_cache: bool = True) -> str:
         """Generate an HTML lesson for the given topic.
 
         Args:
             topic: The lesson topic.
-            context: Additional context from RAG chunks (optional, for future use).
+            context: Reference material for the lesson. When omitted and the
+                service has a retriever, the chunks most relevant to the
+                topic are used.
+            use_cache: Set to ``False`` to bypass the LLM response cache.
         """
+        return self.llm_service.chat(
+            self._build_message(topic, self._resolve_context(topic, context)),
+            system_prompt=LESSON_SYSTEM_PROMPT,
+            use_cache=use_cache,
+            caller="lesson.generate",
+        )
+
+    def stream(self, topic: str, context: str = None, use_cache: bool = True):
+        """Yield HTML fragments of the lesson as the model produces them."""
+        yield from self.llm_service.stream_chat(
+            self._build_message(topic, self._resolve_context(topic, context)),
+            system_prompt=LESSON_SYSTEM_PROMPT,
+            use_cache=use_cache,
+            caller="lesson.stream",
+        )
+
+    async def agenerate(self, topic: str, context: str = None,
+                        use_cache: bool = True) -> str:
+        """Coroutine version of :meth:`generate`."""
+        context = await sync_to_async(self._resolve_context)(topic, context)
+        return await self.llm_service.achat(
+            self._build_message(topic, context),
+            system_prompt=LESSON_SYSTEM_PROMPT,
+            use_cache=use_cache,
+            caller="lesson.generate",
+        )
+
+    async def astream(self, topic: str, context: str = None, use_cache: bool = True):
+        """Async generator version of :meth:`stream`."""
+        context = await sync_to_async(self._resolve_context)(topic, context)
+        async for fragment in self.llm_service.astream_chat(
+            self._build_message(topic, context),
+            system_prompt=LESSON_SYSTEM_PROMPT,
+            use_cache=use_cache,
+            caller="lesson.stream",
+        ):
+            yield fragment
+
+    # -- Private helpers --------------------------------------------------
+
+    def _resolve_context(self, topic: str, context: str = None) -> str:
+        if context is None and self.retriever is not None:
+            return self.retriever.context_for(topic) or None
+        return context
+
+    @staticmethod
+    def _build_message(topic: str, context: str = None) -> str:
+        """Build the user message sent to the LLM."""
         message = f"Create a detailed lesson on the topic: {topic}"
 
         if context:
@@ -36,4 +90,4 @@ class LessonService:
                 f"{context}"
             )
 
-        return self.llm_service.chat(message, system_prompt=LESSON_SYSTEM_PROMPT)
\ No newline at end of file
+        return message
@@ -0,0 +1,87 @@
+"""Process-wide cap on in-flight LLM provider calls.
+
+One semaphore is shared by synchronous callers (threads) and coroutines on
+any event loop, so the limit holds no matter how a request is served.
+Coroutines never wait in a thread: they queue on an ``asyncio.Semaphore`` of
+their event loop, then take a process-wide slot without blocking, polling
+with a short backoff while threads or other loops hold them all.
+"""
+import asyncio
+import threading
+import weakref
+
+from django.conf import settings
+
+DEFAULT_MAX_CONCURRENT_CALLS = 8
+
+# Bounds of the wait between two tries of a coroutine for a process-wide slot
+POLL_MIN_SECONDS = 0.001
+POLL_MAX_SECONDS = 0.05
+
+
+class ProviderCallLimiter:
+    """Bounded semaphore usable with both ``with`` and ``async with``."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._loop_semaphores = weakref.WeakKeyDictionary()
+        self._loop_lock = threading.Lock()
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        loop_semaphore = self._loop_semaphore()
+        await loop_semaphore.acquire()
+        try:
+            delay = POLL_MIN_SECONDS
+            while not self._semaphore.acquire(blocking=False):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, POLL_MAX_SECONDS)
+        except BaseException:
+            loop_semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
+        self._loop_semaphore().release()
+
+    def _loop_semaphore(self) -> asyncio.Semaphore:
+        """The semaphore the coroutines of the running loop queue on."""
+        loop = asyncio.get_running_loop()
+        with self._loop_lock:
+            semaphore = self._loop_semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._loop_semaphores[loop] = asyncio.Semaphore(self.limit)
+        return semaphore
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_call_limiter() -> ProviderCallLimiter:
+    """Return the limiter sized by the ``AI_MAX_CONCURRENT_CALLS`` setting."""
+    global _limiter
+
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = ProviderCallLimiter(
+                    getattr(settings, "AI_MAX_CONCURRENT_CALLS", DEFAULT_MAX_CONCURRENT_CALLS)
+                )
+    return _limiter
+
+
+def reset_call_limiter() -> None:
+    """Forget the limiter so the next call rebuilds it from settings."""
+    global _limiter
+
+    with _limiter_lock:
+        _limiter = None
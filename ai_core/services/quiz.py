@@ -1,9 +1,13 @@
 """Quiz generation service."""
+import asyncio
 import json
 import logging
 import re
 
 from .base import BaseLLMService
+from .budget import TokenUsage, budget_settings, fit_to_budget
+from .chunking import count_tokens
+from .jsonstream import JSONArrayStreamParser
 
 logger = logging.getLogger("ai_core")
 
@@ -23,8 +27,29 @@ QUIZ_SYSTEM_PROMPT = (
     "6. Start your response with [ and end with ], nothing else."
 )
 
+QUIZ_BATCH_SYSTEM_PROMPT = (
+    "You are an expert educator who creates multiple-choice quiz questions. "
+    "You will receive several lessons, each marked with an id such as L1. "
+    "Generate quiz questions in English for every lesson, based only on "
+    "that lesson's content.\n\n"
+    "RULES:\n"
+    "1. Return ONLY a valid JSON object, no markdown, no explanation outside JSON.\n"
+    "2. The object has one key per lesson id; each value is an array of questions.\n"
+    "3. Each question must have exactly these fields:\n"
+    '   - "q": (string) The question text.\n'
+    '   - "options": (array of 4 strings) Choices A, B, C, D.\n'
+    '   - "correct": (integer 0-3) Index of the correct answer.\n'
+    '   - "explain": (string) Brief explanation of the correct answer.\n'
+    "4. Vary question difficulty (recall, comprehension, application).\n"
+    "5. Distribute correct answers randomly across A, B, C, D.\n"
+    "6. Make distractors plausible and non-trivial to eliminate.\n"
+    "7. Start your response with { and end with }, nothing else."
+)
+
 DEFAULT_NUM_QUESTIONS = 5
 MAX_RETRIES = 2
+# Follow-up calls asking only for the questions still missing
+MAX_REPAIR_ROUNDS = 2
 
 
 class QuizGenerationError(Exception):
@@ -34,53 +59,419 @@ class QuizGenerationError(Exception):
 class QuizService:
     """Generate multiple-choice questions from lesson content."""
 
-    def __init__(self, llm_service: BaseLLMService):
+    def __init__(self, llm_service: BaseLLMService, max_content_tokens: int = None):
         self.llm_service = llm_service
+        options = budget_settings()
+        # Lesson content beyond this many tokens is cut before prompting
+        self.max_content_tokens = max_content_tokens or options["quiz_content_max_tokens"]
+        # Limits on how many lessons generate_batch() packs into one call
+        self.batch_max_tokens = options["quiz_batch_max_tokens"]
+        self.batch_max_lessons = options["quiz_batch_max_lessons"]
+        # Token usage of the most recent generate() / agenerate() call
+        self.usage = TokenUsage()
+        # Invalid questions skipped by the most recent generate() / stream() call
+        self.rejected = 0
+        # Follow-up calls made by the most recent generate() / agenerate() call
+        self.repair_rounds = 0
 
     def generate(self, lesson_content: str, num_questions: int = DEFAULT_NUM_QUESTIONS,
-                 difficulty: str = None) -> list:
+                 difficulty: str = None, use_cache: bool = True) -> list:
         """Generate quiz questions from the given lesson content.
 
+        The content is stripped of HTML, compacted and truncated to
+        ``max_content_tokens`` first. Valid questions are kept even when
+        others in the same response are not; the missing ones are then asked
+        for in up to ``MAX_REPAIR_ROUNDS`` follow-up calls that list the
+        questions already made. Token usage and the number of follow-up
+        calls are left on ``self.usage`` and ``self.repair_rounds``.
+
         Args:
             lesson_content: The lesson text (plain text or HTML).
             num_questions: Number of questions to generate (1-20, default 5).
             difficulty: Optional level – "easy", "medium", or "hard".
+            use_cache: Set to ``False`` to bypass the LLM response cache.
 
         Returns:
-            A list of question dicts matching the expected schema.
+            A list of at most ``num_questions`` question dicts matching the
+            expected schema; fewer only if repair rounds ran out.
+
+        Raises:
+            QuizGenerationError: If no valid question was produced.
+        """
+        self.usage = TokenUsage()
+        self.rejected = self.repair_rounds = 0
+        content = self._compact(lesson_content)
+        message = self._build_message(content, num_questions, difficulty)
+
+        questions, failures, last_error = [], 0, None
+        while message:
+            raw = self.llm_service.chat(
+                message, system_prompt=QUIZ_SYSTEM_PROMPT,
+                use_cache=use_cache, usage=self.usage, caller="quiz.generate",
+                attempt=1 + failures + self.repair_rounds,
+            )
+            try:
+                self._collect(self._parse_response(raw), questions)
+            except ValueError as exc:
+                failures, last_error = failures + 1, exc
+                if failures >= MAX_RETRIES:
+                    break
+                message = self._retry_message(message, failures, exc)
+                continue
+            message = self._repair_message(message, content, num_questions, difficulty, questions)
+
+        return self._finish(questions, num_questions, last_error)
+
+    async def agenerate(self, lesson_content: str,
+                        num_questions: int = DEFAULT_NUM_QUESTIONS,
+                        difficulty: str = None, use_cache: bool = True) -> list:
+        """Coroutine version of :meth:`generate`."""
+        self.usage = TokenUsage()
+        self.rejected = self.repair_rounds = 0
+        content = self._compact(lesson_content)
+        message = self._build_message(content, num_questions, difficulty)
+
+        questions, failures, last_error = [], 0, None
+        while message:
+            raw = await self.llm_service.achat(
+                message, system_prompt=QUIZ_SYSTEM_PROMPT,
+                use_cache=use_cache, usage=self.usage, caller="quiz.generate",
+                attempt=1 + failures + self.repair_rounds,
+            )
+            try:
+                self._collect(self._parse_response(raw), questions)
+            except ValueError as exc:
+                failures, last_error = failures + 1, exc
+                if failures >= MAX_RETRIES:
+                    break
+                message = self._retry_message(message, failures, exc)
+                continue
+            message = self._repair_message(message, content, num_questions, difficulty, questions)
+
+        return self._finish(questions, num_questions, last_error)
+
+    def stream(self, lesson_content: str, num_questions: int = DEFAULT_NUM_QUESTIONS,
+               difficulty: str = None, use_cache: bool = True):
+        """Yield validated questions as soon as each one has been generated.
+
+        The completion is parsed as it streams in, and each question is
+        validated on arrival; invalid ones are skipped and counted in
+        ``self.rejected``. Generation is cancelled as soon as
+        ``num_questions`` valid questions have been yielded.
 
         Raises:
-            QuizGenerationError: If generation or parsing fails after retries.
+            QuizGenerationError: If the completion held no valid question.
         """
-        message = self._build_message(lesson_content, num_questions, difficulty)
+        self.usage = TokenUsage()
+        self.rejected = 0
+        message = self._build_message(
+            self._compact(lesson_content), num_questions, difficulty
+        )
+        parser = JSONArrayStreamParser()
+        fragments = self.llm_service.stream_chat(
+            message, system_prompt=QUIZ_SYSTEM_PROMPT,
+            use_cache=use_cache, usage=self.usage, caller="quiz.stream",
+        )
+
+        accepted = 0
+        try:
+            for fragment in fragments:
+                for item in parser.feed(fragment):
+                    if not self._accept_streamed(item, accepted):
+                        continue
+                    accepted += 1
+                    yield item
+                    if accepted >= num_questions:
+                        logger.info(f"Quiz stream: {accepted} questions, generation stopped")
+                        return
+                if parser.done:
+                    break
+        finally:
+            # Closing the provider stream cancels any remaining generation
+            fragments.close()
+
+        self._finish_stream(message, parser, accepted, num_questions)
+
+    async def astream(self, lesson_content: str, num_questions: int = DEFAULT_NUM_QUESTIONS,
+                      difficulty: str = None, use_cache: bool = True):
+        """Async generator version of :meth:`stream`."""
+        self.usage = TokenUsage()
+        self.rejected = 0
+        message = self._build_message(
+            self._compact(lesson_content), num_questions, difficulty
+        )
+        parser = JSONArrayStreamParser()
+        fragments = self.llm_service.astream_chat(
+            message, system_prompt=QUIZ_SYSTEM_PROMPT,
+            use_cache=use_cache, usage=self.usage, caller="quiz.stream",
+        )
+
+        accepted = 0
+        try:
+            async for fragment in fragments:
+                for item in parser.feed(fragment):
+                    if not self._accept_streamed(item, accepted):
+                        continue
+                    accepted += 1
+                    yield item
+                    if accepted >= num_questions:
+                        logger.info(f"Quiz stream: {accepted} questions, generation stopped")
+                        return
+                if parser.done:
+                    break
+        finally:
+            await fragments.aclose()
+
+        self._finish_stream(message, parser, accepted, num_questions)
+
+    def generate_batch(self, lessons: list, num_questions: int = DEFAULT_NUM_QUESTIONS,
+                       difficulty: str = None, use_cache: bool = True) -> list:
+        """Generate quiz questions for many lessons in as few calls as possible.
+
+        Each lesson is compacted as in :meth:`generate`, then lessons are
+        packed into calls of at most ``batch_max_lessons`` lessons and
+        ``batch_max_tokens`` content tokens. The model answers each call with
+        a JSON object keyed by lesson id. Every lesson's part is validated on
+        its own, and only lessons whose part is missing or invalid are sent
+        again, for up to ``MAX_RETRIES`` rounds.
 
-        last_error = None
+        Args:
+            lessons: Lesson texts (plain text or HTML).
+            num_questions: Number of questions per lesson.
+            difficulty: Optional level – "easy", "medium", or "hard".
+            use_cache: Set to ``False`` to bypass the LLM response cache.
+
+        Returns:
+            One dict per lesson, in input order: ``{"questions": [...]}`` on
+            success or ``{"error": "..."}`` if the lesson failed every round.
+        """
+        self.usage = TokenUsage()
+        items = self._batch_items(lessons)
+        results = {}
+
+        pending = items
         for attempt in range(1, MAX_RETRIES + 1):
-            try:
-                raw = self.llm_service.chat(message, system_prompt=QUIZ_SYSTEM_PROMPT)
-                questions = self._parse_response(raw)
-                self._validate(questions)
-                logger.info(f"Quiz generated: {len(questions)} questions (attempt {attempt})")
-                return questions
-            except (json.JSONDecodeError, ValueError) as exc:
-                last_error = exc
-                logger.warning(f"Quiz parse attempt {attempt}/{MAX_RETRIES} failed: {exc}")
-                # Prepend a correction hint for the next attempt
-                message = (
-                    "Your previous response was not valid JSON. "
-                    "Please respond ONLY with a valid JSON array.\n\n" + message
+            for batch in self._pack(pending):
+                message = self._build_batch_message(batch, num_questions, difficulty, attempt)
+                raw = self.llm_service.chat(
+                    message, system_prompt=QUIZ_BATCH_SYSTEM_PROMPT,
+                    use_cache=use_cache, usage=self.usage,
+                    caller="quiz.batch", attempt=attempt,
                 )
+                self._demux(batch, raw, message, attempt, results)
+            pending = [item for item in pending if "error" in results[item[0]]]
+            if not pending:
+                break
 
-        raise QuizGenerationError(
-            f"Failed to generate quiz after {MAX_RETRIES} attempts: {last_error}"
-        )
+        self._log_batch(items, results)
+        return [results[key] for key, _, _ in items]
+
+    async def agenerate_batch(self, lessons: list,
+                              num_questions: int = DEFAULT_NUM_QUESTIONS,
+                              difficulty: str = None, use_cache: bool = True) -> list:
+        """Coroutine version of :meth:`generate_batch`.
+
+        The calls of each round run concurrently, bounded by the shared
+        provider call limiter.
+        """
+        self.usage = TokenUsage()
+        items = self._batch_items(lessons)
+        results = {}
+
+        pending = items
+        for attempt in range(1, MAX_RETRIES + 1):
+            batches = self._pack(pending)
+            messages = [
+                self._build_batch_message(batch, num_questions, difficulty, attempt)
+                for batch in batches
+            ]
+            responses = await asyncio.gather(*(
+                self.llm_service.achat(
+                    message, system_prompt=QUIZ_BATCH_SYSTEM_PROMPT,
+                    use_cache=use_cache, usage=self.usage,
+                    caller="quiz.batch", attempt=attempt,
+                )
+                for message in messages
+            ))
+            for batch, message, raw in zip(batches, messages, responses):
+                self._demux(batch, raw, message, attempt, results)
+            pending = [item for item in pending if "error" in results[item[0]]]
+            if not pending:
+                break
+
+        self._log_batch(items, results)
+        return [results[key] for key, _, _ in items]
 
     # -- Private helpers --------------------------------------------------
 
+    def _batch_items(self, lessons: list) -> list:
+        """Return ``(lesson_id, content, tokens)`` for each compacted lesson."""
+        items = []
+        for i, lesson in enumerate(lessons):
+            content = fit_to_budget(lesson, self.max_content_tokens)
+            items.append((f"L{i + 1}", content, count_tokens(content)))
+        return items
+
+    def _pack(self, items: list) -> list:
+        """Group lessons, in order, into batches that fit one call."""
+        batches, batch, tokens = [], [], 0
+        for item in items:
+            if batch and (
+                len(batch) >= self.batch_max_lessons
+                or tokens + item[2] > self.batch_max_tokens
+            ):
+                batches.append(batch)
+                batch, tokens = [], 0
+            batch.append(item)
+            tokens += item[2]
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _demux(self, batch: list, raw: str, message: str, attempt: int,
+               results: dict) -> None:
+        """Validate each lesson's part of a batch response into ``results``."""
+        try:
+            parts = self._parse_batch_response(raw)
+        except ValueError as exc:
+            parts, parse_error = {}, exc
+        else:
+            parse_error = None
+
+        failed = 0
+        for key, _, _ in batch:
+            try:
+                if parse_error:
+                    raise parse_error
+                if key not in parts:
+                    raise ValueError("missing from response")
+                self._validate(parts[key])
+                results[key] = {"questions": parts[key]}
+            except ValueError as exc:
+                results[key] = {"error": f"{key}: {exc}"}
+                failed += 1
+
+        if failed:
+            logger.warning(
+                f"Quiz batch attempt {attempt}/{MAX_RETRIES}: "
+                f"{failed}/{len(batch)} lesson(s) failed"
+            )
+            # Never serve this partly unusable response from the cache again
+            self.llm_service.forget(message, system_prompt=QUIZ_BATCH_SYSTEM_PROMPT)
+
+    def _log_batch(self, items: list, results: dict) -> None:
+        succeeded = sum(1 for key, _, _ in items if "questions" in results[key])
+        logger.info(
+            f"Quiz batch: {succeeded}/{len(items)} lesson(s) in "
+            f"{self.usage.calls + self.usage.cached_calls} call(s)"
+        )
+
+    def _compact(self, lesson_content: str) -> str:
+        """Reduce the lesson content to plain text within the token budget."""
+        content = fit_to_budget(lesson_content, self.max_content_tokens)
+        logger.info(
+            f"Quiz content: {count_tokens(lesson_content)} -> "
+            f"{count_tokens(content)} tokens (limit {self.max_content_tokens})"
+        )
+        return content
+
+    def _collect(self, items, questions: list) -> None:
+        """Append the valid, not yet seen questions of ``items`` to ``questions``.
+
+        Raises:
+            ValueError: If ``items`` is not a list.
+        """
+        if not isinstance(items, list):
+            raise ValueError("Response is not a list")
+
+        seen = {self._question_key(question) for question in questions}
+        for item in items:
+            try:
+                self._validate_question(item, len(questions))
+            except ValueError as exc:
+                self.rejected += 1
+                logger.warning(f"Quiz: dropping invalid question: {exc}")
+                continue
+            key = self._question_key(item)
+            if key in seen:
+                self.rejected += 1
+                continue
+            seen.add(key)
+            questions.append(item)
+
+    def _repair_message(self, message: str, content: str, num_questions: int,
+                        difficulty: str, questions: list):
+        """Return the follow-up message for missing questions, or ``None`` if done."""
+        missing = num_questions - len(questions)
+        if missing <= 0 or self.repair_rounds >= MAX_REPAIR_ROUNDS:
+            return None
+        # Never serve this incomplete response from the cache again
+        self.llm_service.forget(message, system_prompt=QUIZ_SYSTEM_PROMPT)
+        self.repair_rounds += 1
+        logger.info(
+            f"Quiz repair round {self.repair_rounds}/{MAX_REPAIR_ROUNDS}: "
+            f"requesting {missing} more question(s)"
+        )
+        return self._build_message(content, missing, difficulty, existing=questions)
+
+    def _finish(self, questions: list, num_questions: int, last_error) -> list:
+        if not questions:
+            raise QuizGenerationError(
+                f"Failed to generate quiz after {MAX_RETRIES} attempts: "
+                f"{last_error or 'no valid questions'}"
+            )
+        if len(questions) < num_questions:
+            logger.warning(
+                f"Quiz generated: only {len(questions)}/{num_questions} valid questions "
+                f"after {self.repair_rounds} repair round(s)"
+            )
+        else:
+            logger.info(
+                f"Quiz generated: {num_questions} questions "
+                f"({self.repair_rounds} repair round(s))"
+            )
+        return questions[:num_questions]
+
     @staticmethod
-    def _build_message(lesson_content: str, num_questions: int,
-                       difficulty: str = None) -> str:
-        """Build the user message sent to the LLM."""
+    def _question_key(question: dict) -> str:
+        return " ".join(question["q"].casefold().split())
+
+    def _accept_streamed(self, item, index: int) -> bool:
+        try:
+            self._validate_question(item, index)
+        except ValueError as exc:
+            self.rejected += 1
+            logger.warning(f"Quiz stream: skipping invalid question: {exc}")
+            return False
+        return True
+
+    def _finish_stream(self, message: str, parser: JSONArrayStreamParser,
+                       accepted: int, num_questions: int) -> None:
+        """Handle a stream that ended before ``num_questions`` valid questions."""
+        self.rejected += len(parser.errors)
+        # Never serve this incomplete response from the cache again
+        self.llm_service.forget(message, system_prompt=QUIZ_SYSTEM_PROMPT)
+        if not accepted:
+            raise QuizGenerationError("Streamed response contained no valid questions")
+        logger.warning(
+            f"Quiz stream: only {accepted}/{num_questions} valid questions "
+            f"({self.rejected} rejected)"
+        )
+
+    def _retry_message(self, message: str, attempt: int, exc: Exception) -> str:
+        """Log a failed attempt and return the message for the next one."""
+        logger.warning(f"Quiz parse attempt {attempt}/{MAX_RETRIES} failed: {exc}")
+        # Never serve this unusable response from the cache again
+        self.llm_service.forget(message, system_prompt=QUIZ_SYSTEM_PROMPT)
+        # Prepend a correction hint for the next attempt
+        return (
+            "Your previous response was not valid JSON. "
+            "Please respond ONLY with a valid JSON array.\n\n" + message
+        )
+
+    @staticmethod
+    def _question_spec(num_questions: int, difficulty: str = None) -> str:
+        """Describe the questions wanted, shared by single and batch prompts."""
         difficulty_hint = ""
         if difficulty:
             levels = {
@@ -91,15 +482,73 @@ class QuizService:
             difficulty_hint = f"\nDifficulty level: {levels.get(difficulty, difficulty)}."
 
         return (
-            f"Based on the lesson content below, create exactly {num_questions} "
+            f"create exactly {num_questions} "
             f"multiple-choice questions. Each question must have 4 choices "
-            f"A, B, C, D and indicate the correct answer.{difficulty_hint}\n\n"
+            f"A, B, C, D and indicate the correct answer.{difficulty_hint}"
+        )
+
+    @staticmethod
+    def _build_message(lesson_content: str, num_questions: int,
+                       difficulty: str = None, existing: list = None) -> str:
+        """Build the user message sent to the LLM.
+
+        ``existing`` questions are listed so the model does not repeat them.
+        """
+        existing_hint = ""
+        if existing:
+            listed = "\n".join(f"- {question['q']}" for question in existing)
+            existing_hint = (
+                f"\nThese questions already exist; do not repeat or rephrase them:\n"
+                f"{listed}\n"
+            )
+
+        return (
+            f"Based on the lesson content below, "
+            f"{QuizService._question_spec(num_questions, difficulty)}\n\n"
+            f"{existing_hint}"
             f"=== LESSON CONTENT ===\n"
             f"{lesson_content}\n"
             f"=== END OF CONTENT ===\n\n"
             f"Respond with a JSON array only (no markdown or explanation)."
         )
 
+    @staticmethod
+    def _build_batch_message(batch: list, num_questions: int, difficulty: str = None,
+                             attempt: int = 1) -> str:
+        """Build the user message for one batch of ``(lesson_id, content, tokens)``."""
+        parts = [f"For EACH lesson below, {QuizService._question_spec(num_questions, difficulty)}"]
+        for key, content, _ in batch:
+            parts.append(f"=== LESSON {key} ===\n{content}\n=== END OF LESSON {key} ===")
+        ids = ", ".join(key for key, _, _ in batch)
+        parts.append(
+            f"Respond with a JSON object only, with exactly these keys: {ids}."
+        )
+        if attempt > 1:
+            parts.insert(
+                0,
+                "Your previous response was incomplete or not valid JSON. "
+                "Please respond ONLY with a valid JSON object.",
+            )
+        return "\n\n".join(parts)
+
+    @staticmethod
+    def _parse_batch_response(raw: str) -> dict:
+        """Extract and parse the JSON object of a batch response."""
+        text = raw.strip()
+
+        match = re.search(r"```(?:json)?\s*\n?(.*?)\n?\s*```", text, re.DOTALL)
+        if match:
+            text = match.group(1).strip()
+
+        start = text.find("{")
+        end = text.rfind("}")
+        if start == -1 or end < start:
+            raise json.JSONDecodeError("Could not extract JSON object from response", text, 0)
+        data = json.loads(text[start:end + 1])
+        if not isinstance(data, dict):
+            raise ValueError("Response is not a JSON object")
+        return data
+
     @staticmethod
     def _parse_response(raw: str) -> list:
         """Extract and parse a JSON array from the LLM response.
@@ -150,24 +599,33 @@ class QuizService:
             raise ValueError("Response is not a non-empty list")
 
         for i, item in enumerate(questions):
-            label = f"Question {i + 1}"
+            QuizService._validate_question(item, i)
+
+    @staticmethod
+    def _validate_question(item, index: int) -> None:
+        """Validate one question dict; ``index`` is used in error messages.
+
+        Raises:
+            ValueError: If the question does not match the expected schema.
+        """
+        label = f"Question {index + 1}"
 
-            if not isinstance(item, dict):
-                raise ValueError(f"{label}: not an object")
+        if not isinstance(item, dict):
+            raise ValueError(f"{label}: not an object")
 
-            if not item.get("q") or not isinstance(item["q"], str):
-                raise ValueError(f"{label}: missing or invalid 'q'")
+        if not item.get("q") or not isinstance(item["q"], str):
+            raise ValueError(f"{label}: missing or invalid 'q'")
 
-            opts = item.get("options")
-            if not isinstance(opts, list) or len(opts) != 4:
-                raise ValueError(f"{label}: 'options' must be an array of 4 strings")
+        opts = item.get("options")
+        if not isinstance(opts, list) or len(opts) != 4:
+            raise ValueError(f"{label}: 'options' must be an array of 4 strings")
 
-            if not all(isinstance(o, str) and o.strip() for o in opts):
-                raise ValueError(f"{label}: each option must be a non-empty string")
+        if not all(isinstance(o, str) and o.strip() for o in opts):
+            raise ValueError(f"{label}: each option must be a non-empty string")
 
-            correct = item.get("correct")
-            if not isinstance(correct, int) or correct not in (0, 1, 2, 3):
-                raise ValueError(f"{label}: 'correct' must be an integer 0-3")
+        correct = item.get("correct")
+        if not isinstance(correct, int) or correct not in (0, 1, 2, 3):
+            raise ValueError(f"{label}: 'correct' must be an integer 0-3")
 
-            if "explain" in item and not isinstance(item["explain"], str):
-                raise ValueError(f"{label}: 'explain' must be a string")
+        if "explain" in item and not isinstance(item["explain"], str):
+            raise ValueError(f"{label}: 'explain' must be a string")
@@ -0,0 +1,211 @@
+"""Bulk import of generated quiz questions into the quiz app's models."""
+import logging
+
+from django.db import connection, transaction
+
+from quiz.models import Choice, MCQuestion, Question, Quiz
+from quiz.utils import mcquestion_hash, question_hash
+
+from .quiz import QuizService
+
+logger = logging.getLogger("ai_core")
+
+# Longest texts the quiz models accept
+MAX_TITLE_LENGTH = Quiz._meta.get_field("title").max_length
+MAX_CONTENT_LENGTH = Question._meta.get_field("content").max_length
+MAX_EXPLANATION_LENGTH = Question._meta.get_field("explanation").max_length
+MAX_CHOICE_LENGTH = Choice._meta.get_field("choice_text").max_length
+
+
+class QuizImportError(ValueError):
+    """Raised when the questions to import are not valid ``QuizService`` output."""
+
+
+class QuizImportService:
+    """Create a ``Quiz`` with its questions from ``QuizService`` output.
+
+    All rows are written in one transaction with ``bulk_create``, so the
+    number of queries does not grow with each question. A question already
+    in the bank as an ``MCQuestion`` with the same normalised content,
+    options and answer (see ``quiz.utils.mcquestion_hash``) is not created
+    again: it is left out, or the existing one is linked to the new quiz
+    when ``link_duplicates`` is true.
+
+    Args:
+        link_duplicates: Link questions already in the bank to the quiz
+            instead of skipping them.
+        choice_order: ``MCQuestion.choice_order`` for the new questions.
+    """
+
+    def __init__(self, link_duplicates: bool = False, choice_order: str = "random"):
+        self.link_duplicates = link_duplicates
+        self.choice_order = choice_order
+
+    def import_quiz(self, course, title: str, questions: list, **quiz_fields) -> dict:
+        """Create a quiz for ``course`` holding ``questions``.
+
+        Args:
+            course: The ``Course`` the quiz belongs to.
+            title: Quiz title.
+            questions: Question dicts as returned by ``QuizService.generate``.
+            **quiz_fields: Other ``Quiz`` fields (description, category, draft...).
+
+        Returns:
+            A dict with the ``quiz``, and the number of questions ``created``,
+            ``linked`` from the bank and ``skipped`` as repeats, plus the
+            ``duplicates``: indexes of the questions found in the bank.
+
+        Raises:
+            QuizImportError: If the title or any question is invalid; nothing
+                is written.
+        """
+        title = (title or "").strip()
+        if not title:
+            raise QuizImportError("A quiz title is required")
+        if len(title) > MAX_TITLE_LENGTH:
+            raise QuizImportError(f"Title is longer than {MAX_TITLE_LENGTH} characters")
+        self._validate(questions)
+
+        unique, skipped = self._unique(questions)
+        existing = self._existing(unique)
+        duplicates = [index for hash_, index, _ in unique if hash_ in existing]
+        new = [(hash_, item) for hash_, _, item in unique if hash_ not in existing]
+        linked = [existing[hash_] for hash_, _, _ in unique if hash_ in existing]
+        if not self.link_duplicates:
+            skipped += len(linked)
+            linked = []
+
+        with transaction.atomic():
+            quiz = Quiz.objects.create(course=course, title=title, **quiz_fields)
+            question_ids = self._create_questions(new)
+            Question.quiz.through.objects.bulk_create([
+                Question.quiz.through(quiz_id=quiz.pk, question_id=question_id)
+                for question_id in question_ids + linked
+            ])
+
+        logger.info(
+            f"Imported quiz '{quiz.title}' (#{quiz.pk}): {len(question_ids)} "
+            f"created, {len(linked)} linked, {skipped} skipped"
+        )
+        return {
+            "quiz": quiz,
+            "created": len(question_ids),
+            "linked": len(linked),
+            "skipped": skipped,
+            "duplicates": duplicates,
+        }
+
+    # -- Private helpers --------------------------------------------------
+
+    @staticmethod
+    def _validate(questions: list) -> None:
+        if not isinstance(questions, list) or not questions:
+            raise QuizImportError("questions must be a non-empty list")
+        for index, item in enumerate(questions):
+            try:
+                QuizService._validate_question(item, index)
+            except ValueError as exc:
+                raise QuizImportError(str(exc)) from None
+            label = f"Question {index + 1}"
+            if len(item["q"]) > MAX_CONTENT_LENGTH:
+                raise QuizImportError(
+                    f"{label}: 'q' is longer than {MAX_CONTENT_LENGTH} characters"
+                )
+            if len(item.get("explain", "")) > MAX_EXPLANATION_LENGTH:
+                raise QuizImportError(
+                    f"{label}: 'explain' is longer than {MAX_EXPLANATION_LENGTH} characters"
+                )
+            if any(len(option) > MAX_CHOICE_LENGTH for option in item["options"]):
+                raise QuizImportError(
+                    f"{label}: options are limited to {MAX_CHOICE_LENGTH} characters"
+                )
+
+    @staticmethod
+    def _unique(questions: list) -> tuple:
+        """Return ``([(hash, index, item), ...], repeats)`` without repeated questions."""
+        unique, seen = [], set()
+        for index, item in enumerate(questions):
+            hash_ = mcquestion_hash(item["q"], item["options"], item["options"][item["correct"]])
+            if hash_ not in seen:
+                seen.add(hash_)
+                unique.append((hash_, index, item))
+        return unique, len(questions) - len(unique)
+
+    @staticmethod
+    def _existing(unique: list) -> dict:
+        """Map each hash already in the bank to its oldest ``MCQuestion``'s id.
+
+        Candidates are found by their indexed content hash, then compared
+        with their choices, in two queries.
+        """
+        candidates = dict(
+            MCQuestion.objects.filter(
+                content_hash__in={question_hash(item["q"]) for _, _, item in unique}
+            ).values_list("id", "content")
+        )
+        choices = {question_id: ([], []) for question_id in candidates}
+        rows = Choice.objects.filter(question_id__in=list(candidates)).values_list(
+            "question_id", "choice_text", "correct"
+        )
+        for question_id, text, correct in rows:
+            options, answers = choices[question_id]
+            options.append(text)
+            if correct:
+                answers.append(text)
+
+        existing = {}
+        for question_id in sorted(candidates):
+            options, answers = choices[question_id]
+            if len(answers) == 1:
+                hash_ = mcquestion_hash(candidates[question_id], options, answers[0])
+                existing.setdefault(hash_, question_id)
+        return existing
+
+    def _create_questions(self, new: list) -> list:
+        """Insert the questions, their ``MCQuestion`` rows and choices; return the ids."""
+        if not new:
+            return []
+
+        parents = Question.objects.bulk_create([
+            Question(
+                content=item["q"].strip(),
+                explanation=item.get("explain", "").strip(),
+                content_hash=question_hash(item["q"]),
+            )
+            for _, item in new
+        ])
+        if any(parent.pk is None for parent in parents):
+            # The backend cannot return ids from a bulk insert: take the
+            # newest rows with these hashes, inserted in order
+            ids = (
+                Question.objects.filter(content_hash__in={p.content_hash for p in parents})
+                .order_by("-id")
+                .values_list("id", flat=True)[:len(parents)]
+            )
+            for parent, pk in zip(parents, reversed(list(ids))):
+                parent.pk = pk
+
+        self._insert_children(parents)
+        Choice.objects.bulk_create([
+            Choice(question_id=parent.pk, choice_text=option.strip(), correct=i == item["correct"])
+            for parent, (_, item) in zip(parents, new)
+            for i, option in enumerate(item["options"])
+        ])
+        return [parent.pk for parent in parents]
+
+    def _insert_children(self, parents: list) -> None:
+        """Add the ``MCQuestion`` table rows for already inserted ``Question`` rows.
+
+        ``bulk_create`` refuses multi-table inheritance, so the child rows,
+        which only hold the parent link and the choice order, are inserted
+        with a single ``executemany``.
+        """
+        opts = MCQuestion._meta
+        quote = connection.ops.quote_name
+        sql = (
+            f"INSERT INTO {quote(opts.db_table)} "
+            f"({quote(opts.pk.column)}, {quote(opts.get_field('choice_order').column)}) "
+            f"VALUES (%s, %s)"
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [(parent.pk, self.choice_order) for parent in parents])
@@ -0,0 +1,92 @@
+"""Process-wide registry of LLM provider instances.
+
+Building a provider creates a LangChain chat model together with its HTTP
+client, so each provider is constructed once per worker process and shared
+by every request (and thread) served by that process. Reusing the same
+client keeps its connection pool – and therefore keep-alive connections –
+warm between requests.
+"""
+import logging
+import os
+import threading
+
+from django.conf import settings
+
+from .base import BaseLLMService
+from .fake import FakeLLMService
+from .gemini import GeminiLiteService, GeminiService
+from .resilient import ResilientLLMService
+
+logger = logging.getLogger("ai_core")
+
+DEFAULT_PROVIDER = "gemini"
+
+_providers = {
+    "gemini": GeminiService,
+    "gemini-lite": GeminiLiteService,
+    "fake": FakeLLMService,
+    "resilient": ResilientLLMService,
+}
+_instances = {}
+_owner_pid = None
+_lock = threading.Lock()
+
+
+def register_provider(name: str, service_class: type) -> None:
+    """Register a ``BaseLLMService`` subclass under the given name.
+
+    Re-registering a name drops any instance already built for it.
+    """
+    if not issubclass(service_class, BaseLLMService):
+        raise TypeError(f"{service_class!r} is not a BaseLLMService subclass")
+
+    with _lock:
+        _providers[name] = service_class
+        _instances.pop(name, None)
+
+
+def default_provider() -> str:
+    """Return the provider name set by ``AI_DEFAULT_PROVIDER``."""
+    return getattr(settings, "AI_DEFAULT_PROVIDER", DEFAULT_PROVIDER)
+
+
+def get_llm_service(name: str = None) -> BaseLLMService:
+    """Return the shared provider instance for ``name``, building it on first use.
+
+    Without a name, the ``AI_DEFAULT_PROVIDER`` setting is used.
+
+    Raises:
+        KeyError: If no provider is registered under ``name``.
+    """
+    global _owner_pid
+
+    name = name or default_provider()
+
+    # Fast path: no locking once the instance exists in this process.
+    instance = _instances.get(name)
+    if instance is not None and _owner_pid == os.getpid():
+        return instance
+
+    with _lock:
+        # Instances inherited through fork() share sockets with the parent,
+        # so a child process always builds its own.
+        if _owner_pid != os.getpid():
+            _instances.clear()
+            _owner_pid = os.getpid()
+
+        instance = _instances.get(name)
+        if instance is None:
+            try:
+                service_class = _providers[name]
+            except KeyError:
+                raise KeyError(f"Unknown LLM provider: {name}") from None
+            instance = service_class()
+            _instances[name] = instance
+            logger.info(f"LLM provider '{name}' ready (pid {_owner_pid})")
+        return instance
+
+
+def reset_llm_services() -> None:
+    """Drop every cached provider instance. Intended for tests."""
+    with _lock:
+        _instances.clear()
@@ -0,0 +1,462 @@
+"""Resilient provider layer over any number of registered LLM backends.
+
+``ResilientLLMService`` is itself a provider. Its chat model tries the
+configured backends in order. Each backend has a token-bucket rate limiter, a
+per-call timeout and a circuit breaker. A backend that is rate limited, times
+out, raises or has an open circuit is skipped for the next one, so a call
+fails fast with ``ProviderUnavailableError`` instead of hanging on a broken
+provider.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+
+from .base import BaseLLMService
+
+logger = logging.getLogger("ai_core")
+
+DEFAULTS = {
+    "BACKENDS": [{"PROVIDER": "gemini"}],
+    # Requests per second and bucket size; no RATE means unlimited
+    "RATE": None,
+    "BURST": None,
+    # Seconds to wait for a response (or, when streaming, for the next chunk)
+    "TIMEOUT": 60,
+    # Longest wait for a rate-limit token before trying the next backend
+    "RATE_LIMIT_WAIT": 1.0,
+    # Consecutive failures that open a circuit, and seconds until a retry
+    "FAILURE_THRESHOLD": 5,
+    "RESET_TIMEOUT": 30,
+    # Timed-out calls that may still hold a worker thread before the circuit
+    # opens; providers should also be given a client timeout that ends them
+    "MAX_ABANDONED": 8,
+}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Runs blocking provider calls so they can be abandoned on timeout
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class ProviderUnavailableError(Exception):
+    """Raised when every backend failed or was skipped for a call."""
+
+
+class ProviderTimeoutError(TimeoutError):
+    """Raised when a backend does not answer within its timeout."""
+
+
+def resilience_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "AI_RESILIENCE", {})}
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing ``rate`` calls per second on average.
+
+    Up to ``capacity`` calls may be made in a burst. A ``rate`` of ``None``
+    or 0 disables limiting.
+    """
+
+    def __init__(self, rate: float = None, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate or 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float = 0) -> bool:
+        """Take a token, waiting at most ``timeout`` seconds for one."""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._reserve()
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def aacquire(self, timeout: float = 0) -> bool:
+        """Coroutine version of :meth:`acquire`."""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._reserve()
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    def _reserve(self) -> float:
+        """Take a token if one is free; otherwise return seconds until one is."""
+        if not self.rate:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+class CircuitBreaker:
+    """Stop calling a backend after ``failure_threshold`` consecutive failures.
+
+    After ``reset_timeout`` seconds the circuit is half open: one trial call
+    is let through, which closes the circuit on success or reopens it on
+    failure.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._cooled_down():
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Return whether a call may be made now."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if not self._cooled_down():
+                return False
+            # Let one trial through; the next one waits another reset_timeout
+            # unless this one reports success first.
+            self._state = HALF_OPEN
+            self._opened_at = time.monotonic()
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._state = CLOSED
+
+    def trip(self) -> None:
+        """Open the circuit now, whatever the failure count."""
+        with self._lock:
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def _cooled_down(self) -> bool:
+        return time.monotonic() - self._opened_at >= self.reset_timeout
+
+
+class Backend:
+    """One provider behind the resilient layer, with its own limits."""
+
+    def __init__(self, provider: str, rate: float = None, burst: float = None,
+                 timeout: float = None, rate_limit_wait: float = 0,
+                 failure_threshold: int = 5, reset_timeout: float = 30,
+                 max_abandoned: int = 8):
+        self.provider = provider
+        self.timeout = timeout
+        self.rate_limit_wait = rate_limit_wait
+        self.max_abandoned = max_abandoned
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._abandoned = 0
+        self._abandoned_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, options: dict, defaults: dict):
+        merged = {**defaults, **options}
+        return cls(
+            merged["PROVIDER"],
+            rate=merged["RATE"],
+            burst=merged["BURST"],
+            timeout=merged["TIMEOUT"],
+            rate_limit_wait=merged["RATE_LIMIT_WAIT"],
+            failure_threshold=merged["FAILURE_THRESHOLD"],
+            reset_timeout=merged["RESET_TIMEOUT"],
+            max_abandoned=merged["MAX_ABANDONED"],
+        )
+
+    @property
+    def abandoned(self) -> int:
+        """Timed-out calls still running in a worker thread."""
+        with self._abandoned_lock:
+            return self._abandoned
+
+    def abandon(self, future) -> None:
+        """Track a timed-out call until its thread finishes.
+
+        Once ``max_abandoned`` of them are stuck, the circuit opens, so a hung
+        provider cannot take every thread of the shared executor.
+        """
+        with self._abandoned_lock:
+            self._abandoned += 1
+            saturated = self._abandoned >= self.max_abandoned
+        future.add_done_callback(self._release)
+        if saturated:
+            self.breaker.trip()
+
+    def _release(self, future) -> None:
+        with self._abandoned_lock:
+            self._abandoned -= 1
+
+    @property
+    def llm(self):
+        # Resolved on every call so re-registering a provider takes effect.
+        from .registry import get_llm_service
+
+        return get_llm_service(self.provider).llm
+
+
+class ResilientChatModel:
+    """Chat model that fails over between the chat models of its backends."""
+
+    def __init__(self, backends: list):
+        self.backends = backends
+
+    @property
+    def model(self) -> str:
+        return "resilient:" + ",".join(backend.provider for backend in self.backends)
+
+    def invoke(self, messages):
+        errors = []
+        for backend in self.backends:
+            if not self._admit(backend, errors):
+                continue
+            try:
+                response = _call_with_timeout(
+                    backend.llm.invoke, messages, backend.timeout, backend.abandon
+                )
+            except Exception as exc:
+                self._failed(backend, exc, errors)
+                continue
+            backend.breaker.record_success()
+            return response
+        raise self._unavailable(errors)
+
+    async def ainvoke(self, messages):
+        errors = []
+        for backend in self.backends:
+            if not await self._aadmit(backend, errors):
+                continue
+            try:
+                response = await asyncio.wait_for(
+                    backend.llm.ainvoke(messages), backend.timeout
+                )
+            except Exception as exc:
+                self._failed(backend, exc, errors)
+                continue
+            backend.breaker.record_success()
+            return response
+        raise self._unavailable(errors)
+
+    def stream(self, messages):
+        """Yield chunks from the first backend that starts answering.
+
+        Failover is only possible before the first chunk; a backend failing
+        mid-stream raises to the caller.
+        """
+        errors = []
+        for backend in self.backends:
+            if not self._admit(backend, errors):
+                continue
+            started = False
+            try:
+                for chunk in _iter_with_timeout(
+                    lambda: backend.llm.stream(messages), backend.timeout, backend.abandon
+                ):
+                    started = True
+                    yield chunk
+            except Exception as exc:
+                self._failed(backend, exc, errors)
+                if started:
+                    raise
+                continue
+            backend.breaker.record_success()
+            return
+        raise self._unavailable(errors)
+
+    async def astream(self, messages):
+        """Async generator version of :meth:`stream`."""
+        errors = []
+        for backend in self.backends:
+            if not await self._aadmit(backend, errors):
+                continue
+            started = False
+            chunks = None
+            try:
+                chunks = backend.llm.astream(messages)
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), backend.timeout)
+                    except StopAsyncIteration:
+                        break
+                    started = True
+                    yield chunk
+            except Exception as exc:
+                self._failed(backend, exc, errors)
+                if started:
+                    raise
+                continue
+            finally:
+                if chunks is not None:
+                    await chunks.aclose()
+            backend.breaker.record_success()
+            return
+        raise self._unavailable(errors)
+
+    # -- Private helpers --------------------------------------------------
+
+    @staticmethod
+    def _admit(backend: Backend, errors: list) -> bool:
+        """Check the circuit, then the rate limit, recording why a backend is skipped."""
+        if backend.abandoned >= backend.max_abandoned or not backend.breaker.allow():
+            errors.append(f"{backend.provider}: circuit open")
+            return False
+        if not backend.bucket.acquire(backend.rate_limit_wait):
+            errors.append(f"{backend.provider}: rate limited")
+            return False
+        return True
+
+    @staticmethod
+    async def _aadmit(backend: Backend, errors: list) -> bool:
+        """Coroutine version of :meth:`_admit`."""
+        if backend.abandoned >= backend.max_abandoned or not backend.breaker.allow():
+            errors.append(f"{backend.provider}: circuit open")
+            return False
+        if not await backend.bucket.aacquire(backend.rate_limit_wait):
+            errors.append(f"{backend.provider}: rate limited")
+            return False
+        return True
+
+    @staticmethod
+    def _failed(backend: Backend, exc: Exception, errors: list) -> None:
+        backend.breaker.record_failure()
+        reason = exc.__class__.__name__ if isinstance(exc, TimeoutError) else str(exc)
+        errors.append(f"{backend.provider}: {reason}")
+        logger.warning(
+            f"LLM backend '{backend.provider}' failed "
+            f"({backend.breaker.state}, {backend.breaker.failures} in a row): {reason}"
+        )
+
+    @staticmethod
+    def _unavailable(errors: list) -> ProviderUnavailableError:
+        logger.error(f"No LLM backend available: {'; '.join(errors)}")
+        return ProviderUnavailableError("; ".join(errors) or "no backends configured")
+
+
+class ResilientLLMService(BaseLLMService):
+    """Provider that spreads calls over the backends in ``AI_RESILIENCE``.
+
+    Args:
+        backends: ``Backend`` objects to use instead of the settings, in
+            failover order.
+    """
+
+    provider = "resilient"
+
+    def __init__(self, backends: list = None):
+        if backends is None:
+            options = resilience_settings()
+            backends = [
+                Backend.from_settings(backend, options) for backend in options["BACKENDS"]
+            ]
+        self.backends = backends
+        super().__init__()
+
+    def _build_llm(self):
+        return ResilientChatModel(self.backends)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=64, thread_name_prefix="ai-call"
+                )
+    return _executor
+
+
+def _call_with_timeout(func, arg, timeout: float = None, on_abandon=None):
+    """Run ``func(arg)``, giving up after ``timeout`` seconds.
+
+    A blocking call cannot be interrupted, so on timeout it is left to
+    finish in the background and its result is discarded; ``on_abandon`` is
+    then called with its future unless it was cancelled before starting.
+    """
+    if not timeout:
+        return func(arg)
+    future = _get_executor().submit(func, arg)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        if not future.cancel() and on_abandon:
+            on_abandon(future)
+        raise ProviderTimeoutError(f"No response within {timeout}s") from None
+
+
+def _iter_with_timeout(make_iterator, timeout: float = None, on_abandon=None):
+    """Iterate ``make_iterator()`` with at most ``timeout`` seconds between items.
+
+    On timeout the producing thread is left to stop after its pending item,
+    and ``on_abandon`` is called with its future.
+    """
+    if not timeout:
+        yield from make_iterator()
+        return
+
+    items = queue.Queue()
+    stop = threading.Event()
+    end = object()
+
+    def produce():
+        try:
+            for item in make_iterator():
+                if stop.is_set():
+                    return
+                items.put((item, None))
+            items.put((end, None))
+        except Exception as exc:
+            items.put((end, exc))
+
+    future = _get_executor().submit(produce)
+    try:
+        while True:
+            try:
+                item, error = items.get(timeout=timeout)
+            except queue.Empty:
+                if not future.done() and on_abandon:
+                    on_abandon(future)
+                raise ProviderTimeoutError(f"No data within {timeout}s") from None
+            if error is not None:
+                raise error
+            if item is end:
+                return
+            yield item
+    finally:
+        stop.set()
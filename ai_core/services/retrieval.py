@@ -0,0 +1,191 @@
+"""Local vector index over document chunks, one per course.
+
+Each index is a pair of ``.npy`` files: a float32 ``(n, dimension)`` matrix of
+chunk embeddings and an int64 ``(n, 2)`` matrix of ``(chunk_id,
+generation_id)`` rows. Searches memory-map the files, so only the pages the
+dot product touches are read, and writers swap in new files atomically.
+"""
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from ai_core.models import DocumentChunk
+from .embeddings import get_embedder
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger("ai_core")
+
+DEFAULT_TOP_K = 6
+
+_write_lock = threading.Lock()
+
+
+def retrieval_settings() -> dict:
+    options = getattr(settings, "AI_RETRIEVAL", {})
+    return {
+        "index_dir": options.get("INDEX_DIR", os.path.join(settings.BASE_DIR, "ai_index")),
+        "top_k": options.get("TOP_K", DEFAULT_TOP_K),
+    }
+
+
+def top_k(matrix: np.ndarray, query: np.ndarray, k: int):
+    """Return ``(rows, scores)`` of the ``k`` rows most similar to ``query``.
+
+    Rows are ordered by descending score. Uses a single matrix-vector
+    product and a partial sort, so cost is linear in the number of rows.
+    """
+    if len(matrix) == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    scores = matrix @ query
+    k = min(k, len(scores))
+    rows = np.argpartition(-scores, k - 1)[:k]
+    rows = rows[np.argsort(-scores[rows], kind="stable")]
+    return rows, scores[rows]
+
+
+class VectorIndex:
+    """Memory-mapped embedding matrix for the chunks of one course."""
+
+    def __init__(self, name: str, directory: str = None, embedder=None):
+        self.name = name
+        self.directory = directory or retrieval_settings()["index_dir"]
+        self.embedder = embedder or get_embedder()
+
+    @classmethod
+    def for_course(cls, course_id, **kwargs):
+        return cls(f"course_{course_id}", **kwargs)
+
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.directory, f"{self.name}.{suffix}")
+
+    def __len__(self):
+        loaded = self.load()
+        return 0 if loaded is None else len(loaded[0])
+
+    def load(self):
+        """Return memory-mapped ``(vectors, ids)`` or ``None`` if empty/stale."""
+        try:
+            with open(self._path("json")) as fh:
+                if json.load(fh).get("embedder") != self.embedder.name:
+                    return None
+            return (
+                np.load(self._path("vectors.npy"), mmap_mode="r"),
+                np.load(self._path("ids.npy"), mmap_mode="r"),
+            )
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def add_generation(self, generation_id: int, chunks) -> int:
+        """Embed ``(chunk_id, text)`` pairs of a document into the index.
+
+        Rows previously indexed for the same document are replaced. Returns
+        the number of rows in the index afterwards.
+        """
+        chunks = list(chunks)
+        vectors = self.embedder.embed([text for _, text in chunks])
+        ids = np.array(
+            [(chunk_id, generation_id) for chunk_id, _ in chunks], dtype=np.int64
+        ).reshape(-1, 2)
+        return self._rewrite(generation_id, vectors, ids)
+
+    def build(self, rows, batch_size: int = 256) -> int:
+        """Replace the whole index with ``(chunk_id, generation_id, text)`` rows."""
+        vectors, ids, batch = [], [], []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                vectors.append(self.embedder.embed([text for _, _, text in batch]))
+                ids.extend((chunk_id, generation_id) for chunk_id, generation_id, _ in batch)
+                batch = []
+        if batch:
+            vectors.append(self.embedder.embed([text for _, _, text in batch]))
+            ids.extend((chunk_id, generation_id) for chunk_id, generation_id, _ in batch)
+
+        vectors = (
+            np.concatenate(vectors) if vectors
+            else np.zeros((0, self.embedder.dimension), dtype=np.float32)
+        )
+        ids = np.array(ids, dtype=np.int64).reshape(-1, 2)
+        return self._rewrite(None, vectors, ids, replace_all=True)
+
+    def remove_generation(self, generation_id: int) -> int:
+        empty = np.zeros((0, self.embedder.dimension), dtype=np.float32)
+        return self._rewrite(generation_id, empty, np.zeros((0, 2), dtype=np.int64))
+
+    def search(self, query: str, k: int = None) -> list:
+        """Return ``[(chunk_id, score), ...]`` for the best matching chunks."""
+        loaded = self.load()
+        if loaded is None:
+            return []
+        vectors, ids = loaded
+        rows, scores = top_k(
+            vectors, self.embedder.embed_query(query), k or retrieval_settings()["top_k"]
+        )
+        return [(int(ids[row, 0]), float(score)) for row, score in zip(rows, scores)]
+
+    # -- Private helpers --------------------------------------------------
+
+    def _rewrite(self, generation_id, new_vectors, new_ids, replace_all=False) -> int:
+        os.makedirs(self.directory, exist_ok=True)
+        with _write_lock, open(self._path("lock"), "w") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+            loaded = None if replace_all else self.load()
+            if loaded is not None:
+                vectors, ids = loaded
+                keep = ids[:, 1] != generation_id
+                new_vectors = np.concatenate([vectors[keep], new_vectors])
+                new_ids = np.concatenate([ids[keep], new_ids])
+
+            # Write beside the live files, then swap them in atomically;
+            # readers holding the old memory maps are unaffected.
+            for suffix, array in (("vectors.npy", new_vectors), ("ids.npy", new_ids)):
+                tmp = self._path(f"tmp.{suffix}")
+                np.save(tmp, np.ascontiguousarray(array))
+                os.replace(tmp, self._path(suffix))
+            with open(self._path("tmp.json"), "w") as fh:
+                json.dump({"embedder": self.embedder.name, "rows": len(new_ids)}, fh)
+            os.replace(self._path("tmp.json"), self._path("json"))
+
+        logger.info(f"Vector index {self.name}: {len(new_ids)} row(s)")
+        return len(new_ids)
+
+
+class Retriever:
+    """Select the chunks most relevant to a query, within a token budget."""
+
+    def __init__(self, index: VectorIndex, k: int = None, max_tokens: int = None):
+        self.index = index
+        self.k = k or retrieval_settings()["top_k"]
+        self.max_tokens = max_tokens
+
+    @classmethod
+    def for_course(cls, course_id, **kwargs):
+        return cls(VectorIndex.for_course(course_id), **kwargs)
+
+    def context_for(self, query: str) -> str:
+        """Return the best matching chunk texts, most relevant first."""
+        hits = self.index.search(query, self.k)
+        if not hits:
+            return ""
+        chunks = DocumentChunk.objects.in_bulk([chunk_id for chunk_id, _ in hits])
+
+        parts, used = [], 0
+        for chunk_id, _ in hits:
+            chunk = chunks.get(chunk_id)
+            if chunk is None:  # deleted since it was indexed
+                continue
+            if self.max_tokens and used + chunk.token_count > self.max_tokens:
+                break
+            parts.append(chunk.text)
+            used += chunk.token_count
+        return "\n\n".join(parts)
@@ -0,0 +1,233 @@
+"""Structured per-call telemetry for LLM calls.
+
+``BaseLLMService`` reports every call (provider, model, caller, attempt,
+outcome, latency and tokens) through :func:`record_call`. Records are kept in
+an in-memory buffer and written as ``LLMCall`` rows by a background thread
+with one ``bulk_create`` per batch, so recording never waits on the
+database. :func:`summarize_calls` computes the figures shown on the admin
+dashboard in the database: aggregate queries, plus one single-row lookup per
+latency percentile of each provider and model.
+"""
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Avg, Count, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ai_core.models import CACHE_HIT, FAILED, SUCCESS, LLMCall
+
+logger = logging.getLogger("ai_core")
+
+DEFAULTS = {
+    "ENABLED": True,
+    # Records written per INSERT, and buffered records that trigger a write
+    "BATCH_SIZE": 100,
+    # Longest a record waits in the buffer, in seconds
+    "FLUSH_INTERVAL": 5.0,
+    # Records kept while the database is unreachable; the oldest are dropped
+    "MAX_BUFFER": 10000,
+}
+
+PERCENTILES = (50, 95, 99)
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def telemetry_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "AI_TELEMETRY", {})}
+
+
+class TelemetryRecorder:
+    """Buffer of call records flushed to the database in batches.
+
+    ``record`` only appends to the buffer. A daemon thread, started on the
+    first record, writes the buffer every ``flush_interval`` seconds, or
+    sooner once ``batch_size`` records are waiting. Call ``flush`` to write
+    synchronously, e.g. in tests or before exiting.
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 5.0,
+                 max_buffer: int = 10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._buffer = deque(maxlen=max_buffer)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def record(self, **fields) -> None:
+        """Buffer one ``LLMCall`` given as field values."""
+        fields.setdefault("created_at", timezone.now())
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(fields)
+            pending = len(self._buffer)
+            if self._thread is None and not self._stopped.is_set():
+                self._start()
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self) -> int:
+        """Write every buffered record; return how many were written."""
+        with self._lock:
+            records = list(self._buffer)
+            self._buffer.clear()
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            logger.warning(f"Telemetry buffer full, dropped {dropped} LLM call record(s)")
+        if not records:
+            return 0
+        try:
+            LLMCall.objects.bulk_create(
+                [LLMCall(**fields) for fields in records], batch_size=self.batch_size
+            )
+        except Exception as exc:
+            logger.error(f"Could not write {len(records)} LLM call record(s): {exc}")
+            return 0
+        return len(records)
+
+    def stop(self) -> None:
+        """Stop the background thread after a final flush."""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    # -- Private helpers --------------------------------------------------
+
+    def _start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name="ai-telemetry", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+
+def get_telemetry() -> TelemetryRecorder:
+    """Return the process-wide recorder configured in settings."""
+    global _recorder
+
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                options = telemetry_settings()
+                _recorder = TelemetryRecorder(
+                    batch_size=options["BATCH_SIZE"],
+                    flush_interval=options["FLUSH_INTERVAL"],
+                    max_buffer=options["MAX_BUFFER"],
+                )
+                atexit.register(_recorder.stop)
+    return _recorder
+
+
+def reset_telemetry() -> None:
+    """Stop the process-wide recorder, writing what it holds."""
+    global _recorder
+
+    with _recorder_lock:
+        recorder, _recorder = _recorder, None
+    if recorder is not None:
+        atexit.unregister(recorder.stop)
+        recorder.stop()
+
+
+def record_call(**fields) -> None:
+    """Buffer an ``LLMCall`` record unless telemetry is disabled."""
+    if telemetry_settings()["ENABLED"]:
+        get_telemetry().record(**fields)
+
+
+def summarize_calls(days: int = 7, provider: str = None) -> dict:
+    """Aggregate the LLM calls of the last ``days`` days.
+
+    Returns:
+        A dict with ``since``, the overall ``totals``, one row per provider
+        and model in ``providers`` (with latency percentiles of successful
+        calls) and one row per day in ``daily`` (calls and tokens).
+    """
+    since = timezone.now() - timedelta(days=days)
+    calls = LLMCall.objects.filter(created_at__gte=since)
+    if provider:
+        calls = calls.filter(provider=provider)
+
+    aggregates = {
+        "calls": Count("id"),
+        "failed": Count("id", filter=Q(outcome=FAILED)),
+        "cache_hits": Count("id", filter=Q(outcome=CACHE_HIT)),
+        "retries": Count("id", filter=Q(attempt__gt=1)),
+        "prompt_tokens": Sum("prompt_tokens"),
+        "completion_tokens": Sum("completion_tokens"),
+        "avg_latency_ms": Avg("latency_ms", filter=Q(outcome=SUCCESS)),
+        "max_latency_ms": Max("latency_ms", filter=Q(outcome=SUCCESS)),
+        "succeeded": Count("id", filter=Q(outcome=SUCCESS)),
+    }
+    totals = calls.aggregate(**aggregates)
+
+    providers = list(
+        calls.values("provider", "model").annotate(**aggregates).order_by("provider", "model")
+    )
+    successful = calls.filter(outcome=SUCCESS)
+    for row in providers:
+        row.update(_latency_percentiles(
+            successful.filter(provider=row["provider"], model=row["model"]), row["succeeded"]
+        ))
+
+    daily = list(
+        calls.annotate(day=TruncDate("created_at"))
+        .values("day")
+        .annotate(
+            calls=Count("id"),
+            prompt_tokens=Sum("prompt_tokens"),
+            completion_tokens=Sum("completion_tokens"),
+        )
+        .order_by("day")
+    )
+    for row in [totals, *providers, *daily]:
+        row["prompt_tokens"] = row["prompt_tokens"] or 0
+        row["completion_tokens"] = row["completion_tokens"] or 0
+        row["total_tokens"] = row["prompt_tokens"] + row["completion_tokens"]
+
+    totals.update(_latency_percentiles(successful, totals["succeeded"]))
+    return {"since": since, "totals": totals, "providers": providers, "daily": daily}
+
+
+def _latency_percentiles(calls, count: int) -> dict:
+    """Nearest-rank latency percentiles of ``count`` calls, None without any.
+
+    Each percentile is the one row at its rank in latency order, read by
+    the database, so no latencies are loaded into memory.
+    """
+    if not count:
+        return {f"p{q}_ms": None for q in PERCENTILES}
+    ordered = calls.order_by("latency_ms").values_list("latency_ms", flat=True)
+    percentiles = {}
+    for q in PERCENTILES:
+        # Rank ceil(q * count / 100), from 1; None if rows went away meanwhile
+        index = max((q * count + 99) // 100 - 1, 0)
+        percentiles[f"p{q}_ms"] = next(iter(ordered[index:index + 1]), None)
+    return percentiles
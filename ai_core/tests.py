@@ -1,3 +1,1592 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ai_core.services import (
+    BaseLLMService,
+    DocumentService,
+    GeminiService,
+    LessonService,
+    QuizGenerationError,
+    QuizImportError,
+    QuizImportService,
+    QuizService,
+    get_llm_service,
+    register_provider,
+    reset_llm_services,
+)
+from ai_core.benchmark import percentile, run_load
+from ai_core.models import (
+    CACHE_HIT,
+    CANCELLED,
+    FAILED,
+    PENDING,
+    PROCESSING,
+    SUCCESS,
+    AIGeneration,
+    DocumentChunk,
+    LLMCall,
+)
+from ai_core.services.budget import (
+    TokenUsage,
+    compact_text,
+    fit_to_budget,
+    html_to_text,
+    truncate_to_tokens,
+)
+from ai_core.services.cache import (
+    LRUResponseCache,
+    SQLiteResponseCache,
+    make_cache_key,
+)
+from ai_core.services.chunking import chunk_pages, count_tokens
+from ai_core.services.embeddings import HashingEmbedder
+from ai_core.services.fake import FakeLLMService, FakeProviderError
+from ai_core.services.extraction import (
+    UnsupportedDocumentError,
+    extract_docx,
+    extract_pdf,
+    extract_pptx,
+    extract_text,
+    get_extractor,
+)
+from ai_core.services.jsonstream import JSONArrayStreamParser
+from ai_core.services.limiter import ProviderCallLimiter, reset_call_limiter
+from ai_core.services.resilient import (
+    Backend,
+    CircuitBreaker,
+    ProviderUnavailableError,
+    ResilientLLMService,
+    TokenBucket,
+)
+from ai_core.services.retrieval import Retriever, VectorIndex, top_k
+from ai_core.services.telemetry import TelemetryRecorder, summarize_calls
+from ai_core.uploads import file_digest
+from ai_core.worker import (
+    GenerationWorker,
+    LeaseHeartbeat,
+    claim_generations,
+    process_generation,
+    renew_lease,
+)
+from course.models import Course, CourseAllocation, Program
+from quiz.models import Choice, MCQuestion, Question, Quiz
+from quiz.utils import question_hash
+
+# The telemetry writer thread would write to the test database behind the
+# tests' backs; TelemetryTests enable it where needed.
+_telemetry_off = override_settings(AI_TELEMETRY={"ENABLED": False})
+
+
+def setUpModule():
+    _telemetry_off.enable()
+
+
+def tearDownModule():
+    _telemetry_off.disable()
+
+
+class EchoChatModel:
+    """Minimal stand-in for a LangChain chat model."""
+
+    model = "echo-1"
+    temperature = 0.7
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        return SimpleNamespace(content=f"echo: {messages[-1].content}")
+
+    def stream(self, messages):
+        self.calls += 1
+        for word in f"echo: {messages[-1].content}".split(" "):
+            yield SimpleNamespace(content=word + " ")
+
+    async def ainvoke(self, messages):
+        return self.invoke(messages)
+
+    async def astream(self, messages):
+        for chunk in self.stream(messages):
+            yield chunk
+
+
+class EchoLLMService(BaseLLMService):
+    """Provider stub that counts how often it is constructed."""
+
+    provider = "echo"
+    builds = 0
+
+    def _build_llm(self):
+        EchoLLMService.builds += 1
+        return EchoChatModel()
+
+
+class BrokenChatModel(EchoChatModel):
+    def invoke(self, messages):
+        raise ConnectionError("provider down")
+
+
+class BrokenLLMService(BaseLLMService):
+    """Provider stub whose every call fails."""
+
+    def _build_llm(self):
+        return BrokenChatModel()
+
+
+class ProviderRegistryTests(SimpleTestCase):
+    def setUp(self):
+        EchoLLMService.builds = 0
+        register_provider("echo", EchoLLMService)
+        self.addCleanup(reset_llm_services)
+
+    def test_same_instance_is_reused(self):
+        first = get_llm_service("echo")
+        second = get_llm_service("echo")
+        self.assertIs(first, second)
+        self.assertEqual(EchoLLMService.builds, 1)
+
+    def test_reset_forces_rebuild(self):
+        first = get_llm_service("echo")
+        reset_llm_services()
+        self.assertIsNot(get_llm_service("echo"), first)
+        self.assertEqual(EchoLLMService.builds, 2)
+
+    def test_concurrent_first_use_builds_once(self):
+        barrier = threading.Barrier(8)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(get_llm_service("echo"))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(EchoLLMService.builds, 1)
+        self.assertTrue(all(r is results[0] for r in results))
+
+    def test_unknown_provider(self):
+        with self.assertRaises(KeyError):
+            get_llm_service("missing")
+
+    def test_register_rejects_non_services(self):
+        with self.assertRaises(TypeError):
+            register_provider("bad", object)
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.service = EchoLLMService()
+        self.service.cache = LRUResponseCache(ttl=60, max_entries=8)
+
+    def test_repeat_request_is_served_from_cache(self):
+        first = self.service.chat("hello", system_prompt="sys")
+        second = self.service.chat("hello", system_prompt="sys")
+        self.assertEqual(first, second)
+        self.assertEqual(self.service.llm.calls, 1)
+        self.assertEqual(self.service.cache.stats()["hits"], 1)
+        self.assertEqual(self.service.cache.stats()["misses"], 1)
+
+    def test_bypass_flag_calls_provider(self):
+        LessonService(self.service).generate("Graphs")
+        LessonService(self.service).generate("Graphs", use_cache=False)
+        self.assertEqual(self.service.llm.calls, 2)
+
+    def test_key_depends_on_generation_params(self):
+        base = make_cache_key("echo", "m", "sys", "msg", {"temperature": 0.7})
+        self.assertNotEqual(
+            base, make_cache_key("echo", "m", "sys", "msg", {"temperature": 0.2})
+        )
+        self.assertNotEqual(base, make_cache_key("echo", "m", "", "msg", {"temperature": 0.7}))
+
+    def test_lru_eviction_and_expiry(self):
+        cache = LRUResponseCache(ttl=60, max_entries=2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.get("a")
+        cache.set("c", "3")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "1")
+
+        cache = LRUResponseCache(ttl=1, max_entries=2)
+        cache.set("a", "1")
+        cache._data["a"] = ("1", time.time() - 1)
+        self.assertIsNone(cache.get("a"))
+
+    def test_sqlite_backend_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = SQLiteResponseCache(
+                location=os.path.join(tmp, "cache.sqlite3"), ttl=60, max_entries=2
+            )
+            cache.set("a", "1")
+            cache.set("b", "2")
+            cache.set("c", "3")
+            self.assertEqual(cache.get("c"), "3")
+            self.assertIsNone(cache.get("a"))
+            cache.delete("c")
+            self.assertIsNone(cache.get("c"))
+            cache._conn.close()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class GenerationWorkerTests(TestCase):
+    def setUp(self):
+        register_provider("echo", EchoLLMService)
+        register_provider("broken", BrokenLLMService)
+        self.addCleanup(reset_llm_services)
+        self.generation = AIGeneration.objects.create(
+            document_file=ContentFile(b"Binary search halves the range.", name="search.txt"),
+            prompt="Goal: summarize",
+        )
+
+    def test_claim_is_exclusive(self):
+        claimed = claim_generations(limit=5, visibility_timeout=60)
+        self.assertEqual([g.pk for g in claimed], [self.generation.pk])
+        self.assertEqual(claimed[0].status, PROCESSING)
+        self.assertEqual(claimed[0].attempts, 1)
+        self.assertEqual(claim_generations(limit=5, visibility_timeout=60), [])
+
+    def test_success_stores_content(self):
+        generation = claim_generations(limit=1, visibility_timeout=60)[0]
+        self.assertEqual(process_generation(generation, "echo"), SUCCESS)
+        self.generation.refresh_from_db()
+        self.assertEqual(self.generation.status, SUCCESS)
+        self.assertIn("Binary search halves the range.", self.generation.html_content)
+        self.assertIsNone(self.generation.claim_token)
+
+    def test_failure_is_retried_with_backoff_then_failed(self):
+        generation = claim_generations(limit=1, visibility_timeout=60, max_attempts=2)[0]
+        self.assertEqual(
+            process_generation(generation, "broken", max_attempts=2, retry_backoff=30),
+            PENDING,
+        )
+        self.generation.refresh_from_db()
+        self.assertGreater(self.generation.available_at, timezone.now())
+        self.assertEqual(claim_generations(limit=1, visibility_timeout=60), [])
+
+        AIGeneration.objects.update(available_at=timezone.now())
+        generation = claim_generations(limit=1, visibility_timeout=60, max_attempts=2)[0]
+        self.assertEqual(
+            process_generation(generation, "broken", max_attempts=2), FAILED
+        )
+        self.generation.refresh_from_db()
+        self.assertEqual(self.generation.error_message, "provider down")
+
+    def test_expired_lease_is_reclaimed(self):
+        claim_generations(limit=1, visibility_timeout=60)
+        AIGeneration.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        reclaimed = claim_generations(limit=1, visibility_timeout=60)
+        self.assertEqual(reclaimed[0].attempts, 2)
+
+    def test_stale_lease_cannot_overwrite_new_owner(self):
+        stale = claim_generations(limit=1, visibility_timeout=60)[0]
+        AIGeneration.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        claim_generations(limit=1, visibility_timeout=60)
+        process_generation(stale, "echo")
+        self.generation.refresh_from_db()
+        self.assertEqual(self.generation.status, PROCESSING)
+
+    def test_lease_is_renewed_while_processing(self):
+        generation = claim_generations(limit=1, visibility_timeout=60)[0]
+        AIGeneration.objects.update(locked_until=timezone.now() + timedelta(seconds=1))
+        self.assertTrue(renew_lease(generation, 60))
+        self.generation.refresh_from_db()
+        self.assertGreater(self.generation.locked_until, timezone.now() + timedelta(seconds=30))
+
+        beats = threading.Semaphore(0)
+
+        def beat(*args):
+            beats.release()
+            return True
+
+        with mock.patch("ai_core.worker.renew_lease", side_effect=beat):
+            with LeaseHeartbeat(generation, 60, interval=0.01):
+                self.assertTrue(beats.acquire(timeout=2))
+                self.assertTrue(beats.acquire(timeout=2))
+
+        # Another worker took the row: the lease is no longer ours
+        AIGeneration.objects.update(claim_token="other")
+        self.assertFalse(renew_lease(generation, 60))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class GenerationWorkerRunTests(TransactionTestCase):
+    def setUp(self):
+        register_provider("echo", EchoLLMService)
+        self.addCleanup(reset_llm_services)
+
+    def test_run_once_drains_queue_concurrently(self):
+        for i in range(5):
+            AIGeneration.objects.create(
+                document_file=ContentFile(b"text", name=f"doc{i}.txt")
+            )
+        # SQLite's shared in-memory test database fails concurrent writes with
+        # "table is locked" instead of waiting, so serialise database access.
+        db_lock = threading.Lock()
+
+        def serialised(func):
+            def wrapper(*args, **kwargs):
+                with db_lock:
+                    return func(*args, **kwargs)
+            return wrapper
+
+        with mock.patch("ai_core.worker.claim_generations", serialised(claim_generations)), \
+                mock.patch("ai_core.worker.process_generation", serialised(process_generation)):
+            worker = GenerationWorker(concurrency=2, provider="echo", poll_interval=0.01)
+            self.assertEqual(worker.run(once=True), 5)
+        self.assertEqual(AIGeneration.objects.filter(status=SUCCESS).count(), 5)
+
+
+class LessonStreamTests(TestCase):
+    def setUp(self):
+        register_provider("gemini", EchoLLMService)
+        self.addCleanup(register_provider, "gemini", GeminiService)
+        user = get_user_model().objects.create_user(username="lecturer", password="pw")
+        self.client.force_login(user)
+
+    def test_stream_chat_yields_fragments_and_caches_result(self):
+        service = EchoLLMService()
+        service.cache = LRUResponseCache()
+        fragments = list(service.stream_chat("one two three"))
+        self.assertGreater(len(fragments), 1)
+        self.assertEqual(service.chat("one two three"), "".join(fragments))
+        self.assertEqual(service.llm.calls, 1)
+
+    def test_stream_endpoint_sends_events_and_saves_lesson(self):
+        response = self.client.post(
+            "/en/ai/lesson/stream/",
+            data={"topic": "Recursion", "use_cache": False},
+            content_type="application/json",
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join(response.streaming_content).decode()
+        self.assertTrue(body.startswith("event: start\n"))
+        self.assertIn("event: done", body)
+
+        generation = AIGeneration.objects.get()
+        self.assertEqual(generation.status, SUCCESS)
+        self.assertIn("Recursion", generation.html_content)
+
+
+class SlowChatModel(EchoChatModel):
+    """Chat model that records how many calls overlap."""
+
+    def __init__(self):
+        super().__init__()
+        self.active = 0
+        self.peak = 0
+
+    async def ainvoke(self, messages):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return self.invoke(messages)
+
+
+class AsyncServiceTests(TestCase):
+    def setUp(self):
+        register_provider("gemini", EchoLLMService)
+        self.addCleanup(register_provider, "gemini", GeminiService)
+
+    def test_achat_shares_cache_with_chat(self):
+        service = EchoLLMService()
+        service.cache = LRUResponseCache()
+        first = asyncio.run(service.achat("async hello"))
+        self.assertEqual(service.chat("async hello"), first)
+        self.assertEqual(service.llm.calls, 1)
+
+    def test_astream_lesson(self):
+        service = EchoLLMService()
+        service.cache = LRUResponseCache()
+
+        async def collect():
+            return [f async for f in LessonService(service).astream("Sorting")]
+
+        self.assertIn("Sorting", "".join(asyncio.run(collect())))
+
+    def test_limiter_caps_in_flight_calls(self):
+        limiter = ProviderCallLimiter(2)
+        model = SlowChatModel()
+
+        async def call():
+            async with limiter:
+                await model.ainvoke([SimpleNamespace(content="x")])
+
+        async def run():
+            await asyncio.gather(*(call() for _ in range(6)))
+
+        asyncio.run(run())
+        self.assertEqual(model.peak, 2)
+
+    def test_waiting_coroutines_do_not_hold_executor_threads(self):
+        limiter = ProviderCallLimiter(1)
+        limiter.__enter__()  # the only slot, held by a thread
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=1))
+            waiters = [asyncio.ensure_future(limiter.__aenter__()) for _ in range(4)]
+            await asyncio.sleep(0.01)
+            # The default executor stays free for the calls holding slots
+            await asyncio.wait_for(loop.run_in_executor(None, limiter.__exit__), 1)
+            entered = await asyncio.wait_for(waiters[0], 1)
+            self.assertFalse(any(waiter.done() for waiter in waiters[1:]))
+            for waiter in waiters[1:]:
+                waiter.cancel()
+            await entered.__aexit__()
+            async with limiter:
+                pass
+
+        asyncio.run(run())
+
+    @override_settings(AI_MAX_CONCURRENT_CALLS=1)
+    def test_streams_hold_the_slot_until_they_end(self):
+        reset_call_limiter()
+        self.addCleanup(reset_call_limiter)
+        service = EchoLLMService()
+        service.cache = LRUResponseCache()
+        stream = service.stream_chat("one two three", use_cache=False)
+        self.assertEqual(next(stream), "echo: ")
+        # The provider call is still in flight; another call waits for the slot
+        done = threading.Event()
+        threading.Thread(target=lambda: (service.chat("other"), done.set())).start()
+        self.assertFalse(done.wait(0.2))
+        self.assertEqual("".join(stream), "one two three ")
+        self.assertTrue(done.wait(2))
+
+    def test_async_view_requires_login(self):
+        response = self.client.post(
+            "/en/ai/lesson/generate/", data={"topic": "Trees"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_async_views_for_logged_in_user(self):
+        user = get_user_model().objects.create_user(username="lecturer", password="pw")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get("/en/ai/quiz/generate/").status_code, 405)
+
+        response = self.client.post(
+            "/en/ai/lesson/generate/", data={"topic": "Trees", "use_cache": False},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Trees", json.loads(response.content)["content"])
+
+
+def make_docx(paragraphs):
+    ns = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+    body = "".join(f"<w:p><w:r><w:t>{p}</w:t></w:r></w:p>" for p in paragraphs)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(
+            "word/document.xml",
+            f'<w:document xmlns:w="{ns}"><w:body>{body}</w:body></w:document>',
+        )
+    buffer.seek(0)
+    return buffer
+
+
+def make_pptx(slides):
+    ns = "http://schemas.openxmlformats.org/drawingml/2006/main"
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for number, text in enumerate(slides, start=1):
+            archive.writestr(
+                f"ppt/slides/slide{number}.xml",
+                f'<p:sld xmlns:p="urn:p" xmlns:a="{ns}"><a:p><a:r><a:t>{text}</a:t>'
+                f"</a:r></a:p></p:sld>",
+            )
+    buffer.seek(0)
+    return buffer
+
+
+class ExtractionTests(SimpleTestCase):
+    def test_docx_paragraphs(self):
+        pages = list(extract_docx(make_docx(["Intro", "Body text"])))
+        self.assertEqual(pages, [(1, "Intro\nBody text")])
+
+    def test_pptx_slides_in_numeric_order(self):
+        slides = [f"Slide {i}" for i in range(1, 12)]
+        pages = list(extract_pptx(make_pptx(slides)))
+        self.assertEqual([text for _, text in pages], slides)
+
+    def test_pdf_pages(self):
+        from reportlab.pdfgen import canvas
+
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer)
+        for text in ("First page", "Second page"):
+            pdf.drawString(72, 720, text)
+            pdf.showPage()
+        pdf.save()
+        buffer.seek(0)
+        pages = list(extract_pdf(buffer))
+        self.assertEqual([n for n, _ in pages], [1, 2])
+        self.assertIn("Second page", pages[1][1])
+
+    def test_text_blocks_do_not_split_lines(self):
+        line = "é" * 1000 + "\n"
+        text = "".join(text for _, text in extract_text(io.BytesIO((line * 200).encode())))
+        self.assertEqual(text.count("é"), 200 * 1000)
+
+    def test_unknown_extension(self):
+        with self.assertRaises(UnsupportedDocumentError):
+            get_extractor("slides.key")
+
+
+class ChunkingTests(SimpleTestCase):
+    def test_chunks_are_bounded_and_overlap(self):
+        pages = [(1, " ".join(f"a{i}" for i in range(30))), (2, " ".join(f"b{i}" for i in range(30)))]
+        chunks = list(chunk_pages(pages, max_tokens=20, overlap_tokens=5))
+        self.assertTrue(all(c.token_count <= 20 for c in chunks))
+        self.assertEqual(chunks[1].text.split()[:5], chunks[0].text.split()[-5:])
+        self.assertEqual((chunks[0].page_start, chunks[-1].page_end), (1, 2))
+        self.assertEqual([c.index for c in chunks], list(range(len(chunks))))
+
+    def test_count_tokens(self):
+        self.assertEqual(count_tokens("Hello, world!"), 4)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    AI_CHUNKING={"MAX_TOKENS": 50, "OVERLAP_TOKENS": 10, "CONTEXT_MAX_TOKENS": 100},
+)
+class DocumentIngestTests(TestCase):
+    def test_ingest_stores_chunks_and_stats(self):
+        generation = AIGeneration.objects.create(
+            document_file=ContentFile(make_docx(["word " * 40] * 5).read(), name="pack.docx")
+        )
+        service = DocumentService(EchoLLMService())
+        stats = service.ingest(generation)
+
+        chunks = DocumentChunk.objects.filter(generation=generation)
+        self.assertEqual(stats["chunk"]["chunks"], chunks.count())
+        self.assertGreater(chunks.count(), 1)
+        self.assertEqual(stats["extract"]["bytes_in"], generation.document_file.size)
+        generation.refresh_from_db()
+        self.assertEqual(generation.pipeline_stats["store"]["rows"], chunks.count())
+
+        # Re-ingesting replaces the previous chunks and respects the budget
+        service.ingest(generation)
+        self.assertEqual(DocumentChunk.objects.count(), chunks.count())
+        self.assertLessEqual(count_tokens(service.build_context(generation)), 100)
+
+
+class RecordingChatModel(EchoChatModel):
+    def invoke(self, messages):
+        self.last_message = messages[-1].content
+        return super().invoke(messages)
+
+
+class RecordingLLMService(EchoLLMService):
+    def _build_llm(self):
+        return RecordingChatModel()
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    AI_RETRIEVAL={"INDEX_DIR": tempfile.mkdtemp(), "TOP_K": 2},
+)
+class RetrievalTests(TestCase):
+    def setUp(self):
+        program = Program.objects.create(title="Computer Science")
+        self.course = Course.objects.create(
+            title="Algorithms", code="CS301", credit=3, program=program,
+            level="Bachelor", semester="First",
+        )
+        self.embedder = HashingEmbedder(dimension=256)
+
+    def test_hashing_embedder_is_deterministic_and_normalised(self):
+        vectors = self.embedder.embed(["binary search tree", "binary search tree"])
+        self.assertTrue((vectors[0] == vectors[1]).all())
+        self.assertAlmostEqual(float(vectors[0] @ vectors[0]), 1.0, places=5)
+
+    def test_top_k_orders_by_score(self):
+        docs = ["heap sort priority queue", "binary search tree", "graph shortest path"]
+        rows, _ = top_k(self.embedder.embed(docs), self.embedder.embed_query("search tree"), 2)
+        self.assertEqual(rows[0], 1)
+        self.assertEqual(len(rows), 2)
+
+    def test_index_replaces_rows_of_same_document(self):
+        index = VectorIndex.for_course(self.course.pk, embedder=self.embedder)
+        index.add_generation(1, [(10, "heap sort"), (11, "merge sort")])
+        index.add_generation(2, [(20, "dijkstra shortest path")])
+        index.add_generation(1, [(12, "quick sort")])
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.search("shortest path", k=1)[0][0], 20)
+        index.remove_generation(2)
+        self.assertEqual([c for c, _ in index.search("sort", k=5)], [12])
+
+    def test_lesson_prompt_gets_relevant_course_chunks(self):
+        generation = AIGeneration.objects.create(course=self.course, topic="notes")
+        chunks = [
+            DocumentChunk.objects.create(
+                generation=generation, index=i, text=text, token_count=count_tokens(text)
+            )
+            for i, text in enumerate(
+                ["Dijkstra finds shortest paths in weighted graphs.",
+                 "Heaps support priority queue operations.",
+                 "Merge sort divides the array in halves."]
+            )
+        ]
+        index = VectorIndex.for_course(self.course.pk, embedder=self.embedder)
+        index.add_generation(generation.pk, [(c.pk, c.text) for c in chunks])
+
+        llm = RecordingLLMService()
+        llm.cache = LRUResponseCache()
+        retriever = Retriever(index, k=1)
+        LessonService(llm, retriever=retriever).generate("Shortest paths in graphs")
+        self.assertIn("Dijkstra", llm.llm.last_message)
+        self.assertNotIn("Merge sort", llm.llm.last_message)
+
+    @override_settings(AI_CHUNKING={"MAX_TOKENS": 13, "OVERLAP_TOKENS": 0, "CONTEXT_MAX_TOKENS": 13})
+    def test_document_context_keeps_most_relevant_chunks(self):
+        text = (
+            "Heaps keep the smallest element on top of the tree structure always. "
+            "Dijkstra uses a priority queue to find shortest paths in graphs quickly. "
+            "Sorting networks compare and swap fixed pairs of elements in parallel."
+        )
+        generation = AIGeneration.objects.create(
+            course=self.course,
+            document_file=ContentFile(text.encode(), name="notes.txt"),
+        )
+        service = DocumentService(EchoLLMService())
+        service.ingest(generation)
+        self.assertEqual(len(VectorIndex.for_course(self.course.pk)), generation.chunks.count())
+        context = service.build_context(generation, query="shortest paths Dijkstra")
+        self.assertIn("Dijkstra", context)
+        self.assertNotIn("Heaps", context)
+        self.assertNotIn("Sorting networks", context)
+
+
+def make_questions(count, prefix="Question"):
+    return [
+        {
+            "q": f"{prefix} {i + 1}?",
+            "options": ["alpha", "beta", "gamma", "delta"],
+            "correct": i % 4,
+            "explain": "Because.",
+        }
+        for i in range(count)
+    ]
+
+
+class QuizChatModel(EchoChatModel):
+    """Answers every prompt with a valid quiz and reports token usage."""
+
+    def invoke(self, messages):
+        self.calls += 1
+        self.last_message = messages[-1].content
+        return SimpleNamespace(
+            content=json.dumps(make_questions(3)),
+            usage_metadata={"input_tokens": 120, "output_tokens": 80},
+        )
+
+
+class QuizLLMService(EchoLLMService):
+    def _build_llm(self):
+        return QuizChatModel()
+
+
+class TokenBudgetTests(SimpleTestCase):
+    def test_html_to_text_keeps_visible_blocks_and_cells(self):
+        html = (
+            "<style>p { color: red }</style><h2>Sorting</h2>"
+            "<p>Merge&nbsp;sort is <strong>stable</strong>.</p>"
+            "<table><tr><th>Algo</th><th>Cost</th></tr>"
+            "<tr><td>merge</td><td>n log n</td></tr></table>"
+            "<script>alert(1)</script>"
+        )
+        text = compact_text(html_to_text(html))
+        self.assertEqual(
+            text.splitlines(),
+            ["Sorting", "Merge sort is stable.", "Algo | Cost", "merge | n log n"],
+        )
+
+    def test_compact_text_drops_repeated_and_decorative_lines(self):
+        text = "Course notes\n-----\nHeaps.\n\n  Course   notes \nGraphs."
+        self.assertEqual(compact_text(text), "Course notes\nHeaps.\nGraphs.")
+
+    def test_truncate_stops_at_sentence_boundary(self):
+        text = "One two three. Four five six. Seven eight nine."
+        self.assertEqual(truncate_to_tokens(text, 9), "One two three. Four five six.")
+        self.assertEqual(truncate_to_tokens(text, 100), text)
+
+    def test_truncate_cuts_single_long_sentence(self):
+        self.assertEqual(truncate_to_tokens("a b c d e f", 3), "a b c")
+
+    def test_fit_to_budget_respects_limit(self):
+        html = "".join(f"<p>Paragraph {i} explains topic {i} in detail.</p>" for i in range(200))
+        self.assertLessEqual(count_tokens(fit_to_budget(html, 50)), 50)
+
+    def test_usage_totals(self):
+        usage = TokenUsage()
+        usage.add(10, 5)
+        usage.add(3, 2, estimated=True)
+        usage.add_cached()
+        self.assertEqual(
+            usage.as_dict(),
+            {"prompt_tokens": 13, "completion_tokens": 7, "calls": 2,
+             "cached_calls": 1, "estimated": True, "total_tokens": 20},
+        )
+
+
+class QuizBudgetTests(SimpleTestCase):
+    def setUp(self):
+        self.llm = QuizLLMService()
+        self.llm.cache = LRUResponseCache()
+
+    def test_prompt_is_compacted_and_usage_reported(self):
+        lesson = "<div><p>Intro</p>" + "<p>Filler sentence here.</p>" * 50 + "</div>"
+        lesson += "".join(f"<p>Fact {i} about heaps.</p>" for i in range(500))
+        service = QuizService(self.llm, max_content_tokens=100)
+        self.assertEqual(len(service.generate(lesson, num_questions=3)), 3)
+
+        prompt = self.llm.llm.last_message
+        self.assertNotIn("<p>", prompt)
+        self.assertEqual(prompt.count("Filler sentence here."), 1)
+        self.assertLess(count_tokens(prompt), 200)
+        self.assertEqual(service.usage.prompt_tokens, 120)
+        self.assertEqual(service.usage.completion_tokens, 80)
+        self.assertFalse(service.usage.estimated)
+
+    def test_usage_is_estimated_without_provider_counts(self):
+        usage = TokenUsage()
+        llm = EchoLLMService()
+        llm.cache = LRUResponseCache()
+        llm.chat("three little words", usage=usage)
+        llm.chat("three little words", usage=usage)
+        self.assertEqual(usage.calls, 1)
+        self.assertEqual(usage.cached_calls, 1)
+        self.assertEqual(usage.prompt_tokens, 3)
+        self.assertEqual(usage.completion_tokens, 5)
+        self.assertTrue(usage.estimated)
+
+
+class BatchQuizChatModel(EchoChatModel):
+    """Answers batch prompts per lesson id; ids in ``broken`` fail once."""
+
+    def __init__(self):
+        super().__init__()
+        self.prompts = []
+        self.broken = set()
+
+    def invoke(self, messages):
+        self.calls += 1
+        prompt = messages[-1].content
+        self.prompts.append(prompt)
+        keys = re.findall(r"=== LESSON (L\d+) ===", prompt)
+        answer = {}
+        for key in keys:
+            if key in self.broken:
+                self.broken.discard(key)
+                answer[key] = [{"q": "incomplete"}]
+            else:
+                answer[key] = make_questions(2, prefix=key)
+        return SimpleNamespace(content="```json\n" + json.dumps(answer) + "\n```")
+
+
+class BatchQuizLLMService(EchoLLMService):
+    def _build_llm(self):
+        return BatchQuizChatModel()
+
+
+@override_settings(AI_TOKEN_BUDGET={"QUIZ_BATCH_MAX_LESSONS": 10})
+class QuizBatchTests(TestCase):
+    def setUp(self):
+        self.llm = BatchQuizLLMService()
+        self.llm.cache = LRUResponseCache()
+
+    def test_lessons_are_packed_and_demultiplexed_in_order(self):
+        lessons = [f"<p>Lesson {i} content.</p>" for i in range(25)]
+        service = QuizService(self.llm)
+        results = service.generate_batch(lessons, num_questions=2)
+
+        self.assertEqual(self.llm.llm.calls, 3)
+        self.assertEqual(len(results), 25)
+        for i, result in enumerate(results):
+            self.assertEqual(result["questions"][0]["q"], f"L{i + 1} 1?")
+        self.assertEqual(service.usage.calls, 3)
+
+    def test_only_failed_lessons_are_retried(self):
+        self.llm.llm.broken = {"L2"}
+        results = QuizService(self.llm).generate_batch(["one", "two", "three"])
+
+        self.assertEqual(self.llm.llm.calls, 2)
+        retry_prompt = self.llm.llm.prompts[-1]
+        self.assertEqual(re.findall(r"=== LESSON (L\d+) ===", retry_prompt), ["L2"])
+        self.assertTrue(all("questions" in result for result in results))
+
+    def test_lessons_failing_every_round_report_errors(self):
+        self.llm.llm.broken = {"L1"}
+        service = QuizService(self.llm)
+        with mock.patch("ai_core.services.quiz.MAX_RETRIES", 1):
+            results = service.generate_batch(["one", "two"])
+        self.assertIn("L1", results[0]["error"])
+        self.assertIn("questions", results[1])
+
+    @override_settings(AI_TOKEN_BUDGET={"QUIZ_BATCH_MAX_TOKENS": 10})
+    def test_batches_respect_token_budget(self):
+        lessons = ["word " * 6, "word " * 6, "word " * 3]
+        QuizService(self.llm).generate_batch(lessons)
+        self.assertEqual(self.llm.llm.calls, 2)
+
+    def test_async_batch_endpoint(self):
+        register_provider("gemini", BatchQuizLLMService)
+        self.addCleanup(register_provider, "gemini", GeminiService)
+        self.addCleanup(reset_llm_services)
+        user = get_user_model().objects.create_user(username="lecturer", password="pw")
+        self.client.force_login(user)
+
+        response = self.client.post(
+            "/en/ai/quiz/generate-batch/",
+            data={"lessons": ["alpha", "beta"], "num_questions": 2, "use_cache": False},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload["count"], 2)
+        self.assertEqual(payload["failed"], 0)
+        self.assertEqual(payload["usage"]["calls"], 1)
+
+        response = self.client.post(
+            "/en/ai/quiz/generate-batch/", data={"lessons": []},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class FakeProviderTests(SimpleTestCase):
+    def make(self, **options):
+        llm = FakeLLMService(latency=0, **options)
+        llm.cache = LRUResponseCache()
+        return llm
+
+    def test_answers_match_the_requested_shapes(self):
+        llm = self.make()
+        questions = QuizService(llm).generate("<p>Heaps</p>", num_questions=4)
+        self.assertEqual(len(questions), 4)
+        self.assertIn("<h2>Recursion</h2>", LessonService(llm).generate("Recursion"))
+        results = QuizService(llm).generate_batch(["one", "two"], num_questions=2)
+        self.assertEqual([len(r["questions"]) for r in results], [2, 2])
+
+    def test_same_seed_gives_same_answers(self):
+        first = self.make(seed=7).chat("Create a detailed lesson on the topic: Graphs")
+        second = self.make(seed=7).chat("Create a detailed lesson on the topic: Graphs")
+        third = self.make(seed=8).chat("Create a detailed lesson on the topic: Graphs")
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
+
+    def test_failures_are_injected(self):
+        with self.assertRaises(FakeProviderError):
+            self.make(failure_rate=1.0).chat("hello")
+
+    def test_malformed_json_is_injected(self):
+        llm = self.make(malformed_rate=1.0)
+        outcomes = set()
+        for i in range(20):
+            raw = llm.chat(f"Based on the lesson content below, create exactly 2 questions {i}",
+                           system_prompt="multiple-choice")
+            try:
+                QuizService._parse_response(raw)
+                outcomes.add("recovered")
+            except json.JSONDecodeError:
+                outcomes.add("rejected")
+        self.assertEqual(outcomes, {"recovered", "rejected"})
+
+    def test_stream_reports_usage(self):
+        usage = TokenUsage()
+        llm = self.make(token_rate=100000)
+        html = "".join(llm.stream_chat("topic: Trees", usage=usage))
+        self.assertTrue(html.startswith("<h2>Trees</h2>"))
+        self.assertEqual(usage.completion_tokens, count_tokens(html))
+        self.assertFalse(usage.estimated)
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_run_load_counts_errors(self):
+        def task(i):
+            if i % 2:
+                raise ValueError("odd")
+
+        result = run_load(task, requests=10, concurrency=4)
+        self.assertEqual(result["errors"], 5)
+        self.assertEqual(result["error_types"], {"ValueError": 5})
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BenchmarkCommandTests(TransactionTestCase):
+    def test_command_reports_every_scenario(self):
+        out = io.StringIO()
+        call_command(
+            "benchmark_ai", "--requests", "3", "--concurrency", "1",
+            "--latency", "0", "--json", stdout=out,
+        )
+        results = json.loads(out.getvalue())
+        self.assertEqual(sorted(results), ["lesson", "quiz", "upload"])
+        for result in results.values():
+            self.assertEqual(result["errors"], 0)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+        self.assertFalse(AIGeneration.objects.exists())
+
+    def test_latency_budget_fails_the_command(self):
+        with self.assertRaises(CommandError):
+            call_command(
+                "benchmark_ai", "--scenario", "lesson", "--requests", "2",
+                "--latency", "0.02", "--max-p95", "1", stdout=io.StringIO(),
+            )
+
+
+class StallingLLMService(EchoLLMService):
+    """Provider stub whose calls take far longer than any timeout."""
+
+    def _build_llm(self):
+        model = EchoChatModel()
+        original = model.invoke
+
+        def invoke(messages):
+            time.sleep(0.5)
+            return original(messages)
+
+        async def ainvoke(messages):
+            await asyncio.sleep(0.5)
+            return original(messages)
+
+        model.invoke, model.ainvoke = invoke, ainvoke
+        return model
+
+
+class ResilientProviderTests(SimpleTestCase):
+    def setUp(self):
+        register_provider("echo", EchoLLMService)
+        register_provider("broken", BrokenLLMService)
+        register_provider("stalling", StallingLLMService)
+        self.addCleanup(reset_llm_services)
+
+    def make(self, *backends):
+        llm = ResilientLLMService(list(backends))
+        llm.cache = LRUResponseCache()
+        return llm
+
+    def test_token_bucket_allows_burst_then_limits(self):
+        bucket = TokenBucket(rate=10, capacity=3)
+        self.assertTrue(all(bucket.acquire() for _ in range(3)))
+        self.assertFalse(bucket.acquire())
+        self.assertTrue(bucket.acquire(timeout=0.5))
+        self.assertTrue(all(TokenBucket().acquire() for _ in range(100)))
+
+    def test_circuit_opens_and_half_opens(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # only one trial at a time
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_fails_over_in_order(self):
+        llm = self.make(Backend("broken"), Backend("echo"))
+        self.assertEqual(llm.chat("hi"), "echo: hi")
+
+    def test_open_circuit_skips_backend(self):
+        broken = Backend("broken", failure_threshold=1, reset_timeout=60)
+        llm = self.make(broken, Backend("echo"))
+        llm.chat("one")
+        with mock.patch.object(BrokenChatModel, "invoke") as invoke:
+            llm.chat("two")
+        invoke.assert_not_called()
+        self.assertEqual(broken.breaker.state, "open")
+
+    def test_timeout_bounds_latency(self):
+        llm = self.make(Backend("stalling", timeout=0.05), Backend("echo"))
+        started = time.monotonic()
+        self.assertEqual(llm.chat("hi"), "echo: hi")
+        self.assertLess(time.monotonic() - started, 0.4)
+
+        with self.assertRaisesMessage(ProviderUnavailableError, "stalling: ProviderTimeoutError"):
+            self.make(Backend("stalling", timeout=0.05)).chat("hi")
+
+    def test_stuck_calls_open_the_circuit(self):
+        stalling = Backend("stalling", timeout=0.02, failure_threshold=100, max_abandoned=2)
+        llm = self.make(stalling, Backend("echo"))
+        llm.chat("one", use_cache=False)
+        self.assertEqual((stalling.abandoned, stalling.breaker.state), (1, "closed"))
+        llm.chat("two", use_cache=False)
+        self.assertEqual((stalling.abandoned, stalling.breaker.state), (2, "open"))
+
+        # Skipped while open: no third thread is left stuck
+        self.assertEqual(llm.chat("three", use_cache=False), "echo: three")
+        self.assertEqual(stalling.abandoned, 2)
+        time.sleep(0.6)
+        self.assertEqual(stalling.abandoned, 0)
+
+    def test_rate_limited_backend_is_skipped(self):
+        limited = Backend("broken", rate=0.001, burst=1)
+        limited.bucket.acquire()
+        llm = self.make(limited)
+        with self.assertRaisesMessage(ProviderUnavailableError, "broken: rate limited"):
+            llm.chat("hi")
+
+    def test_stream_fails_over_before_first_chunk(self):
+        llm = self.make(Backend("broken", timeout=1), Backend("echo", timeout=1))
+        with mock.patch.object(BrokenChatModel, "stream", side_effect=ConnectionError("down")):
+            text = "".join(llm.stream_chat("hello there"))
+        self.assertEqual(text.strip(), "echo: hello there")
+
+    def test_async_timeout_fails_over(self):
+        llm = self.make(Backend("stalling", timeout=0.05), Backend("echo"))
+        self.assertEqual(asyncio.run(llm.achat("hi")), "echo: hi")
+
+        async def collect():
+            return "".join([chunk async for chunk in llm.astream_chat("streamed words")])
+
+        self.assertEqual(asyncio.run(collect()).strip(), "echo: streamed words")
+
+
+class QuizStreamChatModel(EchoChatModel):
+    """Streams a quiz of ``total`` questions in small pieces."""
+
+    def __init__(self, total=10, invalid=()):
+        super().__init__()
+        self.pieces_sent = 0
+        questions = make_questions(total)
+        for i in invalid:
+            questions[i]["correct"] = 7
+        self.content = "Here you go:\n" + json.dumps(questions)
+
+    def stream(self, messages):
+        self.calls += 1
+        for i in range(0, len(self.content), 16):
+            self.pieces_sent += 1
+            yield SimpleNamespace(content=self.content[i:i + 16])
+
+    async def astream(self, messages):
+        for chunk in self.stream(messages):
+            yield chunk
+
+
+class QuizStreamLLMService(EchoLLMService):
+    def _build_llm(self):
+        return QuizStreamChatModel()
+
+
+class QuizStreamTests(TestCase):
+    def make(self, **options):
+        llm = EchoLLMService()
+        llm.llm = QuizStreamChatModel(**options)
+        llm.cache = LRUResponseCache()
+        return llm
+
+    def test_parser_yields_elements_across_fragment_boundaries(self):
+        questions = make_questions(3)
+        text = "```json\n" + json.dumps(questions) + "\n```"
+        for size in (1, 5, len(text)):
+            parser = JSONArrayStreamParser()
+            items = []
+            for i in range(0, len(text), size):
+                items.extend(parser.feed(text[i:i + size]))
+            self.assertEqual(items, questions)
+            self.assertTrue(parser.done)
+
+    def test_parser_skips_undecodable_elements(self):
+        parser = JSONArrayStreamParser()
+        items = parser.feed('[{"a": 1}, {"a": ,}, {"b": "]}"}, {"c"')
+        self.assertEqual(items, [{"a": 1}, {"b": "]}"}])
+        self.assertEqual(len(parser.errors), 1)
+        self.assertFalse(parser.done)
+
+    def test_stream_stops_generation_once_enough_questions(self):
+        llm = self.make(total=10)
+        service = QuizService(llm)
+        questions = list(service.stream("<p>Heaps</p>", num_questions=3))
+
+        self.assertEqual([q["q"] for q in questions], ["Question 1?", "Question 2?", "Question 3?"])
+        total_pieces = -(-len(llm.llm.content) // 16)
+        self.assertLess(llm.llm.pieces_sent, total_pieces / 2)
+
+    def test_invalid_questions_are_skipped(self):
+        llm = self.make(total=4, invalid=(1,))
+        service = QuizService(llm)
+        questions = list(service.stream("<p>Heaps</p>", num_questions=4))
+
+        self.assertEqual(len(questions), 3)
+        self.assertEqual(service.rejected, 1)
+        # The incomplete answer is not served from the cache next time
+        list(QuizService(llm).stream("<p>Heaps</p>", num_questions=4))
+        self.assertEqual(llm.llm.calls, 2)
+
+    def test_async_stream(self):
+        service = QuizService(self.make(total=6))
+
+        async def collect():
+            return [q async for q in service.astream("<p>Heaps</p>", num_questions=2)]
+
+        self.assertEqual(len(asyncio.run(collect())), 2)
+
+    def test_stream_endpoint_sends_one_event_per_question(self):
+        register_provider("gemini", QuizStreamLLMService)
+        self.addCleanup(register_provider, "gemini", GeminiService)
+        self.addCleanup(reset_llm_services)
+        user = get_user_model().objects.create_user(username="lecturer", password="pw")
+        self.client.force_login(user)
+
+        response = self.client.post(
+            "/en/ai/quiz/stream/",
+            data={"lesson_content": "<p>Heaps</p>", "num_questions": 2, "use_cache": False},
+            content_type="application/json",
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join(response.streaming_content).decode()
+        events = [block for block in body.split("\n\n") if block]
+        self.assertTrue(events[0].startswith("event: start"))
+        self.assertEqual(sum(1 for e in events if e.startswith("data: ")), 2)
+        done = json.loads(events[-1].split("data: ", 1)[1])
+        self.assertEqual(done["count"], 2)
+
+
+class ScriptedChatModel(EchoChatModel):
+    """Returns the given responses in order and records every prompt."""
+
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = list(responses)
+        self.prompts = []
+
+    def invoke(self, messages):
+        self.calls += 1
+        self.prompts.append(messages[-1].content)
+        return SimpleNamespace(content=self.responses.pop(0))
+
+
+class QuizRepairTests(SimpleTestCase):
+    def make(self, *responses):
+        llm = EchoLLMService()
+        llm.llm = ScriptedChatModel(responses)
+        llm.cache = LRUResponseCache()
+        return llm
+
+    def test_only_missing_questions_are_requested(self):
+        first = make_questions(5)
+        first[2]["correct"] = 9
+        llm = self.make(json.dumps(first), json.dumps(make_questions(1, prefix="Extra")))
+        service = QuizService(llm)
+        questions = service.generate("<p>Heaps</p>", num_questions=5)
+
+        self.assertEqual(len(questions), 5)
+        self.assertEqual(questions[-1]["q"], "Extra 1?")
+        self.assertEqual(service.repair_rounds, 1)
+        self.assertEqual(service.rejected, 1)
+        repair_prompt = llm.llm.prompts[1]
+        self.assertIn("create exactly 1 multiple-choice", repair_prompt)
+        self.assertIn("- Question 4?", repair_prompt)
+        self.assertNotIn("- Question 3?", repair_prompt)
+
+    def test_repeated_questions_are_not_kept(self):
+        llm = self.make(
+            json.dumps(make_questions(2)),
+            json.dumps(make_questions(1)),  # repeats "Question 1?"
+            json.dumps(make_questions(1, prefix="Fresh")),
+        )
+        service = QuizService(llm)
+        questions = service.generate("<p>Heaps</p>", num_questions=3)
+        self.assertEqual([q["q"] for q in questions], ["Question 1?", "Question 2?", "Fresh 1?"])
+        self.assertEqual(service.repair_rounds, 2)
+
+    def test_partial_result_when_repair_rounds_run_out(self):
+        llm = self.make(*[json.dumps(make_questions(1))] * 3)
+        service = QuizService(llm)
+        questions = service.generate("<p>Heaps</p>", num_questions=4)
+        self.assertEqual(len(questions), 1)
+        self.assertEqual(llm.llm.calls, 3)
+
+    def test_unparseable_response_is_retried_whole(self):
+        llm = self.make("not json at all", json.dumps(make_questions(2)))
+        service = QuizService(llm)
+        self.assertEqual(len(service.generate("<p>Heaps</p>", num_questions=2)), 2)
+        self.assertTrue(llm.llm.prompts[1].startswith("Your previous response was not valid JSON"))
+        self.assertEqual(service.repair_rounds, 0)
+
+    def test_no_valid_questions_raises(self):
+        llm = self.make("nope", "still nope")
+        with self.assertRaises(QuizGenerationError):
+            QuizService(llm).generate("<p>Heaps</p>")
+
+    def test_async_repair(self):
+        first = make_questions(3)
+        first[0]["options"] = ["only one"]
+        llm = self.make(json.dumps(first), json.dumps(make_questions(1, prefix="Extra")))
+        service = QuizService(llm)
+        questions = asyncio.run(service.agenerate("<p>Heaps</p>", num_questions=3))
+        self.assertEqual(len(questions), 3)
+        self.assertEqual(service.repair_rounds, 1)
+
+
+class QuizImportTests(TestCase):
+    def setUp(self):
+        program = Program.objects.create(title="Computer Science")
+        self.course = Course.objects.create(
+            title="Algorithms", code="CS301", credit=3, program=program,
+            level="Bachelor", semester="First",
+        )
+
+    def test_question_hash_ignores_case_punctuation_and_spacing(self):
+        self.assertEqual(
+            question_hash("What is a  Heap?"), question_hash("what is a heap")
+        )
+        self.assertNotEqual(question_hash("What is a heap?"), question_hash("What is a tree?"))
+
+    def test_import_creates_quiz_questions_and_choices(self):
+        result = QuizImportService().import_quiz(
+            self.course, "Heaps", make_questions(3), category="practice"
+        )
+        quiz = result["quiz"]
+        self.assertEqual(result["created"], 3)
+        questions = list(quiz.get_questions())
+        self.assertEqual(len(questions), 3)
+        self.assertTrue(all(isinstance(q, MCQuestion) for q in questions))
+        first = MCQuestion.objects.get(content="Question 1?")
+        self.assertEqual(first.explanation, "Because.")
+        self.assertEqual(first.content_hash, question_hash("Question 1?"))
+        self.assertEqual(
+            [(c.choice_text, c.correct) for c in first.get_choices().order_by("id")],
+            [("alpha", True), ("beta", False), ("gamma", False), ("delta", False)],
+        )
+
+    def test_import_of_100_questions_takes_a_handful_of_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = QuizImportService().import_quiz(self.course, "Big", make_questions(100))
+        self.assertEqual(result["created"], 100)
+        self.assertEqual(Choice.objects.count(), 400)
+        self.assertEqual(result["quiz"].question_set.count(), 100)
+        self.assertLessEqual(len(queries), 15)
+
+    def test_duplicates_are_linked_from_the_bank_or_skipped(self):
+        QuizImportService().import_quiz(self.course, "First", make_questions(2))
+        repeated = make_questions(3)
+        repeated[0]["q"] = "question 1"
+        repeated.append(dict(repeated[2]))
+
+        result = QuizImportService(link_duplicates=True).import_quiz(
+            self.course, "Second", repeated
+        )
+        self.assertEqual(
+            (result["created"], result["linked"], result["skipped"]), (1, 2, 1)
+        )
+        self.assertEqual(result["duplicates"], [0, 1])
+        self.assertEqual(Question.objects.count(), 3)
+        self.assertEqual(result["quiz"].question_set.count(), 3)
+
+        result = QuizImportService().import_quiz(self.course, "Third", make_questions(3))
+        self.assertEqual((result["created"], result["linked"], result["skipped"]), (0, 0, 3))
+
+    def test_only_the_same_multiple_choice_question_is_a_duplicate(self):
+        Question.objects.create(content="Question 1?")
+        options = ["4", "0", "2", "22"]
+        QuizImportService().import_quiz(self.course, "First", [
+            {"q": "What is 2+2?", "options": options, "correct": 0},
+        ])
+        questions = [
+            {"q": "Question 1?", "options": ["alpha", "beta", "gamma", "delta"], "correct": 0},
+            {"q": "What is 2-2?", "options": options, "correct": 1},
+            {"q": "What is 2+2?", "options": options[::-1], "correct": 3},
+        ]
+        result = QuizImportService(link_duplicates=True).import_quiz(
+            self.course, "Second", questions
+        )
+        self.assertEqual((result["created"], result["linked"]), (2, 1))
+        self.assertEqual(result["duplicates"], [2])
+        self.assertEqual(
+            {q.content for q in result["quiz"].get_questions()},
+            {"Question 1?", "What is 2-2?", "What is 2+2?"},
+        )
+        self.assertEqual(MCQuestion.objects.filter(content="What is 2+2?").count(), 1)
+
+    def test_invalid_question_writes_nothing(self):
+        questions = make_questions(2)
+        questions[1]["correct"] = 7
+        with self.assertRaises(QuizImportError):
+            QuizImportService().import_quiz(self.course, "Broken", questions)
+        self.assertFalse(Quiz.objects.exists())
+        self.assertFalse(Question.objects.exists())
+
+    def test_import_endpoint_requires_course_allocation(self):
+        user = get_user_model().objects.create_user(
+            username="lecturer", password="pw", is_lecturer=True
+        )
+        self.client.force_login(user)
+        payload = {"course": self.course.pk, "title": "Heaps", "questions": make_questions(2)}
+
+        response = self.client.post(
+            "/en/ai/quiz/import/", json.dumps(payload), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 403)
+
+        allocation = CourseAllocation.objects.create(lecturer=user)
+        allocation.courses.add(self.course)
+        response = self.client.post(
+            "/en/ai/quiz/import/", json.dumps(payload), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual(body["created"], 2)
+        self.assertTrue(Quiz.objects.get(pk=body["quiz"]["id"]).draft)
+
+        payload["questions"] = [{"q": "No options"}]
+        response = self.client.post(
+            "/en/ai/quiz/import/", json.dumps(payload), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class TelemetryTests(TestCase):
+    def record(self, recorder, **fields):
+        defaults = {
+            "provider": "gemini", "model": "gemini-1.5", "caller": "quiz.generate",
+            "outcome": SUCCESS, "latency_ms": 100.0, "prompt_tokens": 10,
+            "completion_tokens": 5,
+        }
+        recorder.record(**{**defaults, **fields})
+
+    def test_recorder_buffers_until_flushed_in_one_batch(self):
+        recorder = TelemetryRecorder(batch_size=50, flush_interval=60)
+        self.addCleanup(recorder.stop)
+        for latency in range(10):
+            self.record(recorder, latency_ms=latency)
+        self.assertEqual(recorder.pending(), 10)
+        self.assertFalse(LLMCall.objects.exists())
+
+        with self.assertNumQueries(1):
+            self.assertEqual(recorder.flush(), 10)
+        self.assertEqual(LLMCall.objects.count(), 10)
+        self.assertEqual(recorder.pending(), 0)
+
+    def test_full_buffer_drops_oldest_records(self):
+        recorder = TelemetryRecorder(batch_size=50, flush_interval=60, max_buffer=3)
+        self.addCleanup(recorder.stop)
+        for caller in "abcde":
+            self.record(recorder, caller=caller)
+        self.assertEqual(recorder.flush(), 3)
+        self.assertEqual(
+            sorted(LLMCall.objects.values_list("caller", flat=True)), ["c", "d", "e"]
+        )
+
+    def test_llm_calls_are_recorded_with_outcome_and_tokens(self):
+        service = EchoLLMService()
+        service.cache = LRUResponseCache()
+        with mock.patch("ai_core.services.base.record_call") as record_call:
+            service.chat("three little words", caller="test.echo", attempt=2)
+            service.chat("three little words", caller="test.echo")
+            list(service.stream_chat("streamed words", use_cache=False))
+            with self.assertRaises(ConnectionError):
+                BrokenLLMService().chat("hello")
+
+        records = [c.kwargs for c in record_call.call_args_list]
+        self.assertEqual(
+            [(r["outcome"], r["streamed"]) for r in records],
+            [(SUCCESS, False), (CACHE_HIT, False), (SUCCESS, True), (FAILED, False)],
+        )
+        self.assertEqual(records[0]["caller"], "test.echo")
+        self.assertEqual(records[0]["attempt"], 2)
+        self.assertEqual(records[0]["prompt_tokens"], 3)
+        self.assertTrue(records[0]["tokens_estimated"])
+        self.assertEqual(records[3]["error"], "ConnectionError: provider down")
+
+    def test_abandoned_stream_is_recorded_as_cancelled(self):
+        service = EchoLLMService()
+        with mock.patch("ai_core.services.base.record_call") as record_call:
+            fragments = service.stream_chat("one two three four", use_cache=False)
+            next(fragments)
+            fragments.close()
+        self.assertEqual(record_call.call_args.kwargs["outcome"], CANCELLED)
+
+    def test_quiz_retries_carry_the_attempt_number(self):
+        llm = EchoLLMService()
+        llm.llm = ScriptedChatModel(["not json", json.dumps(make_questions(2))])
+        with mock.patch("ai_core.services.base.record_call") as record_call:
+            QuizService(llm).generate("<p>Heaps</p>", num_questions=2, use_cache=False)
+        self.assertEqual(
+            [(c.kwargs["caller"], c.kwargs["attempt"]) for c in record_call.call_args_list],
+            [("quiz.generate", 1), ("quiz.generate", 2)],
+        )
+
+    def test_summary_percentiles_and_daily_tokens(self):
+        recorder = TelemetryRecorder(flush_interval=60)
+        self.addCleanup(recorder.stop)
+        for latency in range(1, 101):
+            self.record(recorder, latency_ms=float(latency))
+        self.record(recorder, outcome=FAILED, latency_ms=5000.0, attempt=2)
+        self.record(
+            recorder, provider="fake", model="fake-1", outcome=CACHE_HIT,
+            latency_ms=1.0, prompt_tokens=0, completion_tokens=0,
+            created_at=timezone.now() - timedelta(days=1),
+        )
+        recorder.flush()
+
+        # Totals, providers and daily rows, then one row per percentile of the
+        # totals and of the provider with successful calls
+        with self.assertNumQueries(3 + 3 + 3):
+            summary = summarize_calls(days=7)
+        totals = summary["totals"]
+        self.assertEqual(
+            (totals["calls"], totals["failed"], totals["cache_hits"], totals["retries"]),
+            (102, 1, 1, 1),
+        )
+        self.assertEqual((totals["p50_ms"], totals["p95_ms"], totals["p99_ms"]), (50, 95, 99))
+        self.assertEqual(totals["total_tokens"], 101 * 15)
+        self.assertEqual([row["provider"] for row in summary["providers"]], ["fake", "gemini"])
+        self.assertEqual([row["calls"] for row in summary["daily"]], [1, 101])
+        self.assertEqual(summary["daily"][1]["prompt_tokens"], 1010)
+
+        self.assertEqual(summarize_calls(days=7, provider="fake")["totals"]["calls"], 1)
+        gemini = summary["providers"][1]
+        self.assertEqual((gemini["p50_ms"], gemini["p99_ms"]), (50, 99))
+        self.assertIsNone(summary["providers"][0]["p50_ms"])
+
+    # The manifest storage needs collectstatic, which tests do not run
+    @override_settings(
+        STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage"
+    )
+    def test_admin_dashboard(self):
+        user = get_user_model().objects.create_superuser(
+            username="admin", password="pw", email="admin@example.com"
+        )
+        self.client.force_login(user)
+        LLMCall.objects.create(
+            provider="gemini", model="gemini-1.5", outcome=SUCCESS, latency_ms=120.0,
+            prompt_tokens=7, completion_tokens=3,
+        )
+        response = self.client.get("/admin/ai_core/llmcall/dashboard/?days=3")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["summary"]["totals"]["total_tokens"], 10)
+        self.assertContains(response, "gemini-1.5")
+
+
+@override_settings(AI_RETRIEVAL={"INDEX_DIR": tempfile.mkdtemp()})
+class UploadDedupTests(TestCase):
+    def setUp(self):
+        media = override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+        media.enable()
+        self.addCleanup(media.disable)
+        register_provider("echo", EchoLLMService)
+        register_provider("broken", BrokenLLMService)
+        self.addCleanup(reset_llm_services)
+        user = get_user_model().objects.create_user(username="lecturer", password="pw")
+        self.client.force_login(user)
+
+    def upload(self, content=b"Heaps keep the smallest key on top.", **data):
+        data["document_file"] = SimpleUploadedFile("heaps.txt", content)
+        response = self.client.post("/en/ai/process-document/", data)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def process_all(self, provider):
+        for generation in claim_generations(limit=10, visibility_timeout=60):
+            process_generation(generation, provider)
+
+    def stored_files(self):
+        directory = os.path.join(settings.MEDIA_ROOT, "ai_docs")
+        return os.listdir(directory) if os.path.isdir(directory) else []
+
+    def test_upload_is_hashed_while_streaming(self):
+        first = AIGeneration.objects.get(pk=self.upload()["generation_ids"][0])
+        self.assertEqual(
+            first.content_hash,
+            file_digest(ContentFile(b"Heaps keep the smallest key on top.")),
+        )
+
+    def test_reupload_of_processed_file_reuses_everything(self):
+        first_id = self.upload()["generation_ids"][0]
+        self.process_all("echo")
+        first = AIGeneration.objects.get(pk=first_id)
+
+        body = self.upload()
+        self.assertEqual(body["reused_ids"], body["generation_ids"])
+        second = AIGeneration.objects.get(pk=body["generation_ids"][0])
+        self.assertEqual(second.status, SUCCESS)
+        self.assertEqual(second.html_content, first.html_content)
+        self.assertEqual(second.document_file.name, first.document_file.name)
+        self.assertEqual(second.pipeline_stats, {"reused_from": first.pk})
+        self.assertEqual(
+            list(second.chunks.values_list("text", flat=True)),
+            list(first.chunks.values_list("text", flat=True)),
+        )
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(claim_generations(limit=10, visibility_timeout=60), [])
+
+    def test_different_settings_share_the_blob_but_are_queued(self):
+        self.upload()
+        self.process_all("echo")
+        body = self.upload(ai_goal="quiz")
+        self.assertEqual(body["reused_ids"], [])
+        self.assertEqual(AIGeneration.objects.get(pk=body["generation_ids"][0]).status, PENDING)
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_queued_copy_reuses_output_processed_meanwhile(self):
+        first_id = self.upload()["generation_ids"][0]
+        second_id = self.upload()["generation_ids"][0]
+        first = claim_generations(limit=1, visibility_timeout=60)[0]
+        self.assertEqual(first.pk, first_id)
+        process_generation(first, "echo")
+
+        # The broken provider would fail if the model were called again
+        second = claim_generations(limit=1, visibility_timeout=60)[0]
+        self.assertEqual(second.pk, second_id)
+        self.assertEqual(process_generation(second, "broken"), SUCCESS)
+        self.assertEqual(
+            AIGeneration.objects.get(pk=second_id).html_content,
+            AIGeneration.objects.get(pk=first_id).html_content,
+        )
+
+    def test_course_uploads_require_course_allocation(self):
+        program = Program.objects.create(title="Computer Science")
+        course = Course.objects.create(
+            title="Algorithms", code="CS301", credit=3, program=program,
+            level="Bachelor", semester="First",
+        )
+        response = self.client.post("/en/ai/process-document/", {
+            "course": course.pk,
+            "document_file": SimpleUploadedFile("heaps.txt", b"Heaps."),
+        })
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(AIGeneration.objects.exists())
+
+        allocation = CourseAllocation.objects.create(lecturer=get_user_model().objects.get())
+        allocation.courses.add(course)
+        body = self.upload(course=course.pk)
+        self.assertEqual(AIGeneration.objects.get(pk=body["generation_ids"][0]).course, course)
@@ -0,0 +1,151 @@
+"""Content-addressed handling of uploaded AI documents.
+
+Every upload is hashed (SHA-256) while its chunks arrive, by an upload
+handler placed in front of Django's own. An upload whose content is already
+stored reuses the earlier blob instead of writing a second copy, and one
+whose content was already processed with the same settings also reuses the
+extracted chunks and generated lesson, so it is never queued for the model.
+"""
+import hashlib
+import logging
+
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import transaction
+
+from .models import PENDING, SUCCESS, AIGeneration, DocumentChunk
+from .services.document import STORE_BATCH_SIZE
+from .services.retrieval import VectorIndex
+
+logger = logging.getLogger("ai_core")
+
+# Read size when hashing a file that did not pass through the upload handler
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """Hash uploaded files as they stream in and pass the data on unchanged.
+
+    Digests are collected in ``digests``, a list per form field in upload
+    order. The handler must come before the handlers that store the file.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.digests = {}
+        self._hasher = None
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self._hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.digests.setdefault(self.field_name, []).append(self._hasher.hexdigest())
+        # Returning None lets the next handler build the uploaded file
+        return None
+
+
+def file_digest(file) -> str:
+    """SHA-256 of a Django ``File``, read in chunks."""
+    hasher = hashlib.sha256()
+    for chunk in file.chunks(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()
+
+
+def find_processed(content_hash: str, prompt: str = None):
+    """Return the oldest processed generation of the same content and settings."""
+    if not content_hash:
+        return None
+    return (
+        AIGeneration.objects.filter(content_hash=content_hash, prompt=prompt, status=SUCCESS)
+        .order_by("pk")
+        .first()
+    )
+
+
+def store_upload(uploaded_file, content_hash: str, **fields):
+    """Create the ``AIGeneration`` for an upload, reusing earlier work.
+
+    Args:
+        uploaded_file: The uploaded ``File``.
+        content_hash: Its SHA-256, from ``HashingUploadHandler`` or ``file_digest``.
+        **fields: Other ``AIGeneration`` fields (course, prompt...).
+
+    Returns:
+        ``(generation, reused)``; ``reused`` is true when the lesson was
+        copied from an earlier upload and nothing was queued.
+    """
+    source = find_processed(content_hash, fields.get("prompt"))
+    blob = _stored_blob(content_hash)
+
+    with transaction.atomic():
+        generation = AIGeneration(
+            content_hash=content_hash,
+            status=PENDING if source is None else SUCCESS,
+            **fields,
+        )
+        if blob:
+            # Point at the stored copy; nothing is written to storage
+            generation.document_file.name = blob
+        else:
+            generation.document_file = uploaded_file
+        generation.save()
+        if source is not None:
+            generation.html_content = reuse_processed(source, generation)
+            generation.save(update_fields=["html_content", "updated_at"])
+    return generation, source is not None
+
+
+def reuse_processed(source, generation) -> str:
+    """Copy ``source``'s chunks onto ``generation`` and return its lesson HTML.
+
+    The chunks are indexed for ``generation``'s course unless the course
+    already holds the same content.
+    """
+    rows = source.chunks.values_list(
+        "index", "text", "token_count", "page_start", "page_end"
+    ).iterator()
+    batch = []
+    for index, text, token_count, page_start, page_end in rows:
+        batch.append(DocumentChunk(
+            generation=generation, index=index, text=text, token_count=token_count,
+            page_start=page_start, page_end=page_end,
+        ))
+        if len(batch) >= STORE_BATCH_SIZE:
+            DocumentChunk.objects.bulk_create(batch)
+            batch = []
+    DocumentChunk.objects.bulk_create(batch)
+
+    if generation.course_id and not AIGeneration.objects.filter(
+        course_id=generation.course_id, content_hash=generation.content_hash,
+        status=SUCCESS,
+    ).exclude(pk=generation.pk).exists():
+        VectorIndex.for_course(generation.course_id).add_generation(
+            generation.pk, generation.chunks.values_list("pk", "text").iterator()
+        )
+
+    generation.pipeline_stats = {"reused_from": source.pk}
+    generation.save(update_fields=["pipeline_stats", "updated_at"])
+    logger.info(f"AIGeneration #{generation.pk}: reused the output of #{source.pk}")
+    return source.html_content
+
+
+# -- Private helpers ------------------------------------------------------
+
+def _stored_blob(content_hash: str):
+    """Name of a stored file with this content, if one still exists."""
+    names = (
+        AIGeneration.objects.filter(content_hash=content_hash, document_file__gt="")
+        .order_by("pk")
+        .values_list("document_file", flat=True)
+    )
+    storage = AIGeneration._meta.get_field("document_file").storage
+    for name in dict.fromkeys(names):
+        if storage.exists(name):
+            return name
+    return None
@@ -6,6 +6,11 @@ app_name = "ai_core"
 urlpatterns = [
     path("upload-center/", views.ai_upload_center, name="ai_upload_center"),
     path("process-document/", views.process_ai_document, name="process_ai_document"),
+    path("generation/<int:pk>/", views.generation_status, name="generation_status"),
     path("lesson/generate/", views.generate_lesson, name="generate_lesson"),
+    path("lesson/stream/", views.generate_lesson_stream, name="generate_lesson_stream"),
     path("quiz/generate/", views.generate_quiz, name="generate_quiz"),
+    path("quiz/stream/", views.generate_quiz_stream, name="generate_quiz_stream"),
+    path("quiz/generate-batch/", views.generate_quiz_batch, name="generate_quiz_batch"),
+    path("quiz/import/", views.import_quiz, name="import_quiz"),
 ]
\ No newline at end of file
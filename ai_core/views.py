@@ -1,26 +1,69 @@
 import json
 import logging
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
-from ai_core.services import GeminiService, LessonService, QuizGenerationError, QuizService
-from django.shortcuts import render
+from ai_core.services import (
+    LessonService,
+    QuizGenerationError,
+    QuizImportError,
+    QuizImportService,
+    QuizService,
+    get_llm_service,
+)
+from ai_core.services.document import chunking_settings
+from ai_core.services.retrieval import Retriever
+from django.shortcuts import get_object_or_404, render
 from django.views.decorators.csrf import csrf_exempt
-from ai_core.models import AIGeneration
+from ai_core.decorators import (
+    async_csrf_exempt,
+    async_login_required,
+    async_require_http_methods,
+)
+from course.models import Course
+from quiz.models import CATEGORY_OPTIONS
+from ai_core.models import FAILED, PROCESSING, SUCCESS, AIGeneration
+from ai_core.uploads import HashingUploadHandler, file_digest, store_upload
 
 logger = logging.getLogger("ai_core")
 
+# Most lesson contents accepted by one generate_quiz_batch request
+MAX_BATCH_LESSONS = 100
+
 @login_required
 def ai_upload_center(request):
     """View for the AI Upload Center frontend."""
-    return render(request, "ai_core/ai_upload_center.html")
+    courses = Course.objects.all()
+    if not request.user.is_superuser:
+        courses = courses.filter(allocated_course__lecturer__pk=request.user.id)
+    return render(
+        request, "ai_core/ai_upload_center.html", {"courses": courses.distinct()}
+    )
+
+
+def _course_retriever(course_id):
+    """Retriever over a course's uploaded documents, or ``None``."""
+    # The id becomes part of an index file name, so only accept integers
+    if not isinstance(course_id, int):
+        return None
+    return Retriever.for_course(
+        course_id, max_tokens=chunking_settings()["context_max_tokens"]
+    )
 
 
 @csrf_exempt
 @login_required
 @require_http_methods(["POST"])
 def process_ai_document(request):
-    """Handle document upload and create AIGeneration records."""
+    """Handle document upload and create AIGeneration records.
+
+    Files already uploaded and processed with the same settings are not
+    queued again: their stored file, chunks and lesson are reused.
+    """
+    # Hash files as they arrive; must run before request.FILES is read
+    hashing = HashingUploadHandler(request)
+    request.upload_handlers.insert(0, hashing)
+
     if "document_file" not in request.FILES:
         return JsonResponse({"error": "No file uploaded"}, status=400)
         
@@ -32,23 +75,40 @@ def process_ai_document(request):
     # Store settings temporarily in prompt or use as needed later
     initial_prompt = f"Goal: {ai_goal}, Detail: {detail_level}, Language: {output_language}"
 
-    generated_ids = []
+    course = None
+    course_id = request.POST.get("course", "")
+    if course_id:
+        if course_id.isdigit():
+            course = Course.objects.filter(pk=course_id).first()
+        if course is None:
+            return JsonResponse({"error": "Unknown course"}, status=400)
+        # Uploads feed the course's lesson prompts, so only its lecturers may add them
+        if not request.user.is_superuser and not course.allocated_course.filter(
+            lecturer__pk=request.user.id
+        ).exists():
+            return JsonResponse({"error": "Not allowed to upload to this course"}, status=403)
+
+    digests = hashing.digests.get("document_file", [])
+    if len(digests) != len(uploaded_files):
+        digests = [file_digest(uploaded_file) for uploaded_file in uploaded_files]
+
+    generated_ids, reused_ids = [], []
     try:
-        for uploaded_file in uploaded_files:
+        for uploaded_file, digest in zip(uploaded_files, digests):
             # Create a new AIGeneration record for each file
-            gen_record = AIGeneration.objects.create(
-                document_file=uploaded_file,
-                prompt=initial_prompt,
-                status="PENDING"
+            gen_record, reused = store_upload(
+                uploaded_file, digest, course=course, prompt=initial_prompt
             )
             generated_ids.append(gen_record.id)
-            # Note: In a real app, you would trigger a Celery task here:
-            # process_document_task.delay(gen_record.id)
+            if reused:
+                reused_ids.append(gen_record.id)
+            # Others are picked up asynchronously by `manage.py run_ai_worker`
         
         return JsonResponse({
             "status": "success", 
             "message": f"{len(uploaded_files)} file(s) uploaded successfully",
-            "generation_ids": generated_ids
+            "generation_ids": generated_ids,
+            "reused_ids": reused_ids,
         })
     except Exception as e:
         logger.error(f"Failed to save AI documents: {e}")
@@ -56,10 +116,26 @@ def process_ai_document(request):
 
 
 
-@csrf_exempt
 @login_required
-@require_http_methods(["POST"])
-def generate_lesson(request):
+@require_http_methods(["GET"])
+def generation_status(request, pk):
+    """Report the queue status of an uploaded document."""
+    gen_record = get_object_or_404(AIGeneration, pk=pk)
+    data = {
+        "id": gen_record.id,
+        "status": gen_record.status,
+        "attempts": gen_record.attempts,
+        "error": gen_record.error_message,
+    }
+    if gen_record.status == SUCCESS:
+        data["content"] = gen_record.html_content
+    return JsonResponse(data)
+
+
+@async_csrf_exempt
+@async_login_required
+@async_require_http_methods(["POST"])
+async def generate_lesson(request):
     """Generate a lesson in HTML format for a given topic."""
     try:
         data = json.loads(request.body)
@@ -70,23 +146,96 @@ def generate_lesson(request):
     if not topic:
         return JsonResponse({"error": "Topic is required"}, status=400)
 
-    # Optional RAG context (placeholder for future use)
+    # Optional context; otherwise retrieved from the course's documents
     context = data.get("context", None)
+    use_cache = data.get("use_cache", True) is not False
 
     try:
-        llm = GeminiService()
-        service = LessonService(llm)
-        html_content = service.generate(topic, context)
+        llm = get_llm_service()
+        service = LessonService(llm, retriever=_course_retriever(data.get("course_id")))
+        html_content = await service.agenerate(topic, context, use_cache=use_cache)
         return JsonResponse({"topic": topic, "content": html_content})
     except Exception as e:
         logger.error(f"Lesson generation failed: {e}")
         return JsonResponse({"error": "AI service unavailable"}, status=503)
 
 
+def _sse_event(data: dict, event: str = None) -> str:
+    """Format one server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
 @csrf_exempt
 @login_required
 @require_http_methods(["POST"])
-def generate_quiz(request):
+def generate_lesson_stream(request):
+    """Stream a generated lesson as server-sent events.
+
+    Emits a ``start`` event with the AIGeneration id, one ``message`` event
+    per HTML fragment (``{"html": ...}``), then ``done`` or ``error``. The
+    complete lesson is saved on the AIGeneration record at the end.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    topic = data.get("topic", "").strip()
+    if not topic:
+        return JsonResponse({"error": "Topic is required"}, status=400)
+
+    context = data.get("context", None)
+    use_cache = data.get("use_cache", True) is not False
+
+    try:
+        service = LessonService(
+            get_llm_service(), retriever=_course_retriever(data.get("course_id"))
+        )
+    except Exception as e:
+        logger.error(f"Lesson generation failed: {e}")
+        return JsonResponse({"error": "AI service unavailable"}, status=503)
+
+    gen_record = AIGeneration.objects.create(topic=topic, status=PROCESSING)
+
+    def finish(status, html_content, error_message=None):
+        gen_record.status = status
+        gen_record.html_content = html_content or None
+        gen_record.error_message = error_message
+        gen_record.save(
+            update_fields=["status", "html_content", "error_message", "updated_at"]
+        )
+
+    def event_stream():
+        parts = []
+        yield _sse_event({"id": gen_record.id}, event="start")
+        try:
+            for fragment in service.stream(topic, context, use_cache=use_cache):
+                parts.append(fragment)
+                yield _sse_event({"html": fragment})
+        except GeneratorExit:
+            finish(FAILED, "".join(parts), "Client disconnected")
+            raise
+        except Exception as e:
+            logger.error(f"Lesson streaming failed: {e}")
+            finish(FAILED, "".join(parts), str(e))
+            yield _sse_event({"error": "AI service unavailable"}, event="error")
+            return
+
+        finish(SUCCESS, "".join(parts))
+        yield _sse_event({"id": gen_record.id}, event="done")
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@async_csrf_exempt
+@async_login_required
+@async_require_http_methods(["POST"])
+async def generate_quiz(request):
     """Generate multiple-choice questions from lesson content."""
     try:
         data = json.loads(request.body)
@@ -107,14 +256,204 @@ def generate_quiz(request):
             {"error": "difficulty must be 'easy', 'medium', or 'hard'"}, status=400
         )
 
+    use_cache = data.get("use_cache", True) is not False
+
     try:
-        llm = GeminiService()
+        llm = get_llm_service()
         service = QuizService(llm)
-        questions = service.generate(lesson_content, num_questions, difficulty)
-        return JsonResponse({"questions": questions, "count": len(questions)})
+        questions = await service.agenerate(
+            lesson_content, num_questions, difficulty, use_cache=use_cache
+        )
+        return JsonResponse({
+            "questions": questions,
+            "count": len(questions),
+            "repair_rounds": service.repair_rounds,
+            "usage": service.usage.as_dict(),
+        })
     except QuizGenerationError as e:
         logger.error(f"Quiz generation failed: {e}")
         return JsonResponse({"error": "Quiz generation failed"}, status=502)
     except Exception as e:
         logger.error(f"Quiz generation error: {e}")
         return JsonResponse({"error": "AI service unavailable"}, status=503)
+
+
+@csrf_exempt
+@login_required
+@require_http_methods(["POST"])
+def generate_quiz_stream(request):
+    """Stream generated quiz questions as server-sent events.
+
+    Emits ``start``, then one ``message`` event per validated question
+    (``{"index": ..., "question": {...}}``) as soon as the model has written
+    it, then ``done`` with the count and token usage, or ``error``.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    lesson_content = data.get("lesson_content", "").strip()
+    if not lesson_content:
+        return JsonResponse({"error": "lesson_content is required"}, status=400)
+
+    num_questions = data.get("num_questions", 5)
+    if not isinstance(num_questions, int):
+        return JsonResponse({"error": "num_questions must be an integer"}, status=400)
+
+    difficulty = data.get("difficulty", None)
+    if difficulty and difficulty not in ("easy", "medium", "hard"):
+        return JsonResponse(
+            {"error": "difficulty must be 'easy', 'medium', or 'hard'"}, status=400
+        )
+
+    use_cache = data.get("use_cache", True) is not False
+
+    try:
+        service = QuizService(get_llm_service())
+    except Exception as e:
+        logger.error(f"Quiz generation error: {e}")
+        return JsonResponse({"error": "AI service unavailable"}, status=503)
+
+    def event_stream():
+        yield _sse_event({"num_questions": num_questions}, event="start")
+        count = 0
+        try:
+            for question in service.stream(
+                lesson_content, num_questions, difficulty, use_cache=use_cache
+            ):
+                yield _sse_event({"index": count, "question": question})
+                count += 1
+        except QuizGenerationError as e:
+            logger.error(f"Quiz streaming failed: {e}")
+            yield _sse_event({"error": "Quiz generation failed"}, event="error")
+            return
+        except Exception as e:
+            logger.error(f"Quiz streaming error: {e}")
+            yield _sse_event({"error": "AI service unavailable"}, event="error")
+            return
+
+        yield _sse_event(
+            {
+                "count": count,
+                "requested": num_questions,
+                "rejected": service.rejected,
+                "usage": service.usage.as_dict(),
+            },
+            event="done",
+        )
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@async_csrf_exempt
+@async_login_required
+@async_require_http_methods(["POST"])
+async def generate_quiz_batch(request):
+    """Generate multiple-choice questions for many lessons at once."""
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    lessons = data.get("lessons")
+    if (
+        not isinstance(lessons, list)
+        or not lessons
+        or not all(isinstance(lesson, str) and lesson.strip() for lesson in lessons)
+    ):
+        return JsonResponse(
+            {"error": "lessons must be a non-empty list of lesson contents"}, status=400
+        )
+    if len(lessons) > MAX_BATCH_LESSONS:
+        return JsonResponse(
+            {"error": f"At most {MAX_BATCH_LESSONS} lessons per request"}, status=400
+        )
+
+    num_questions = data.get("num_questions", 5)
+    if not isinstance(num_questions, int):
+        return JsonResponse({"error": "num_questions must be an integer"}, status=400)
+
+    difficulty = data.get("difficulty", None)
+    if difficulty and difficulty not in ("easy", "medium", "hard"):
+        return JsonResponse(
+            {"error": "difficulty must be 'easy', 'medium', or 'hard'"}, status=400
+        )
+
+    use_cache = data.get("use_cache", True) is not False
+
+    try:
+        llm = get_llm_service()
+        service = QuizService(llm)
+        results = await service.agenerate_batch(
+            lessons, num_questions, difficulty, use_cache=use_cache
+        )
+    except Exception as e:
+        logger.error(f"Batch quiz generation error: {e}")
+        return JsonResponse({"error": "AI service unavailable"}, status=503)
+
+    failed = sum(1 for result in results if "error" in result)
+    if failed == len(results):
+        logger.error(f"Batch quiz generation failed for all {failed} lesson(s)")
+        return JsonResponse({"error": "Quiz generation failed"}, status=502)
+    return JsonResponse({
+        "results": results,
+        "count": len(results),
+        "failed": failed,
+        "usage": service.usage.as_dict(),
+    })
+
+
+@csrf_exempt
+@login_required
+@require_http_methods(["POST"])
+def import_quiz(request):
+    """Save generated questions as a new quiz of a course.
+
+    Expects ``course``, ``title`` and ``questions`` (the ``questions`` of a
+    ``generate_quiz`` response), plus optional ``description``, ``category``,
+    ``draft`` (default true) and ``link_duplicates`` (default false).
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    course_id = data.get("course")
+    course = Course.objects.filter(pk=course_id).first() if isinstance(course_id, int) else None
+    if course is None:
+        return JsonResponse({"error": "Unknown course"}, status=400)
+    if not request.user.is_superuser and not course.allocated_course.filter(
+        lecturer__pk=request.user.id
+    ).exists():
+        return JsonResponse({"error": "Not allowed to add quizzes to this course"}, status=403)
+
+    category = data.get("category", "practice")
+    if category not in dict(CATEGORY_OPTIONS):
+        return JsonResponse({"error": "Unknown category"}, status=400)
+
+    service = QuizImportService(link_duplicates=data.get("link_duplicates") is True)
+    try:
+        result = service.import_quiz(
+            course,
+            data.get("title", ""),
+            data.get("questions"),
+            description=str(data.get("description", "")),
+            category=category,
+            draft=data.get("draft", True) is not False,
+        )
+    except QuizImportError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    quiz = result.pop("quiz")
+    return JsonResponse(
+        {
+            "quiz": {"id": quiz.pk, "slug": quiz.slug, "url": quiz.get_absolute_url()},
+            **result,
+        },
+        status=201,
+    )
@@ -0,0 +1,281 @@
+"""Database-backed work queue for ``AIGeneration`` records.
+
+Rows are claimed with a conditional UPDATE, so any number of worker
+processes can share the table without a broker. A claim is a lease, renewed
+by a heartbeat while the row is processed: if a worker dies mid-task its
+rows become claimable again once ``locked_until`` has passed. Failed rows are retried with exponential backoff until
+``MAX_ATTEMPTS`` is reached.
+"""
+import logging
+import threading
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import FAILED, PENDING, PROCESSING, SUCCESS, AIGeneration
+from .services import DocumentService, get_llm_service
+from .uploads import find_processed, reuse_processed
+
+logger = logging.getLogger("ai_core")
+
+DEFAULTS = {
+    "CONCURRENCY": 4,
+    "MAX_ATTEMPTS": 3,
+    "VISIBILITY_TIMEOUT": 15 * 60,
+    "RETRY_BACKOFF": 30,
+    "POLL_INTERVAL": 2,
+}
+
+
+# Share of the visibility timeout between two renewals of a lease
+HEARTBEAT_FRACTION = 1 / 3
+
+
+def worker_settings() -> dict:
+    """Return ``AI_WORKER`` from settings merged over the defaults."""
+    return {**DEFAULTS, **getattr(settings, "AI_WORKER", {})}
+
+
+def claimable(now):
+    """Rows that are due, including those whose lease has expired."""
+    due = Q(available_at__isnull=True) | Q(available_at__lte=now)
+    expired = Q(status=PROCESSING, locked_until__lt=now)
+    return AIGeneration.objects.filter((Q(status=PENDING) & due) | expired)
+
+
+def claim_generations(limit: int, visibility_timeout: int,
+                      max_attempts: int = None) -> list:
+    """Atomically lease up to ``limit`` rows and return them.
+
+    Rows whose lease expired after their final attempt are marked FAILED
+    instead of being handed out again.
+    """
+    now = timezone.now()
+    max_attempts = max_attempts or worker_settings()["MAX_ATTEMPTS"]
+
+    AIGeneration.objects.filter(
+        status=PROCESSING, locked_until__lt=now, attempts__gte=max_attempts
+    ).update(
+        status=FAILED,
+        error_message="Worker stopped responding while processing this document",
+        locked_until=None,
+        claim_token=None,
+        updated_at=now,
+    )
+
+    ids = list(
+        claimable(now).order_by("created_at").values_list("pk", flat=True)[:limit]
+    )
+    if not ids:
+        return []
+
+    # Re-checking the claimable condition in the UPDATE makes the claim
+    # atomic: a row taken by another worker in the meantime no longer
+    # matches, so it never ends up with our token.
+    token = uuid.uuid4().hex
+    claimable(now).filter(pk__in=ids).update(
+        status=PROCESSING,
+        claim_token=token,
+        locked_until=now + timedelta(seconds=visibility_timeout),
+        attempts=F("attempts") + 1,
+        updated_at=now,
+    )
+    return list(AIGeneration.objects.filter(claim_token=token).order_by("created_at"))
+
+
+def renew_lease(generation, visibility_timeout: int) -> bool:
+    """Extend the lease of a claimed row; False if it is no longer ours."""
+    now = timezone.now()
+    return bool(
+        AIGeneration.objects.filter(
+            pk=generation.pk, claim_token=generation.claim_token, status=PROCESSING
+        ).update(locked_until=now + timedelta(seconds=visibility_timeout), updated_at=now)
+    )
+
+
+class LeaseHeartbeat:
+    """Keep renewing the lease of a row on a background thread while it is processed.
+
+    Args:
+        generation: The claimed row.
+        visibility_timeout: Lease length set by each renewal.
+        interval: Seconds between renewals; a third of the lease by default.
+    """
+
+    def __init__(self, generation, visibility_timeout: int, interval: float = None):
+        self.generation = generation
+        self.visibility_timeout = visibility_timeout
+        self.interval = interval or visibility_timeout * HEARTBEAT_FRACTION
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"ai-lease-{generation.pk}", daemon=True
+        )
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    if not renew_lease(self.generation, self.visibility_timeout):
+                        logger.warning(
+                            f"AIGeneration #{self.generation.pk}: lease lost to another worker"
+                        )
+                        return
+                except Exception as exc:
+                    # Try again at the next beat; the lease still has time left
+                    logger.warning(
+                        f"AIGeneration #{self.generation.pk}: lease renewal failed: {exc}"
+                    )
+        finally:
+            connection.close()
+
+
+def process_generation(generation, provider: str = None, max_attempts: int = None,
+                       retry_backoff: int = None, visibility_timeout: int = None) -> str:
+    """Run a claimed row to completion and return its final status.
+
+    The row's lease is renewed every third of ``visibility_timeout`` while
+    the document is processed, so a slow document is not claimed again by
+    another worker.
+    """
+    options = worker_settings()
+    max_attempts = max_attempts or options["MAX_ATTEMPTS"]
+    retry_backoff = options["RETRY_BACKOFF"] if retry_backoff is None else retry_backoff
+    visibility_timeout = visibility_timeout or options["VISIBILITY_TIMEOUT"]
+    # Only the current lease holder may write the outcome.
+    lease = AIGeneration.objects.filter(
+        pk=generation.pk, claim_token=generation.claim_token
+    )
+
+    try:
+        with LeaseHeartbeat(generation, visibility_timeout):
+            # A copy of the same upload may have finished while this one queued
+            source = find_processed(generation.content_hash, generation.prompt)
+            if source is not None:
+                html_content = reuse_processed(source, generation)
+            else:
+                html_content = DocumentService(get_llm_service(provider)).process(generation)
+    except Exception as exc:
+        now = timezone.now()
+        if generation.attempts >= max_attempts:
+            logger.error(f"AIGeneration #{generation.pk} failed permanently: {exc}")
+            lease.update(
+                status=FAILED,
+                error_message=str(exc),
+                locked_until=None,
+                claim_token=None,
+                updated_at=now,
+            )
+            return FAILED
+
+        delay = retry_backoff * 2 ** (generation.attempts - 1)
+        logger.warning(
+            f"AIGeneration #{generation.pk} attempt {generation.attempts}/"
+            f"{max_attempts} failed, retrying in {delay}s: {exc}"
+        )
+        lease.update(
+            status=PENDING,
+            error_message=str(exc),
+            available_at=now + timedelta(seconds=delay),
+            locked_until=None,
+            claim_token=None,
+            updated_at=now,
+        )
+        return PENDING
+
+    lease.update(
+        status=SUCCESS,
+        html_content=html_content,
+        error_message=None,
+        locked_until=None,
+        claim_token=None,
+        updated_at=timezone.now(),
+    )
+    logger.info(f"AIGeneration #{generation.pk} processed")
+    return SUCCESS
+
+
+class GenerationWorker:
+    """Poll for claimable rows and process them on a thread pool."""
+
+    def __init__(self, concurrency: int = None, provider: str = None,
+                 max_attempts: int = None, visibility_timeout: int = None,
+                 retry_backoff: int = None, poll_interval: float = None):
+        options = worker_settings()
+        self.concurrency = concurrency or options["CONCURRENCY"]
+        self.provider = provider
+        self.max_attempts = max_attempts or options["MAX_ATTEMPTS"]
+        self.visibility_timeout = visibility_timeout or options["VISIBILITY_TIMEOUT"]
+        self.retry_backoff = (
+            options["RETRY_BACKOFF"] if retry_backoff is None else retry_backoff
+        )
+        self.poll_interval = poll_interval or options["POLL_INTERVAL"]
+        self.processed = 0
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        """Stop claiming new rows; in-flight rows are allowed to finish."""
+        self._stop.set()
+
+    def run(self, once: bool = False) -> int:
+        """Process rows until stopped (or, with ``once``, until the queue is empty).
+
+        Returns the number of rows processed.
+        """
+        in_flight = set()
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="ai-worker"
+        ) as executor:
+            while not self._stop.is_set():
+                free = self.concurrency - len(in_flight)
+                claimed = []
+                if free > 0:
+                    claimed = claim_generations(
+                        free, self.visibility_timeout, self.max_attempts
+                    )
+                    for generation in claimed:
+                        in_flight.add(executor.submit(self._process, generation))
+
+                if once and not claimed and not in_flight:
+                    break
+
+                if in_flight:
+                    done, in_flight = wait(
+                        in_flight, timeout=self.poll_interval,
+                        return_when=FIRST_COMPLETED,
+                    )
+                    self.processed += len(done)
+                elif not claimed:
+                    self._stop.wait(self.poll_interval)
+
+            if in_flight:
+                logger.info(f"Waiting for {len(in_flight)} in-flight document(s)")
+                done, _ = wait(in_flight)
+                self.processed += len(done)
+
+        return self.processed
+
+    def _process(self, generation) -> str:
+        try:
+            return process_generation(
+                generation, self.provider, self.max_attempts, self.retry_backoff,
+                self.visibility_timeout,
+            )
+        except Exception as exc:
+            # Leave the row to be reclaimed once its lease expires.
+            logger.exception(f"AIGeneration #{generation.pk} crashed the worker: {exc}")
+            return PROCESSING
+        finally:
+            connection.close()
@@ -212,6 +212,102 @@ LOGOUT_REDIRECT_URL = "/"
 STRIPE_SECRET_KEY = config("STRIPE_SECRET_KEY", default="")
 STRIPE_PUBLISHABLE_KEY = config("STRIPE_PUBLISHABLE_KEY", default="")
 
+# AI core
+# ------------------------------------------------------------------------------
+# Response cache in front of BaseLLMService.chat (see ai_core/services/cache.py)
+AI_RESPONSE_CACHE = {
+    "BACKEND": config("AI_CACHE_BACKEND", default="lru"),
+    "TTL": config("AI_CACHE_TTL", default=60 * 60 * 24, cast=int),
+    "MAX_ENTRIES": config("AI_CACHE_MAX_ENTRIES", default=512, cast=int),
+    "LOCATION": config("AI_CACHE_LOCATION", default=""),
+}
+
+# Provider used by the views and the worker (see ai_core/services/registry.py)
+AI_DEFAULT_PROVIDER = config("AI_DEFAULT_PROVIDER", default="resilient")
+
+# Backends behind the "resilient" provider, tried in order, each with its own
+# rate limit, timeout and circuit breaker (see ai_core/services/resilient.py)
+AI_RESILIENCE = {
+    "BACKENDS": [
+        {"PROVIDER": "gemini", "RATE": 2.0, "BURST": 10},
+        {"PROVIDER": "gemini-lite", "RATE": 4.0, "BURST": 20},
+    ],
+    # Seconds to wait for a response, or for the next chunk of a stream
+    "TIMEOUT": config("AI_PROVIDER_TIMEOUT", default=60, cast=int),
+    "RATE_LIMIT_WAIT": 1.0,
+    "FAILURE_THRESHOLD": 5,
+    "RESET_TIMEOUT": 30,
+    # Timed-out calls still running in a worker thread before the circuit opens
+    "MAX_ABANDONED": 8,
+}
+
+# Upper bound on LLM provider calls in flight at once, per process
+AI_MAX_CONCURRENT_CALLS = config("AI_MAX_CONCURRENT_CALLS", default=8, cast=int)
+
+# Per-call LLM telemetry, written in batches (see ai_core/services/telemetry.py)
+AI_TELEMETRY = {
+    "ENABLED": config("AI_TELEMETRY_ENABLED", default=True, cast=bool),
+    "BATCH_SIZE": 100,
+    "FLUSH_INTERVAL": 5.0,
+    "MAX_BUFFER": 10000,
+}
+
+# Text chunking of uploaded documents (see ai_core/services/chunking.py)
+AI_CHUNKING = {
+    "MAX_TOKENS": 800,
+    "OVERLAP_TOKENS": 100,
+    # Most chunk tokens sent to the model as lesson context
+    "CONTEXT_MAX_TOKENS": 6000,
+}
+
+# Prompt size limits (see ai_core/services/budget.py)
+AI_TOKEN_BUDGET = {
+    # Lesson content tokens kept when prompting for quiz questions
+    "QUIZ_CONTENT_MAX_TOKENS": config("AI_QUIZ_CONTENT_MAX_TOKENS", default=3000, cast=int),
+    # Limits for packing several lessons into one batched quiz call
+    "QUIZ_BATCH_MAX_TOKENS": 24000,
+    "QUIZ_BATCH_MAX_LESSONS": 10,
+}
+
+# Local retrieval over uploaded course documents (see ai_core/services/retrieval.py)
+AI_RETRIEVAL = {
+    # Dotted path to a zero-argument callable returning an embedder
+    "EMBEDDER": "ai_core.services.embeddings.HashingEmbedder",
+    "INDEX_DIR": os.path.join(BASE_DIR, "ai_index"),
+    "TOP_K": 6,
+}
+
+# Offline "fake" provider used by tests and benchmark_ai (see ai_core/services/fake.py)
+AI_FAKE_LLM = {
+    "LATENCY": 0.05,
+    "TOKEN_RATE": 0,
+    "FAILURE_RATE": 0.0,
+    "MALFORMED_RATE": 0.0,
+}
+
+# Database-backed queue for uploaded documents (see ai_core/worker.py)
+AI_WORKER = {
+    "CONCURRENCY": config("AI_WORKER_CONCURRENCY", default=4, cast=int),
+    "MAX_ATTEMPTS": 3,
+    "VISIBILITY_TIMEOUT": 15 * 60,
+    "RETRY_BACKOFF": 30,
+    "POLL_INTERVAL": 2,
+}
+
+# Results
+# ------------------------------------------------------------------------------
+# Rendered result sheet PDFs, cached by content fingerprint (see result/pdf.py)
+RESULT_PDF = {
+    "CACHE": "default",
+    "CACHE_TIMEOUT": config("RESULT_PDF_CACHE_TIMEOUT", default=60 * 60 * 24 * 7, cast=int),
+}
+
+# Grade statistics of courses and programs (see result/analytics.py)
+RESULT_ANALYTICS = {
+    "CACHE": "default",
+    "CACHE_TIMEOUT": config("RESULT_ANALYTICS_CACHE_TIMEOUT", default=60 * 60, cast=int),
+}
+
 # LOGGING
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#logging
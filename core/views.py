@@ -4,6 +4,8 @@ from django.contrib.auth.decorators import login_required
 
 from accounts.decorators import admin_required, lecturer_required
 from accounts.models import User, Student
+from course.models import Program
+from result.analytics import program_analytics
 from .forms import SessionForm, SemesterForm, NewsAndEventsForm
 from .models import NewsAndEvents, ActivityLog, Session, Semester
 
@@ -26,6 +28,8 @@ def home_view(request):
 def dashboard_view(request):
     logs = ActivityLog.objects.all().order_by("-created_at")[:10]
     gender_count = Student.get_gender_count()
+    programs = list(Program.objects.order_by("title"))
+    grade_stats = program_analytics([program.pk for program in programs])
     context = {
         "student_count": User.objects.get_student_count(),
         "lecturer_count": User.objects.get_lecturer_count(),
@@ -33,6 +37,9 @@ def dashboard_view(request):
         "males_count": gender_count["M"],
         "females_count": gender_count["F"],
         "logs": logs,
+        "grade_analytics": [
+            {"program": program.title, **grade_stats[program.pk]} for program in programs
+        ],
     }
     return render(request, "core/dashboard.html", context)
 
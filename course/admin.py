@@ -1,13 +1,66 @@
-from django.contrib import admin
+import os
+import shutil
+import tempfile
+
+from django.contrib import admin, messages
 from django.contrib.auth.models import Group
+from django.http import FileResponse
 
+from core.models import Semester, Session
+from result.bulk_pdf import collect_jobs, generate
 from .models import Program, Course, CourseAllocation, Upload
 from modeltranslation.admin import TranslationAdmin
 
+
+# Most documents the admin action renders within a request; larger runs belong
+# to the generate_result_pdfs command
+MAX_ADMIN_PDFS = 50
+
+
+@admin.action(description="Download result sheets and registration forms (zip)")
+def download_result_pdfs(modeladmin, request, queryset):
+    course_ids = list(queryset.values_list("pk", flat=True))
+    try:
+        jobs = collect_jobs(course_ids=course_ids)
+    except (Semester.DoesNotExist, Session.DoesNotExist):
+        modeladmin.message_user(request, "No current semester and session.", messages.ERROR)
+        return None
+    if len(jobs) > MAX_ADMIN_PDFS:
+        modeladmin.message_user(
+            request,
+            f"{len(jobs)} documents is more than the {MAX_ADMIN_PDFS} that can be "
+            "downloaded here; select fewer courses, or run: manage.py "
+            "generate_result_pdfs results.zip "
+            + " ".join(f"--course {pk}" for pk in course_ids),
+            messages.ERROR,
+        )
+        return None
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "results.zip")
+        # Rendered in this process: never fork worker processes from the web server
+        summary = generate(jobs, path, workers=0)
+        if summary["failed"]:
+            modeladmin.message_user(
+                request,
+                f"{len(summary['failed'])} document(s) could not be generated.",
+                messages.WARNING,
+            )
+        # Streamed from an anonymous file, removed once the response is closed
+        archive = tempfile.TemporaryFile()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, archive)
+        archive.seek(0)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return FileResponse(archive, as_attachment=True, filename="results.zip")
+
+
 class ProgramAdmin(TranslationAdmin):
     pass
 class CourseAdmin(TranslationAdmin):
-    pass
+    actions = [download_result_pdfs]
 class UploadAdmin(TranslationAdmin):
     pass
 
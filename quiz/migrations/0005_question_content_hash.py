@@ -0,0 +1,29 @@
+# Generated by Django 4.0.8 on 2026-10-17 02:17
+
+from django.db import migrations, models
+
+from quiz.utils import question_hash
+
+
+def backfill_content_hash(apps, schema_editor):
+    Question = apps.get_model("quiz", "Question")
+    questions = list(Question.objects.only("id", "content"))
+    for question in questions:
+        question.content_hash = question_hash(question.content)
+    Question.objects.bulk_update(questions, ["content_hash"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0004_alter_essayquestion_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
@@ -18,6 +18,7 @@ from model_utils.managers import InheritanceManager
 
 from course.models import Course
 from core.utils import unique_slug_generator
+from .utils import question_hash
 
 CHOICE_ORDER_OPTIONS = (
     ("content", _("Content")),
@@ -388,6 +389,10 @@ class Question(models.Model):
         help_text=_("Explanation to be shown after the question has been answered."),
         verbose_name=_("Explanation"),
     )
+    # Hash of the normalised content, used to find duplicates in the bank
+    content_hash = models.CharField(
+        max_length=64, blank=True, editable=False, db_index=True
+    )
 
     objects = InheritanceManager()
 
@@ -398,6 +403,10 @@ class Question(models.Model):
     def __str__(self):
         return self.content
 
+    def save(self, *args, **kwargs):
+        self.content_hash = question_hash(self.content)
+        super().save(*args, **kwargs)
+
 
 class MCQuestion(Question):
     choice_order = models.CharField(
@@ -0,0 +1,30 @@
+import hashlib
+import re
+import unicodedata
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+
+
+def normalize_question(text):
+    """
+    Reduce question text to the form used to spot duplicates: Unicode
+    normalised, case folded, punctuation dropped and whitespace collapsed.
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return " ".join(_PUNCTUATION_RE.sub(" ", text).split())
+
+
+def question_hash(text):
+    """SHA-256 hex digest of the normalised question text."""
+    return hashlib.sha256(normalize_question(text).encode("utf-8")).hexdigest()
+
+
+def mcquestion_hash(text, options, answer):
+    """
+    SHA-256 hex digest of a multiple choice question: its normalised text,
+    its normalised options in any order and its normalised answer
+    """
+    parts = [normalize_question(text)]
+    parts += sorted(normalize_question(option) for option in options)
+    parts.append(normalize_question(answer))
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.models import Group
 
-from .models import TakenCourse, Result
+from .models import GradeBoundary, GradingScheme, PublishedResult, TakenCourse, Result
 
 
 class ScoreAdmin(admin.ModelAdmin):
@@ -21,3 +21,26 @@ class ScoreAdmin(admin.ModelAdmin):
 
 admin.site.register(TakenCourse, ScoreAdmin)
 admin.site.register(Result)
+
+
+class GradeBoundaryInline(admin.TabularInline):
+    model = GradeBoundary
+    extra = 0
+
+
+class GradingSchemeAdmin(admin.ModelAdmin):
+    list_display = ["name", "program", "session", "updated_at"]
+    list_filter = ["program", "session"]
+    inlines = [GradeBoundaryInline]
+
+
+admin.site.register(GradingScheme, GradingSchemeAdmin)
+
+
+class PublishedResultAdmin(admin.ModelAdmin):
+    list_display = ["student", "semester", "session", "published_at", "updated_at"]
+    list_filter = ["semester", "session"]
+    readonly_fields = ["fingerprint", "published_at", "updated_at"]
+
+
+admin.site.register(PublishedResult, PublishedResultAdmin)
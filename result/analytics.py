@@ -0,0 +1,195 @@
+"""Grade statistics of courses and programs.
+
+For each course or program: the number of students, the mean, median and
+standard deviation of their totals, the pass rate, a histogram of grades and
+of totals, and the mean of every score component.
+
+Each scope is read with one grouped query: rows are grouped by scope, total,
+grade and comment, with their count and the sums of the components. That
+frequency table holds everything needed to compute the figures exactly,
+including the median. Results are cached per course and per program, and
+dropped when a ``TakenCourse`` of the scope is written (see
+:func:`invalidate`).
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from course.models import Course, Program
+from .grading import SCORE_FIELDS
+from .models import GRADE_CHOICES, NG, PASS, TakenCourse
+
+DEFAULTS = {
+    "CACHE": "default",
+    "CACHE_TIMEOUT": 60 * 60,
+}
+
+COURSE = "course"
+PROGRAM = "program"
+
+# Width of the bins of the totals histogram
+HISTOGRAM_BIN = 10
+
+_GROUP_FIELDS = {COURSE: "course_id", PROGRAM: "course__program_id"}
+
+
+def analytics_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "RESULT_ANALYTICS", {})}
+
+
+def course_analytics(course_ids=None) -> dict:
+    """Statistics of courses; all of them by default.
+
+    Returns:
+        A dict of course id to the statistics described in
+        :func:`summarize`.
+    """
+    if course_ids is None:
+        course_ids = Course.objects.values_list("pk", flat=True)
+    return _analytics(COURSE, course_ids)
+
+
+def program_analytics(program_ids=None) -> dict:
+    """Statistics of all the courses of programs; all programs by default."""
+    if program_ids is None:
+        program_ids = Program.objects.values_list("pk", flat=True)
+    return _analytics(PROGRAM, program_ids)
+
+
+def summarize(rows) -> dict:
+    """Statistics of a frequency table.
+
+    Args:
+        rows: Dicts with ``total``, ``grade``, ``comment``, ``count`` and the
+            sum of each of ``SCORE_FIELDS``, for rows sharing a total,
+            grade and comment.
+
+    Returns:
+        A dict with ``students``, ``mean``, ``median`` and ``stddev`` (of
+        the population) of the totals, ``passed``, ``failed``,
+        ``pass_rate`` (0 to 1), ``grades`` (count per grade),
+        ``histogram`` (``{"range", "count"}`` bins of the totals) and
+        ``components`` (mean of each score component). Means and rates are
+        None without students.
+    """
+    rows = sorted(rows, key=lambda row: row["total"])
+    students = sum(row["count"] for row in rows)
+    grades = {grade: 0 for grade, _ in GRADE_CHOICES}
+    bins = [0] * (100 // HISTOGRAM_BIN)
+    passed = 0
+    totals = Decimal(0)
+    components = {field: Decimal(0) for field in SCORE_FIELDS}
+    for row in rows:
+        count, total = row["count"], Decimal(row["total"])
+        totals += total * count
+        grades[row["grade"] or NG] = grades.get(row["grade"] or NG, 0) + count
+        bins[min(int(total // HISTOGRAM_BIN), len(bins) - 1)] += count
+        if row["comment"] == PASS:
+            passed += count
+        for field in SCORE_FIELDS:
+            components[field] += row[field] or 0
+
+    summary = {
+        "students": students,
+        "mean": None,
+        "median": None,
+        "stddev": None,
+        "passed": passed,
+        "failed": students - passed,
+        "pass_rate": None,
+        "grades": grades,
+        "histogram": [
+            {"range": f"{i * HISTOGRAM_BIN}-{(i + 1) * HISTOGRAM_BIN}", "count": count}
+            for i, count in enumerate(bins)
+        ],
+        "components": {field: None for field in SCORE_FIELDS},
+    }
+    if students:
+        mean = totals / students
+        variance = sum(
+            (Decimal(row["total"]) - mean) ** 2 * row["count"] for row in rows
+        ) / students
+        summary.update(
+            mean=_round(mean),
+            median=_round(_median(rows, students)),
+            stddev=_round(variance.sqrt()),
+            pass_rate=round(passed / students, 4),
+            components={
+                field: _round(value / students) for field, value in components.items()
+            },
+        )
+    return summary
+
+
+def invalidate(taken_courses) -> None:
+    """Drop the cached statistics of the courses and programs of ``taken_courses``.
+
+    Runs once the current transaction commits, so a concurrent request can
+    not cache the figures from before the change again.
+
+    Args:
+        taken_courses: Rows with their ``course`` loaded.
+    """
+    keys = set()
+    for taken in taken_courses:
+        keys.add(_key(COURSE, taken.course_id))
+        keys.add(_key(PROGRAM, taken.course.program_id))
+    if keys:
+        transaction.on_commit(lambda: _cache().delete_many(list(keys)))
+
+
+# -- Private helpers ------------------------------------------------------
+
+def _cache():
+    return caches[analytics_settings()["CACHE"]]
+
+
+def _key(scope: str, pk) -> str:
+    return f"grade_analytics:{scope}:{pk}"
+
+
+def _analytics(scope: str, ids) -> dict:
+    """Cached statistics of ``ids``, computing the missing ones in one query."""
+    ids = list(ids)
+    cached = _cache().get_many([_key(scope, pk) for pk in ids])
+    found = {pk: cached[_key(scope, pk)] for pk in ids if _key(scope, pk) in cached}
+    missing = [pk for pk in ids if pk not in found]
+    if missing:
+        group = _GROUP_FIELDS[scope]
+        rows = (
+            TakenCourse.objects.filter(**{f"{group}__in": missing})
+            .values(group, "total", "grade", "comment")
+            .annotate(count=Count("id"), **{field: Sum(field) for field in SCORE_FIELDS})
+            .order_by()
+        )
+        tables = {pk: [] for pk in missing}
+        for row in rows:
+            tables[row[group]].append(row)
+        computed = {pk: summarize(table) for pk, table in tables.items()}
+        _cache().set_many(
+            {_key(scope, pk): stats for pk, stats in computed.items()},
+            analytics_settings()["CACHE_TIMEOUT"],
+        )
+        found.update(computed)
+    return {pk: found[pk] for pk in ids}
+
+
+def _median(rows: list, students: int) -> Decimal:
+    """Median of the totals of ``rows``, sorted by total."""
+    middle = [(students - 1) // 2, students // 2]
+    values, seen = [], 0
+    for row in rows:
+        seen += row["count"]
+        while middle and middle[0] < seen:
+            values.append(Decimal(row["total"]))
+            middle.pop(0)
+        if not middle:
+            break
+    return sum(values) / 2
+
+
+def _round(value: Decimal) -> float:
+    return float(value.quantize(Decimal("0.01")))
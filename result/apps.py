@@ -3,3 +3,27 @@ from django.apps import AppConfig
 
 class ResultConfig(AppConfig):
     name = "result"
+
+    def ready(self) -> None:
+        from django.db.models.signals import post_delete, post_save, pre_save
+        from core.models import Session
+        from course.models import Course
+        from .models import GradeBoundary, GradingScheme, TakenCourse
+        from .signals import (
+            grading_scheme_changed_receiver,
+            post_delete_taken_course_receiver,
+            post_save_course_receiver,
+            post_save_taken_course_receiver,
+            pre_save_course_receiver,
+        )
+
+        post_save.connect(post_save_taken_course_receiver, sender=TakenCourse)
+        post_delete.connect(post_delete_taken_course_receiver, sender=TakenCourse)
+        pre_save.connect(pre_save_course_receiver, sender=Course)
+        post_save.connect(post_save_course_receiver, sender=Course)
+        for sender in (GradingScheme, GradeBoundary):
+            post_save.connect(grading_scheme_changed_receiver, sender=sender)
+            post_delete.connect(grading_scheme_changed_receiver, sender=sender)
+        post_save.connect(grading_scheme_changed_receiver, sender=Session)
+
+        return super().ready()
@@ -0,0 +1,304 @@
+"""Bulk generation of result sheets and course registration forms.
+
+:func:`collect_jobs` reads everything the documents need in a few queries and
+turns it into plain-data jobs. :func:`generate` renders them across a pool of
+processes and writes the PDFs into a directory or a zip file. A manifest
+beside the output records each written document with the fingerprint of its
+data, so a run that was interrupted or had failures resumes where it stopped,
+and documents whose data changed since are rendered again.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.db import connection, connections
+
+from core.models import Semester, Session
+from course.models import CourseAllocation
+from .models import TakenCourse
+from .pdf import (
+    fingerprint,
+    registration_form_data,
+    registration_form_filename,
+    render_registration_form,
+    render_result_sheet,
+    result_sheet_data,
+    result_sheet_filename,
+)
+
+logger = logging.getLogger(__name__)
+
+RESULT_SHEET = "result_sheet"
+REGISTRATION_FORM = "registration_form"
+KINDS = (RESULT_SHEET, REGISTRATION_FORM)
+
+RENDERERS = {
+    RESULT_SHEET: render_result_sheet,
+    REGISTRATION_FORM: render_registration_form,
+}
+
+# Jobs queued per worker process; bounds the PDFs held in memory
+JOBS_PER_WORKER = 4
+
+# Finished documents between two writes of the manifest
+MANIFEST_SAVE_EVERY = 50
+
+
+def collect_jobs(kinds=KINDS, course_ids=None, student_ids=None) -> list:
+    """Build the jobs for the current semester and session.
+
+    Args:
+        kinds: Documents to produce, from ``KINDS``.
+        course_ids: Courses to print result sheets for; all taken courses
+            by default.
+        student_ids: Students to print registration forms for; by default
+            the students of ``course_ids``, or all of them.
+
+    Returns:
+        A list of ``{"name", "kind", "data", "fingerprint"}`` dicts, where
+        ``name`` is the document's path in the output.
+    """
+    semester = Semester.objects.get(is_current_semester=True)
+    session = Session.objects.get(is_current_session=True)
+    jobs = []
+
+    taken = TakenCourse.objects.select_related("course", "student__student").order_by("pk")
+    if RESULT_SHEET in kinds:
+        rows = taken.filter(course_id__in=course_ids) if course_ids else taken
+        by_course = defaultdict(list)
+        for row in rows:
+            by_course[row.course_id].append(row)
+        lecturers = {}
+        allocations = (
+            CourseAllocation.courses.through.objects.filter(course_id__in=list(by_course))
+            .select_related("courseallocation__lecturer")
+            .order_by("pk")
+        )
+        for allocation in allocations:
+            lecturers.setdefault(allocation.course_id, allocation.courseallocation.lecturer)
+        for course_rows in by_course.values():
+            course = course_rows[0].course
+            data = result_sheet_data(
+                course, lecturers.get(course.pk), semester, session,
+                taken_courses=course_rows,
+            )
+            name = f"result_sheets/{result_sheet_filename(data)}"
+            jobs.append(_job(RESULT_SHEET, name, data))
+
+    if REGISTRATION_FORM in kinds:
+        if student_ids:
+            rows = taken.filter(student_id__in=student_ids)
+        elif course_ids:
+            rows = taken.filter(
+                student_id__in=TakenCourse.objects.filter(course_id__in=course_ids).values(
+                    "student_id"
+                )
+            )
+        else:
+            rows = taken
+        by_student = defaultdict(list)
+        for row in rows:
+            by_student[row.student_id].append(row)
+        for student_rows in by_student.values():
+            data = registration_form_data(student_rows[0].student, student_rows, session)
+            name = f"registration_forms/{registration_form_filename(data)}"
+            jobs.append(_job(REGISTRATION_FORM, name, data))
+    return jobs
+
+
+def generate(jobs: list, output: str, workers: int = None, progress=None) -> dict:
+    """Render ``jobs`` and write the PDFs to ``output``.
+
+    Args:
+        jobs: Output of :func:`collect_jobs`.
+        output: A directory, or a file name ending in ``.zip``.
+        workers: Worker processes; one per CPU by default, 0 renders in
+            this process.
+        progress: Optional ``callable(done, total, failed)`` called after
+            each document.
+
+    Returns:
+        A dict with the number of documents ``written`` and ``skipped``
+        (already in the output with the same data) and the ``failed`` names
+        mapped to their errors.
+    """
+    as_zip = output.endswith(".zip")
+    if as_zip:
+        manifest_path = output + ".manifest.json"
+    else:
+        manifest_path = os.path.join(output, "manifest.json")
+    manifest = _load_manifest(manifest_path)
+    changed = {
+        job["name"] for job in jobs if manifest["done"].get(job["name"]) != job["fingerprint"]
+    }
+    writer = _ZipWriter(output, replace=changed) if as_zip else _DirectoryWriter(output)
+    # Also redo documents the manifest lists but the output lost
+    pending = [job for job in jobs if job["name"] in changed or not writer.has(job["name"])]
+    fingerprints = {job["name"]: job["fingerprint"] for job in pending}
+    summary = {"written": 0, "skipped": len(jobs) - len(pending), "failed": {}}
+    total = len(pending)
+
+    try:
+        for done, (name, pdf, error) in enumerate(_render_all(pending, workers), start=1):
+            if error is None:
+                writer.write(name, pdf)
+                manifest["done"][name] = fingerprints[name]
+                manifest["failed"].pop(name, None)
+                summary["written"] += 1
+            else:
+                logger.error(f"Could not render {name}: {error}")
+                manifest["failed"][name] = error
+                summary["failed"][name] = error
+            if done % MANIFEST_SAVE_EVERY == 0:
+                writer.flush()
+                _save_manifest(manifest_path, manifest)
+            if progress:
+                progress(done, total, len(summary["failed"]))
+    finally:
+        writer.close()
+        _save_manifest(manifest_path, manifest)
+    return summary
+
+
+# -- Private helpers ------------------------------------------------------
+
+def _job(kind: str, name: str, data: dict) -> dict:
+    return {"name": name, "kind": kind, "data": data, "fingerprint": fingerprint(data)}
+
+
+def _render(job: dict) -> tuple:
+    """Render one job; runs in a worker process. Returns ``(name, pdf, error)``."""
+    try:
+        return job["name"], RENDERERS[job["kind"]](job["data"]), None
+    except Exception as exc:
+        return job["name"], None, f"{exc.__class__.__name__}: {exc}"
+
+
+def _init_worker() -> None:
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def _render_all(jobs: list, workers: int = None):
+    """Yield ``_render`` results as they finish, keeping a bounded queue."""
+    if workers == 0:
+        for job in jobs:
+            yield _render(job)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    if not connection.in_atomic_block:
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+    # Only the plain-data job is pickled to the workers, never a model
+    payloads = (
+        {"name": job["name"], "kind": job["kind"], "data": job["data"]} for job in jobs
+    )
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        running = set()
+        for payload in payloads:
+            running.add(pool.submit(_render, payload))
+            if len(running) >= workers * JOBS_PER_WORKER:
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield future.result()
+        for future in running:
+            yield future.result()
+
+
+def _load_manifest(path: str) -> dict:
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    return {"done": manifest.get("done", {}), "failed": manifest.get("failed", {})}
+
+
+def _save_manifest(path: str, manifest: dict) -> None:
+    """Write the manifest atomically, so an interrupted run never corrupts it."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+class _DirectoryWriter:
+    def __init__(self, path: str):
+        self.path = path
+
+    def has(self, name: str) -> bool:
+        return os.path.exists(os.path.join(self.path, name))
+
+    def write(self, name: str, pdf: bytes) -> None:
+        target = os.path.join(self.path, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target + ".tmp", "wb") as f:
+            f.write(pdf)
+        os.replace(target + ".tmp", target)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class _ZipWriter:
+    """Append to a zip file, first dropping the entries about to be rewritten."""
+
+    def __init__(self, path: str, replace=()):
+        self.path = path
+        try:
+            with zipfile.ZipFile(path) as existing:
+                self.names = set(existing.namelist())
+        except FileNotFoundError:
+            self.names = set()
+        except zipfile.BadZipFile:
+            # Left unreadable by an interrupted run; start it over
+            logger.warning(f"{path} is not a readable zip file, writing a new one")
+            os.remove(path)
+            self.names = set()
+        stale = self.names & set(replace)
+        if stale:
+            self._drop(stale)
+            self.names -= stale
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._zip = zipfile.ZipFile(path, "a", compression=zipfile.ZIP_DEFLATED)
+
+    def has(self, name: str) -> bool:
+        return name in self.names
+
+    def write(self, name: str, pdf: bytes) -> None:
+        self._zip.writestr(name, pdf)
+        self.names.add(name)
+
+    def flush(self) -> None:
+        # Closing writes the central directory, so the file stays readable
+        self._zip.close()
+        self._zip = zipfile.ZipFile(self.path, "a", compression=zipfile.ZIP_DEFLATED)
+
+    def close(self) -> None:
+        self._zip.close()
+
+    def _drop(self, names: set) -> None:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)))
+        os.close(fd)
+        with zipfile.ZipFile(self.path) as source, zipfile.ZipFile(
+            tmp, "w", compression=zipfile.ZIP_DEFLATED
+        ) as target:
+            for info in source.infolist():
+                if info.filename not in names:
+                    with source.open(info) as src, target.open(info, "w") as dst:
+                        shutil.copyfileobj(src, dst)
+        os.replace(tmp, self.path)
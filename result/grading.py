@@ -0,0 +1,426 @@
+"""Vectorized grading of many ``TakenCourse`` rows at once.
+
+``GradingEngine`` computes totals, grades, points and comments for a whole
+batch of score rows with numpy instead of one object at a time. Scores are
+held as integer hundredths, so every sum and comparison is exact and the
+results are identical to the ``Decimal`` arithmetic of ``TakenCourse.save``.
+Grade points, which may not be whole hundredths, are computed with
+``Decimal`` once per distinct credit and grade and then looked up.
+
+The policy comes from the ``GradingScheme`` of the course's program and the
+session the course was taken in, if one is set up, and from the constants in
+``result.models`` otherwise. :func:`engine_for` keeps the compiled engines in
+memory; the schemes themselves are re-read when one is saved in this process
+and at least every ``SCHEME_CACHE_SECONDS``.
+
+``regrade`` applies the policy to the stored rows of one session in chunks,
+e.g. after the grade boundaries change, and refreshes the dependent
+``Result`` GPAs.
+"""
+import threading
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+
+from core.models import Session
+from .ledger import apply_changes, rebuild, refresh_results
+from .models import (
+    FAIL,
+    GRADE_BOUNDARIES,
+    GRADE_POINT_MAPPING,
+    NG,
+    PASS,
+    F,
+    GradeBoundary,
+    GradingScheme,
+    TakenCourse,
+)
+
+SCORE_FIELDS = ("assignment", "mid_exam", "quiz", "attendance", "final_exam")
+GRADED_FIELDS = ("total", "grade", "point", "comment")
+
+# Rows read, graded and written per transaction by ``regrade``
+REGRADE_BATCH_SIZE = 2000
+
+# Longest a process goes without noticing a scheme changed in another one
+SCHEME_CACHE_SECONDS = 60
+
+TWO_PLACES = Decimal("0.01")
+
+_default_engine = None
+_schemes = None
+_engines = {}
+_schemes_lock = threading.Lock()
+
+# Default of the session arguments: the current session
+_CURRENT = object()
+
+
+class GradingEngine:
+    """Grade score rows in one vectorized pass.
+
+    Args:
+        boundaries: ``(minimum total, grade)`` pairs, highest first;
+            ``GRADE_BOUNDARIES`` by default. A total below every boundary
+            gets ``NG``.
+        grade_points: Grade point of each grade; ``GRADE_POINT_MAPPING`` by
+            default.
+        failing: Grades commented ``FAIL``; every other grade passes.
+    """
+
+    def __init__(self, boundaries=None, grade_points=None, failing=(F, NG)):
+        if boundaries is None:
+            boundaries = GRADE_BOUNDARIES
+        if grade_points is None:
+            grade_points = GRADE_POINT_MAPPING
+        ordered = sorted(boundaries, key=lambda item: item[0])
+        # Thresholds in hundredths, ascending, for a binary search
+        self.thresholds = np.array(
+            [_hundredths(Decimal(str(boundary))) for boundary, _ in ordered], dtype=np.int64
+        )
+        # Grade codes: 0 is NG, then one per boundary in ascending order
+        self.grades = [NG] + [grade for _, grade in ordered]
+        self.grade_points = dict(grade_points)
+        self.passed = np.array([grade not in failing for grade in self.grades])
+        self._point_tables = {}
+
+    def grade(self, scores, credits) -> "GradedBatch":
+        """Grade a batch of rows.
+
+        Args:
+            scores: ``(rows, components)`` array-like of scores with at most
+                two decimal places (``Decimal``, int or float); the total is
+                the sum of each row.
+            credits: Course credit of each row.
+
+        Returns:
+            A :class:`GradedBatch`.
+
+        Raises:
+            ValueError: If a score has more than two decimal places.
+        """
+        scores = _to_hundredths(scores)
+        if scores.ndim == 1:
+            scores = scores.reshape(-1, 1)
+        totals = scores.sum(axis=1)
+        # Index of the highest threshold the total reaches; 0 when none (NG)
+        codes = np.searchsorted(self.thresholds, totals, side="right")
+        if not len(totals):
+            return GradedBatch(self, totals, codes, totals.copy())
+
+        # One row of points per distinct credit, indexed by grade code
+        credits = np.asarray(credits, dtype=np.int64)
+        distinct, inverse = np.unique(credits, return_inverse=True)
+        table = np.stack([self._point_table(int(credit)) for credit in distinct])
+        points = table[inverse.reshape(-1), codes]
+        return GradedBatch(self, totals, codes, points)
+
+    # -- Private helpers --------------------------------------------------
+
+    def _point_table(self, credit: int) -> np.ndarray:
+        """Points of every grade for ``credit``, in hundredths.
+
+        Computed like ``TakenCourse.get_point`` and rounded to two places as
+        the ``point`` field stores it.
+        """
+        table = self._point_tables.get(credit)
+        if table is None:
+            table = np.array(
+                [
+                    _hundredths(
+                        (Decimal(credit) * Decimal(self.grade_points.get(grade, 0.0)))
+                        .quantize(TWO_PLACES)
+                    )
+                    for grade in self.grades
+                ],
+                dtype=np.int64,
+            )
+            self._point_tables[credit] = table
+        return table
+
+
+class GradedBatch:
+    """Output of :meth:`GradingEngine.grade`.
+
+    ``totals`` and ``points`` are in hundredths and ``codes`` index the
+    engine's ``grades``; the other attributes give per-row values.
+    """
+
+    def __init__(self, engine: GradingEngine, totals, codes, points):
+        self.engine = engine
+        self.totals = totals
+        self.codes = codes
+        self.points = points
+
+    def __len__(self):
+        return len(self.totals)
+
+    @property
+    def grades(self) -> list:
+        return [self.engine.grades[code] for code in self.codes.tolist()]
+
+    @property
+    def passed(self) -> np.ndarray:
+        return self.engine.passed[self.codes]
+
+    @property
+    def comments(self) -> list:
+        return [PASS if passed else FAIL for passed in self.passed.tolist()]
+
+    def rows(self):
+        """Yield ``(total, grade, point, comment)`` per row, as the model stores them."""
+        grades = self.engine.grades
+        passed = self.engine.passed.tolist()
+        for total, code, point in zip(
+            self.totals.tolist(), self.codes.tolist(), self.points.tolist()
+        ):
+            yield (
+                Decimal(total).scaleb(-2),
+                grades[code],
+                Decimal(point).scaleb(-2),
+                PASS if passed[code] else FAIL,
+            )
+
+    def apply(self, taken_courses) -> list:
+        """Set the graded fields on ``taken_courses``; return the rows that changed."""
+        changed = []
+        for taken, graded in zip(taken_courses, self.rows()):
+            if (taken.total, taken.grade, taken.point, taken.comment) != graded:
+                taken.total, taken.grade, taken.point, taken.comment = graded
+                changed.append(taken)
+        return changed
+
+
+def default_engine() -> GradingEngine:
+    """Engine for the grading policy in ``result.models``."""
+    global _default_engine
+
+    if _default_engine is None:
+        _default_engine = GradingEngine()
+    return _default_engine
+
+
+def current_session_id():
+    """Id of the current session, or None; cached like the schemes."""
+    return _scheme_index()[1]
+
+
+def engine_for(program_id=None, session_id=_CURRENT) -> GradingEngine:
+    """Engine for the courses of a program in a session.
+
+    Picks the scheme of the program and session, then of the program, then
+    of the session, then the one with neither; :func:`default_engine` when
+    none is set up.
+
+    Args:
+        program_id: Course program, or None.
+        session_id: Defaults to the current session. With None, only the
+            schemes without a session apply.
+    """
+    _, current, schemes = _scheme_index()
+    if session_id is _CURRENT:
+        session_id = current
+    for key in (
+        (program_id, session_id),
+        (program_id, None),
+        (None, session_id),
+        (None, None),
+    ):
+        if key in schemes:
+            return _compiled(*schemes[key])
+    return default_engine()
+
+
+def reset_schemes() -> None:
+    """Forget the schemes and compiled engines, e.g. after one is edited."""
+    global _schemes
+
+    with _schemes_lock:
+        _schemes = None
+        _engines.clear()
+
+
+def grade_rows(taken_courses: list, engine: GradingEngine = None) -> list:
+    """Grade ``TakenCourse`` objects from their current scores.
+
+    Args:
+        taken_courses: Rows with their ``course`` loaded.
+        engine: Grading policy for all the rows; by default each row is
+            graded with the scheme of its course's program and its session
+            (:func:`engine_for`).
+
+    Returns:
+        The rows whose graded fields changed.
+    """
+    groups = {}
+    for taken in taken_courses:
+        scope = None if engine else (taken.course.program_id, taken.session_id)
+        groups.setdefault(scope, []).append(taken)
+
+    changed = []
+    for scope, rows in groups.items():
+        batch = (engine or engine_for(*scope)).grade(
+            [[getattr(taken, field) for field in SCORE_FIELDS] for taken in rows],
+            [taken.course.credit for taken in rows],
+        )
+        changed.extend(batch.apply(rows))
+    return changed
+
+
+def regrade(taken_courses=None, engine: GradingEngine = None, session_id=_CURRENT,
+            batch_size: int = REGRADE_BATCH_SIZE, progress=None) -> int:
+    """Recompute the stored grades of ``taken_courses`` of a session from their scores.
+
+    Rows of other sessions are left alone, so a change of the grading
+    schemes never rewrites the grades, and GPAs, of past sessions unless
+    that session is asked for.
+
+    Rows are read in primary key order, ``batch_size`` at a time. Each chunk
+    is locked, graded in one pass and the changed rows are written with
+    ``bulk_update`` in a short transaction of their own, together with their
+    grade ledger changes and the GPAs of the students' ``Result`` rows, so
+    the table is never locked for the whole job.
+
+    Args:
+        taken_courses: ``TakenCourse`` queryset, all rows by default.
+        engine: Grading policy; by default each program's scheme.
+        session_id: Session of the rows to regrade; the current session by
+            default, None for the rows without one.
+        batch_size: Rows per chunk.
+        progress: Optional ``callable(done, changed)`` called after each chunk.
+
+    Returns:
+        The number of rows whose grade, point, total or comment changed.
+    """
+    if session_id is _CURRENT:
+        session_id = current_session_id()
+    queryset = (
+        (taken_courses if taken_courses is not None else TakenCourse.objects.all())
+        .filter(session_id=session_id)
+        .select_related("course")
+        .only(
+            "student_id", "course_id", "session_id", *SCORE_FIELDS, *GRADED_FIELDS,
+            "course__credit", "course__level", "course__semester", "course__program_id",
+        )
+        .order_by("pk")
+    )
+    from .analytics import invalidate
+
+    done = changed = last_pk = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk).values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            break
+        with transaction.atomic():
+            # Graded from the scores as locked, so a score saved meanwhile is
+            # neither overwritten nor counted twice in the ledger
+            rows = list(
+                queryset.filter(pk__gt=last_pk, pk__lte=pks[-1]).select_for_update(of=("self",))
+            )
+            updated = grade_rows(rows, engine)
+            if updated:
+                TakenCourse.objects.bulk_update(updated, GRADED_FIELDS)
+                apply_changes(updated)
+                invalidate(updated)
+                refresh_results({taken.student_id for taken in updated})
+        done += len(rows)
+        changed += len(updated)
+        last_pk = pks[-1]
+        if progress:
+            progress(done, changed)
+    return changed
+
+
+def regrade_course(course_id) -> int:
+    """Regrade the rows of a course in every session, and rebuild the ledger
+    and ``Result`` GPAs of its students.
+
+    For a course whose credit, level or semester changed: the points of its
+    rows and the ledger rows they count in are no longer right. Each row is
+    graded with the scheme of its own session. Returns the number of
+    students.
+    """
+    with transaction.atomic():
+        rows = list(
+            TakenCourse.objects.filter(course_id=course_id)
+            .select_related("course")
+            .select_for_update(of=("self",))
+            .order_by("pk")
+        )
+        if not rows:
+            return 0
+        updated = grade_rows(rows)
+        TakenCourse.objects.bulk_update(updated, GRADED_FIELDS)
+        student_ids = {taken.student_id for taken in rows}
+        rebuild(student_ids)
+        refresh_results(student_ids)
+    return len(student_ids)
+
+
+# -- Private helpers ------------------------------------------------------
+
+def _hundredths(value: Decimal) -> int:
+    scaled = value.scaleb(2)
+    if scaled != scaled.to_integral_value():
+        raise ValueError(f"{value} has more than two decimal places")
+    return int(scaled)
+
+
+def _to_hundredths(values) -> np.ndarray:
+    """Convert scores to exact integer hundredths."""
+    array = np.asarray(values, dtype=object)
+    if array.size == 0:
+        return np.zeros(array.shape, dtype=np.int64)
+    scaled = np.asarray(array, dtype=np.float64) * 100
+    rounded = np.rint(scaled)
+    # Any value with at most two decimal places lands within float error of
+    # a whole number of hundredths
+    if not np.all(np.abs(scaled - rounded) < 1e-6):
+        raise ValueError("Scores must have at most two decimal places")
+    return rounded.astype(np.int64)
+
+
+def _scheme_index() -> tuple:
+    """``(loaded_at, current_session_id, {(program_id, session_id): (pk, updated_at)})``."""
+    global _schemes
+
+    index = _schemes
+    if index is None or time.monotonic() - index[0] > SCHEME_CACHE_SECONDS:
+        with _schemes_lock:
+            index = _schemes
+            if index is None or time.monotonic() - index[0] > SCHEME_CACHE_SECONDS:
+                current = Session.objects.filter(is_current_session=True).first()
+                rows = GradingScheme.objects.values_list(
+                    "pk", "program_id", "session_id", "updated_at"
+                )
+                index = _schemes = (
+                    time.monotonic(),
+                    current.pk if current else None,
+                    {(program_id, session_id): (pk, updated_at)
+                     for pk, program_id, session_id, updated_at in rows},
+                )
+    return index
+
+
+def _compiled(scheme_id: int, updated_at) -> GradingEngine:
+    """The engine of a scheme, compiled once per version."""
+    key = (scheme_id, updated_at)
+    engine = _engines.get(key)
+    if engine is None:
+        boundaries = list(
+            GradeBoundary.objects.filter(scheme_id=scheme_id).values_list(
+                "minimum", "grade", "point", "passing"
+            )
+        )
+        if not boundaries:
+            return default_engine()
+        engine = GradingEngine(
+            boundaries=[(minimum, grade) for minimum, grade, _, _ in boundaries],
+            grade_points={grade: point for _, grade, point, _ in boundaries},
+            failing=[NG] + [grade for _, grade, _, passing in boundaries if not passing],
+        )
+        with _schemes_lock:
+            _engines[key] = engine
+    return engine
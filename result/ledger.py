@@ -0,0 +1,375 @@
+"""Materialized GPA and CGPA ledger.
+
+Each student has one ``GradeLedger`` row per level and semester holding the
+sum of grade points and of credits of the courses taken there, and one
+``CumulativeLedger`` row with the running totals over all of them. Saving or
+deleting a ``TakenCourse`` adds the difference it makes to both rows, so a
+GPA or CGPA is read from a single row instead of being recomputed over the
+student's whole history.
+
+Saving a ``Course`` with a new credit, level or semester regrades its rows
+and rebuilds the ledger of its students (see
+``result.grading.regrade_course``). Writes that bypass ``save``
+(``QuerySet.update``, raw SQL) leave the ledger stale; ``manage.py
+rebuild_grade_ledger`` verifies and rebuilds it from the scores.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from core.models import Session
+from course.models import Course
+from .models import CumulativeLedger, GradeLedger, Result, TakenCourse
+
+logger = logging.getLogger(__name__)
+
+# Rows written per INSERT when rebuilding
+REBUILD_BATCH_SIZE = 500
+
+# Course fields the ledger rows of its students depend on
+COURSE_FIELDS = ("credit", "level", "semester")
+
+ZERO = Decimal("0.00")
+
+
+def average(points, credits) -> Decimal:
+    """Points per credit rounded like a GPA; 0 without credits."""
+    if credits:
+        return round(Decimal(points or 0) / Decimal(credits), 2)
+    return ZERO
+
+
+def changes(taken: TakenCourse, created: bool = False):
+    """What saving ``taken`` changed in the ledger.
+
+    Returns:
+        ``{(student_id, level, semester): (points, credits)}`` differences,
+        or ``None`` when the row's previous values are unknown.
+    """
+    course = taken.course
+    key = (taken.student_id, course.level, course.semester)
+    point = Decimal(taken.point)
+    if created:
+        return {key: (point, course.credit)}
+
+    old_course_id, old_point = getattr(taken, "_ledger_state", (None, None))
+    if old_course_id is None or old_point is None:
+        return None
+    if old_course_id == taken.course_id:
+        return {key: (point - old_point, 0)}
+
+    level, semester, credit = Course.objects.values_list(
+        "level", "semester", "credit"
+    ).get(pk=old_course_id)
+    deltas = _Deltas()
+    deltas.add((taken.student_id, level, semester), -old_point, -credit)
+    deltas.add(key, point, course.credit)
+    return deltas
+
+
+def record_save(taken: TakenCourse, created: bool) -> None:
+    """Add what saving ``taken`` changed to the ledger."""
+    deltas = changes(taken, created)
+    if deltas is None:
+        logger.info(
+            f"TakenCourse #{taken.pk}: previous score unknown, rebuilding the "
+            f"ledger of student #{taken.student_id}"
+        )
+        rebuild([taken.student_id])
+    else:
+        _increment(deltas, create=True)
+    taken._ledger_state = (taken.course_id, taken.point)
+
+
+def record_delete(taken: TakenCourse) -> None:
+    """Take a deleted ``taken`` out of the ledger."""
+    course_id, point = getattr(taken, "_ledger_state", (taken.course_id, taken.point))
+    if course_id == taken.course_id:
+        course = taken.course
+        level, semester, credit = course.level, course.semester, course.credit
+    else:
+        level, semester, credit = Course.objects.values_list(
+            "level", "semester", "credit"
+        ).get(pk=course_id)
+    key = (taken.student_id, level, semester)
+    # Rows of a deleted student go with it, so nothing is created here
+    _increment({key: (-Decimal(point), -credit)}, create=False)
+
+
+def apply_changes(rows: list) -> None:
+    """Add the changes of many saved ``TakenCourse`` rows to the ledger at once.
+
+    The rows must have been loaded from the database, changed and written
+    without ``save()`` (e.g. with ``bulk_update``). The affected ledger rows
+    are read once, locked, and written with ``bulk_update``/``bulk_create``,
+    so the number of queries does not depend on the number of rows.
+    """
+    deltas = _Deltas()
+    for taken in rows:
+        row_changes = changes(taken)
+        if row_changes is None:
+            raise ValueError(f"TakenCourse #{taken.pk} was not loaded from the database")
+        for key, (points, credits) in row_changes.items():
+            deltas.add(key, points, credits)
+        taken._ledger_state = (taken.course_id, taken.point)
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+
+    student_ids = {student_id for student_id, _, _ in deltas}
+    totals = _Deltas()
+    with transaction.atomic():
+        existing = {
+            (row.student_id, row.level, row.semester): row
+            for row in GradeLedger.objects.select_for_update().filter(
+                student_id__in=student_ids
+            )
+        }
+        to_update, to_create = [], []
+        for key, (points, credits) in deltas.items():
+            totals.add(key[0], points, credits)
+            row = existing.get(key)
+            if row is None:
+                to_create.append(GradeLedger(
+                    student_id=key[0], level=key[1], semester=key[2],
+                    points=points, credits=credits,
+                ))
+            else:
+                row.points += points
+                row.credits += credits
+                to_update.append(row)
+        GradeLedger.objects.bulk_update(to_update, ["points", "credits"])
+        GradeLedger.objects.bulk_create(to_create)
+
+        cumulative = {
+            row.student_id: row
+            for row in CumulativeLedger.objects.select_for_update().filter(
+                student_id__in=student_ids
+            )
+        }
+        to_update, to_create = [], []
+        for student_id, (points, credits) in totals.items():
+            row = cumulative.get(student_id)
+            if row is None:
+                to_create.append(CumulativeLedger(
+                    student_id=student_id, points=points, credits=credits
+                ))
+            else:
+                row.points += points
+                row.credits += credits
+                to_update.append(row)
+        CumulativeLedger.objects.bulk_update(to_update, ["points", "credits"])
+        CumulativeLedger.objects.bulk_create(to_create)
+
+
+def student_gpas(students: dict, semester: str) -> dict:
+    """Return ``{student_id: (gpa, cgpa)}`` from the ledger in two queries.
+
+    ``students`` maps ids to ``Student`` objects; the GPA is that of the
+    student's current level in ``semester``.
+    """
+    gpas = {student_id: (ZERO, ZERO) for student_id in students}
+    semester_rows = GradeLedger.objects.filter(
+        student_id__in=list(students), semester=semester
+    ).values_list("student_id", "level", "points", "credits")
+    semester_gpas = {
+        student_id: average(points, credits)
+        for student_id, level, points, credits in semester_rows
+        if level == students[student_id].level
+    }
+    cumulative = CumulativeLedger.objects.filter(
+        student_id__in=list(students)
+    ).values_list("student_id", "points", "credits")
+    for student_id, points, credits in cumulative:
+        gpas[student_id] = (semester_gpas.get(student_id, ZERO), average(points, credits))
+    return gpas
+
+
+def refresh_results(student_ids) -> int:
+    """Recompute the ``Result`` rows of students from the ledger.
+
+    Each row gets the GPA of its level and semester; rows of the current
+    session also get the student's CGPA, older ones keep the CGPA they were
+    published with. Returns the number of rows updated.
+    """
+    student_ids = list(student_ids)
+    results = list(
+        Result.objects.filter(student_id__in=student_ids, level__isnull=False)
+    )
+    if not results:
+        return 0
+    semester_rows = GradeLedger.objects.filter(student_id__in=student_ids).values_list(
+        "student_id", "level", "semester", "points", "credits"
+    )
+    gpas = {
+        (student_id, level, semester): average(points, credits)
+        for student_id, level, semester, points, credits in semester_rows
+    }
+    cgpas = {
+        student_id: average(points, credits)
+        for student_id, points, credits in CumulativeLedger.objects.filter(
+            student_id__in=student_ids
+        ).values_list("student_id", "points", "credits")
+    }
+    current = Session.objects.filter(is_current_session=True).first()
+    for result in results:
+        result.gpa = float(gpas.get((result.student_id, result.level, result.semester), ZERO))
+        if current and result.session == str(current):
+            result.cgpa = float(cgpas.get(result.student_id, ZERO))
+    Result.objects.bulk_update(results, ["gpa", "cgpa"])
+    return len(results)
+
+
+def expected_totals(student_ids=None) -> dict:
+    """Ledger contents recomputed from the scores, with one grouped query.
+
+    Returns:
+        ``{(student_id, level, semester): (points, credits)}``.
+    """
+    taken = TakenCourse.objects.all()
+    if student_ids is not None:
+        taken = taken.filter(student_id__in=list(student_ids))
+    rows = (
+        taken.values("student_id", "course__level", "course__semester")
+        .annotate(points=Sum("point"), credits=Sum("course__credit"))
+        .order_by()
+    )
+    return {
+        (row["student_id"], row["course__level"], row["course__semester"]):
+            (Decimal(row["points"] or 0), row["credits"] or 0)
+        for row in rows
+    }
+
+
+def rebuild(student_ids=None) -> int:
+    """Rebuild the ledger from the scores; return the number of students.
+
+    Args:
+        student_ids: Students to rebuild, all of them by default.
+    """
+    expected = expected_totals(student_ids)
+    totals = _Deltas()
+    for key, (points, credits) in expected.items():
+        totals.add(key[0], points, credits)
+
+    semester_rows = GradeLedger.objects.all()
+    cumulative_rows = CumulativeLedger.objects.all()
+    if student_ids is not None:
+        semester_rows = semester_rows.filter(student_id__in=list(student_ids))
+        cumulative_rows = cumulative_rows.filter(student_id__in=list(student_ids))
+
+    with transaction.atomic():
+        semester_rows.delete()
+        cumulative_rows.delete()
+        GradeLedger.objects.bulk_create(
+            [
+                GradeLedger(
+                    student_id=student_id, level=level, semester=semester,
+                    points=points, credits=credits,
+                )
+                for (student_id, level, semester), (points, credits) in expected.items()
+            ],
+            batch_size=REBUILD_BATCH_SIZE,
+        )
+        CumulativeLedger.objects.bulk_create(
+            [
+                CumulativeLedger(student_id=student_id, points=points, credits=credits)
+                for student_id, (points, credits) in totals.items()
+            ],
+            batch_size=REBUILD_BATCH_SIZE,
+        )
+    return len(totals)
+
+
+def verify(student_ids=None) -> list:
+    """Compare the ledger with the scores.
+
+    Returns:
+        One ``(student_id, level, semester, expected, stored)`` tuple per
+        row that differs, where the totals are ``(points, credits)`` pairs.
+        Cumulative rows are reported with ``level`` and ``semester`` of
+        ``None``.
+    """
+    expected = expected_totals(student_ids)
+    expected_cumulative = _Deltas()
+    for key, (points, credits) in expected.items():
+        expected_cumulative.add(key[0], points, credits)
+
+    semester_rows = GradeLedger.objects.all()
+    cumulative_rows = CumulativeLedger.objects.all()
+    if student_ids is not None:
+        semester_rows = semester_rows.filter(student_id__in=list(student_ids))
+        cumulative_rows = cumulative_rows.filter(student_id__in=list(student_ids))
+    stored = {
+        (student_id, level, semester): (points, credits)
+        for student_id, level, semester, points, credits in semester_rows.values_list(
+            "student_id", "level", "semester", "points", "credits"
+        ).iterator()
+    }
+    stored_cumulative = {
+        student_id: (points, credits)
+        for student_id, points, credits in cumulative_rows.values_list(
+            "student_id", "points", "credits"
+        ).iterator()
+    }
+
+    empty = (ZERO, 0)
+    mismatches = []
+    for key in sorted(expected.keys() | stored.keys(), key=str):
+        want, have = expected.get(key, empty), stored.get(key, empty)
+        if want != have:
+            mismatches.append((*key, want, have))
+    for student_id in sorted(expected_cumulative.keys() | stored_cumulative.keys()):
+        want = expected_cumulative.get(student_id, empty)
+        have = stored_cumulative.get(student_id, empty)
+        if want != have:
+            mismatches.append((student_id, None, None, want, have))
+    return mismatches
+
+
+# -- Private helpers ------------------------------------------------------
+
+class _Deltas(defaultdict):
+    """``{key: (points, credits)}`` that sums what is added to each key."""
+
+    def __init__(self):
+        super().__init__(lambda: (ZERO, 0))
+
+    def add(self, key, points, credits) -> None:
+        old_points, old_credits = self[key]
+        self[key] = (old_points + points, old_credits + credits)
+
+
+def _increment(deltas: dict, create: bool) -> None:
+    """Add ``deltas`` to the ledger rows with ``UPDATE ... SET x = x + d``."""
+    totals = _Deltas()
+    for key, (points, credits) in deltas.items():
+        totals.add(key[0], points, credits)
+    with transaction.atomic(savepoint=False):
+        for (student_id, level, semester), (points, credits) in deltas.items():
+            if points or credits:
+                _add_to(
+                    GradeLedger, create, points, credits,
+                    student_id=student_id, level=level, semester=semester,
+                )
+        for student_id, (points, credits) in totals.items():
+            if points or credits:
+                _add_to(CumulativeLedger, create, points, credits, student_id=student_id)
+
+
+def _add_to(model, create: bool, points, credits, **key) -> None:
+    updated = model.objects.filter(**key).update(
+        points=F("points") + points, credits=F("credits") + credits
+    )
+    if not updated and create:
+        _, created = model.objects.get_or_create(
+            **key, defaults={"points": points, "credits": credits}
+        )
+        if not created:
+            # Created by a concurrent save in the meantime
+            model.objects.filter(**key).update(
+                points=F("points") + points, credits=F("credits") + credits
+            )
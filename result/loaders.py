@@ -0,0 +1,109 @@
+"""Data for the student result pages, loaded in a fixed number of queries."""
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+
+from accounts.models import Student
+from .models import Result, TakenCourse
+
+
+@dataclass
+class StudentResults:
+    """A student's courses of their current level, grouped by semester, and results."""
+
+    student: Student
+    courses: list
+    results: list
+    semesters: dict = field(default_factory=dict)
+    credits: dict = field(default_factory=dict)
+    previous_cgpa: float = 0
+
+    @property
+    def total_credit(self) -> int:
+        return self.credits.get(settings.FIRST, 0) + self.credits.get(settings.SECOND, 0)
+
+    @property
+    def sessions(self) -> list:
+        return sorted({result.session for result in self.results})
+
+    def context(self) -> dict:
+        """Template context shared by the grade and assessment pages."""
+        return {
+            "student": self.student,
+            "courses": self.courses,
+            "first_semester_courses": self.semesters.get(settings.FIRST, []),
+            "second_semester_courses": self.semesters.get(settings.SECOND, []),
+            "results": self.results,
+            "sorted_result": self.sessions,
+            "total_first_semester_credit": self.credits.get(settings.FIRST, 0),
+            "total_sec_semester_credit": self.credits.get(settings.SECOND, 0),
+            "total_first_and_second_semester_credit": self.total_credit,
+            "previousCGPA": self.previous_cgpa,
+        }
+
+
+def load_student_results(user_id: int) -> StudentResults:
+    """Load everything the result pages of a student show, in three queries.
+
+    Courses come with their ``course`` loaded, and the credit totals and
+    previous CGPA are computed from the rows already in memory.
+    """
+    student = get_object_or_404(Student.objects.select_related("student"), student__pk=user_id)
+    return load_results_for([student])[student.pk]
+
+
+def load_results_for(students) -> dict:
+    """Like :func:`load_student_results` for many students, in two queries.
+
+    Args:
+        students: ``Student`` objects.
+
+    Returns:
+        A dict of student id to :class:`StudentResults`.
+    """
+    students = {student.pk: student for student in students}
+    courses, results = defaultdict(list), defaultdict(list)
+    taken_courses = (
+        TakenCourse.objects.filter(student_id__in=list(students))
+        .select_related("course")
+        .order_by("pk")
+    )
+    for taken in taken_courses:
+        if taken.course.level == students[taken.student_id].level:
+            courses[taken.student_id].append(taken)
+    for result in Result.objects.filter(student_id__in=list(students)).order_by("pk"):
+        results[result.student_id].append(result)
+
+    loaded = {}
+    for pk, student in students.items():
+        semesters, credits = {}, {}
+        for taken in courses[pk]:
+            semester = taken.course.semester
+            semesters.setdefault(semester, []).append(taken)
+            credits[semester] = credits.get(semester, 0) + int(taken.course.credit)
+        loaded[pk] = StudentResults(
+            student=student,
+            courses=courses[pk],
+            results=results[pk],
+            semesters=semesters,
+            credits=credits,
+            previous_cgpa=_previous_cgpa(results[pk]),
+        )
+    return loaded
+
+
+# -- Private helpers ------------------------------------------------------
+
+def _previous_cgpa(results: list) -> float:
+    """CGPA of the Second semester of the first level that has exactly one."""
+    second_semester = {}
+    for result in results:
+        if result.semester == settings.SECOND:
+            second_semester.setdefault(result.level, []).append(result)
+    for result in results:
+        matches = second_semester.get(result.level, [])
+        if len(matches) == 1:
+            return matches[0].cgpa
+    return 0
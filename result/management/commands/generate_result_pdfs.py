@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from result.bulk_pdf import KINDS, collect_jobs, generate
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the result sheets and course registration forms of the current "
+        "semester in parallel, into a directory or a .zip file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Output directory, or a file name ending in .zip")
+        parser.add_argument(
+            "--kind", choices=KINDS, action="append", help="Document kind (repeatable)"
+        )
+        parser.add_argument(
+            "--course", type=int, action="append", help="Course id (repeatable)"
+        )
+        parser.add_argument(
+            "--student", type=int, action="append", help="Student id (repeatable)"
+        )
+        parser.add_argument(
+            "--workers", type=int, help="Worker processes (default: one per CPU)"
+        )
+
+    def handle(self, *args, **options):
+        jobs = collect_jobs(
+            kinds=options["kind"] or KINDS,
+            course_ids=options["course"],
+            student_ids=options["student"],
+        )
+        self.stdout.write(f"{len(jobs)} document(s) to generate")
+
+        def report(done, total, failed):
+            if done == total or done % 100 == 0:
+                self.stdout.write(f"{done}/{total} rendered, {failed} failed")
+
+        summary = generate(jobs, options["output"], workers=options["workers"], progress=report)
+        self.stdout.write(
+            f"{summary['written']} written, {summary['skipped']} already up to date"
+        )
+        if summary["failed"]:
+            for name, error in summary["failed"].items():
+                self.stderr.write(f"{name}: {error}")
+            raise CommandError(
+                f"{len(summary['failed'])} document(s) failed; run again to retry them"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Done: {options['output']}"))
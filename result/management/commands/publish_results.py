@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from result.publishing import PUBLISH_BATCH_SIZE, publish
+
+
+class Command(BaseCommand):
+    help = (
+        "Freeze the results of a semester into the snapshots the student result "
+        "pages read; publishing again only rewrites the snapshots that changed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--semester", help="Semester, the current one by default")
+        parser.add_argument("--session", help="Session, the current one by default")
+        parser.add_argument(
+            "--student", type=int, action="append", help="Student id (repeatable)"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=PUBLISH_BATCH_SIZE,
+            help="Students published per transaction",
+        )
+
+    def handle(self, *args, **options):
+        def report(done, total):
+            self.stdout.write(f"{done}/{total} student(s) published")
+
+        summary = publish(
+            options["semester"],
+            options["session"],
+            student_ids=options["student"],
+            batch_size=options["batch_size"],
+            progress=report,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{summary['created']} snapshot(s) created, {summary['updated']} updated, "
+                f"{summary['unchanged']} unchanged"
+            )
+        )
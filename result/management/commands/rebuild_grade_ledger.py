@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from result.ledger import rebuild, verify
+
+
+class Command(BaseCommand):
+    help = "Verify the GPA/CGPA ledger against the recorded scores and rebuild it"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--student", type=int, action="append", help="Student id (repeatable)"
+        )
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report ledger rows that differ from the scores; exit 1 if any",
+        )
+
+    def handle(self, *args, **options):
+        student_ids = options["student"]
+        mismatches = verify(student_ids)
+        for student_id, level, semester, expected, stored in mismatches:
+            scope = f"{level}, {semester}" if level else "cumulative"
+            self.stdout.write(
+                f"Student {student_id} ({scope}): expected {expected[0]} points / "
+                f"{expected[1]} credits, ledger has {stored[0]} / {stored[1]}"
+            )
+
+        if options["verify"]:
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} ledger row(s) out of date")
+            self.stdout.write(self.style.SUCCESS("Ledger is up to date"))
+            return
+
+        count = rebuild(student_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the ledger of {count} student(s)"))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+
+from result.grading import REGRADE_BATCH_SIZE, current_session_id, regrade
+from result.models import TakenCourse
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the stored grades, points and comments of a session with the "
+        "current grading schemes, and the GPAs of the affected results"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--program", type=int, action="append", help="Program id (repeatable)"
+        )
+        parser.add_argument(
+            "--course", type=int, action="append", help="Course id (repeatable)"
+        )
+        parser.add_argument(
+            "--session",
+            type=int,
+            help="Session id of the rows to regrade; the current session by default",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=REGRADE_BATCH_SIZE,
+            help="Rows graded and written per transaction",
+        )
+
+    def handle(self, *args, **options):
+        session_id = options["session"] or current_session_id()
+        taken_courses = TakenCourse.objects.filter(session_id=session_id)
+        if options["program"]:
+            taken_courses = taken_courses.filter(course__program_id__in=options["program"])
+        if options["course"]:
+            taken_courses = taken_courses.filter(course_id__in=options["course"])
+        total = taken_courses.count()
+
+        def report(done, changed):
+            self.stdout.write(f"{done}/{total} row(s) graded, {changed} changed")
+
+        changed = regrade(
+            taken_courses,
+            session_id=session_id,
+            batch_size=options["batch_size"],
+            progress=report,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Regraded {total} row(s), {changed} changed"))
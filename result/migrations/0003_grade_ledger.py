@@ -0,0 +1,70 @@
+# Generated by Django 4.0.8 on 2026-10-17 02:29
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_ledger(apps, schema_editor):
+    TakenCourse = apps.get_model("result", "TakenCourse")
+    GradeLedger = apps.get_model("result", "GradeLedger")
+    CumulativeLedger = apps.get_model("result", "CumulativeLedger")
+
+    rows = (
+        TakenCourse.objects.values("student_id", "course__level", "course__semester")
+        .annotate(points=models.Sum("point"), credits=models.Sum("course__credit"))
+        .order_by()
+    )
+    totals = {}
+    ledger = []
+    for row in rows:
+        points, credits = row["points"] or Decimal("0.00"), row["credits"] or 0
+        ledger.append(GradeLedger(
+            student_id=row["student_id"], level=row["course__level"],
+            semester=row["course__semester"], points=points, credits=credits,
+        ))
+        old_points, old_credits = totals.get(row["student_id"], (Decimal("0.00"), 0))
+        totals[row["student_id"]] = (old_points + points, old_credits + credits)
+    GradeLedger.objects.bulk_create(ledger, batch_size=500)
+    CumulativeLedger.objects.bulk_create(
+        [
+            CumulativeLedger(student_id=student_id, points=points, credits=credits)
+            for student_id, (points, credits) in totals.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_initial'),
+        ('result', '0002_alter_result_level_alter_takencourse_comment_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CumulativeLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=9)),
+                ('credits', models.IntegerField(default=0)),
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='cumulative_ledger', to='accounts.student')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GradeLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('Bachelor', 'Bachelor Degree'), ('Master', 'Master Degree')], max_length=25)),
+                ('semester', models.CharField(choices=[('First', 'First'), ('Second', 'Second'), ('Third', 'Third')], max_length=100)),
+                ('points', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=9)),
+                ('credits', models.IntegerField(default=0)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grade_ledger', to='accounts.student')),
+            ],
+            options={
+                'unique_together': {('student', 'level', 'semester')},
+            },
+        ),
+        migrations.RunPython(fill_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.0.8 on 2026-10-17 02:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0004_alter_course_code_alter_course_credit_and_more'),
+        ('core', '0003_newsandevents_summary_es_newsandevents_summary_fr_and_more'),
+        ('result', '0003_grade_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradingScheme',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('program', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='grading_schemes', to='course.program')),
+                ('session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='grading_schemes', to='core.session')),
+            ],
+            options={
+                'unique_together': {('program', 'session')},
+            },
+        ),
+        migrations.CreateModel(
+            name='GradeBoundary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grade', models.CharField(choices=[('A+', 'A+'), ('A', 'A'), ('A-', 'A-'), ('B+', 'B+'), ('B', 'B'), ('B-', 'B-'), ('C+', 'C+'), ('C', 'C'), ('C-', 'C-'), ('D', 'D'), ('F', 'F'), ('NG', 'NG')], max_length=2)),
+                ('minimum', models.DecimalField(decimal_places=2, help_text='Lowest total that earns this grade', max_digits=5)),
+                ('point', models.DecimalField(decimal_places=2, max_digits=4)),
+                ('passing', models.BooleanField(default=True)),
+                ('scheme', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='boundaries', to='result.gradingscheme')),
+            ],
+            options={
+                'ordering': ['-minimum'],
+                'unique_together': {('scheme', 'grade')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.0.8 on 2026-10-17 02:48
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_initial'),
+        ('result', '0004_grading_scheme'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublishedResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('semester', models.CharField(choices=[('First', 'First'), ('Second', 'Second'), ('Third', 'Third')], max_length=100)),
+                ('session', models.CharField(max_length=100)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('published_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='published_results', to='accounts.student')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='publishedresult',
+            index=models.Index(fields=['student', '-published_at'], name='result_publ_student_d155ef_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='publishedresult',
+            unique_together={('student', 'semester', 'session')},
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.0.8 on 2026-10-17 03:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.comparison
+
+
+def fill_sessions(apps, schema_editor):
+    """Set each row's session from the student's Result of the course's
+    semester and level, or to the current session."""
+    TakenCourse = apps.get_model("result", "TakenCourse")
+    Result = apps.get_model("result", "Result")
+    Session = apps.get_model("core", "Session")
+
+    session_ids = dict(Session.objects.values_list("session", "pk"))
+    current = Session.objects.filter(is_current_session=True).values_list("pk", flat=True).first()
+    taken_in = {}
+    for student_id, semester, level, session in Result.objects.order_by("pk").values_list(
+        "student_id", "semester", "level", "session"
+    ):
+        if session in session_ids:
+            taken_in[(student_id, semester, level)] = session_ids[session]
+
+    rows = {}
+    for pk, student_id, semester, level in TakenCourse.objects.values_list(
+        "pk", "student_id", "course__semester", "course__level"
+    ):
+        session_id = taken_in.get((student_id, semester, level), current)
+        if session_id is not None:
+            rows.setdefault(session_id, []).append(pk)
+    for session_id, pks in rows.items():
+        for start in range(0, len(pks), 500):
+            TakenCourse.objects.filter(pk__in=pks[start:start + 500]).update(session_id=session_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_newsandevents_summary_es_newsandevents_summary_fr_and_more'),
+        ('result', '0005_published_result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='takencourse',
+            name='session',
+            field=models.ForeignKey(blank=True, help_text='Session the course was taken in; the current one for new rows', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='taken_courses', to='core.session'),
+        ),
+        migrations.RunPython(fill_sessions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='gradingscheme',
+            constraint=models.UniqueConstraint(condition=models.Q(('session__isnull', True)), fields=('program',), name='unique_grading_scheme_per_program'),
+        ),
+        migrations.AddConstraint(
+            model_name='gradingscheme',
+            constraint=models.UniqueConstraint(condition=models.Q(('program__isnull', True)), fields=('session',), name='unique_grading_scheme_per_session'),
+        ),
+        migrations.AddConstraint(
+            model_name='gradingscheme',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('program', 0), condition=models.Q(('program__isnull', True), ('session__isnull', True)), name='unique_default_grading_scheme'),
+        ),
+    ]
@@ -1,12 +1,16 @@
 from decimal import Decimal
 from django.conf import settings
 
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.urls import reverse
+from django.utils import timezone
 
 from accounts.models import Student
-from core.models import Semester
-from course.models import Course
+from core.models import Semester, Session
+from course.models import Course, Program
 
 A_PLUS = "A+"
 A = "A"
@@ -79,6 +83,14 @@ class TakenCourse(models.Model):
     course = models.ForeignKey(
         Course, on_delete=models.CASCADE, related_name="taken_courses"
     )
+    session = models.ForeignKey(
+        Session,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="taken_courses",
+        help_text="Session the course was taken in; the current one for new rows",
+    )
     assignment = models.DecimalField(
         max_digits=5, decimal_places=2, default=Decimal("0.00")
     )
@@ -105,6 +117,14 @@ class TakenCourse(models.Model):
         choices=COMMENT_CHOICES, max_length=200, blank=True, editable=False
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the row adds to the grade ledger, to update it by difference
+        loaded = instance.__dict__
+        instance._ledger_state = (loaded.get("course_id"), loaded.get("point"))
+        return instance
+
     def get_absolute_url(self):
         return reverse("course_detail", kwargs={"slug": self.course.slug})
 
@@ -140,40 +160,45 @@ class TakenCourse(models.Model):
         return Decimal(credit) * Decimal(grade_point)
 
     def save(self, *args, **kwargs):
-        self.total = self.get_total()
-        self.grade = self.get_grade()
-        self.point = self.get_point()
-        self.comment = self.get_comment()
-        super().save(*args, **kwargs)
+        from .grading import current_session_id, engine_for
+
+        if self._state.adding and self.session_id is None:
+            self.session_id = current_session_id()
+        # Graded with the grading scheme of the course's program in the session
+        # the course was taken, if one is set up; otherwise the same as
+        # get_total, get_grade, get_point, get_comment
+        engine = engine_for(self.course.program_id, self.session_id)
+        scores = [
+            self.assignment, self.mid_exam, self.quiz, self.attendance, self.final_exam
+        ]
+        graded = engine.grade([scores], [self.course.credit])
+        self.total, self.grade, self.point, self.comment = next(graded.rows())
+        # The grade ledger is updated by a post_save signal in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def calculate_gpa(self):
+        from .ledger import average
+
         current_semester = Semester.objects.filter(is_current_semester=True).first()
         if not current_semester:
             return Decimal("0.00")
 
-        taken_courses = TakenCourse.objects.filter(
-            student=self.student,
-            course__level=self.student.level,
-            course__semester=current_semester.semester,
-        )
-
-        total_points = sum(tc.point for tc in taken_courses)
-        total_credits = sum(tc.course.credit for tc in taken_courses)
-
-        if total_credits > 0:
-            gpa = total_points / Decimal(total_credits)
-            return round(gpa, 2)
+        ledger = GradeLedger.objects.filter(
+            student_id=self.student_id,
+            level=self.student.level,
+            semester=current_semester.semester,
+        ).first()
+        if ledger:
+            return average(ledger.points, ledger.credits)
         return Decimal("0.00")
 
     def calculate_cgpa(self):
-        taken_courses = TakenCourse.objects.filter(student=self.student)
+        from .ledger import average
 
-        total_points = sum(tc.point for tc in taken_courses)
-        total_credits = sum(tc.course.credit for tc in taken_courses)
-
-        if total_credits > 0:
-            cgpa = total_points / Decimal(total_credits)
-            return round(cgpa, 2)
+        ledger = CumulativeLedger.objects.filter(student_id=self.student_id).first()
+        if ledger:
+            return average(ledger.points, ledger.credits)
         return Decimal("0.00")
 
 
@@ -187,3 +212,139 @@ class Result(models.Model):
 
     def __str__(self):
         return f"Result for {self.student} - Semester: {self.semester}, Level: {self.level}"
+
+
+class GradeLedger(models.Model):
+    """Grade points and credits of a student's courses in one level and semester.
+
+    Kept up to date by ``result.ledger`` as scores change; the GPA of the
+    semester is ``points / credits``.
+    """
+
+    student = models.ForeignKey(
+        Student, on_delete=models.CASCADE, related_name="grade_ledger"
+    )
+    level = models.CharField(max_length=25, choices=settings.LEVEL_CHOICES)
+    semester = models.CharField(max_length=100, choices=settings.SEMESTER_CHOICES)
+    points = models.DecimalField(max_digits=9, decimal_places=2, default=Decimal("0.00"))
+    credits = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("student", "level", "semester")
+
+    def __str__(self):
+        return f"Ledger for {self.student} - {self.level}, {self.semester} Semester"
+
+
+class CumulativeLedger(models.Model):
+    """Running totals of all of a student's courses, for the CGPA."""
+
+    student = models.OneToOneField(
+        Student, on_delete=models.CASCADE, related_name="cumulative_ledger"
+    )
+    points = models.DecimalField(max_digits=9, decimal_places=2, default=Decimal("0.00"))
+    credits = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Cumulative ledger for {self.student}"
+
+
+class GradingScheme(models.Model):
+    """Grade boundaries and points used instead of ``GRADE_BOUNDARIES``.
+
+    A scheme applies to the courses of its program in its session; leave
+    either empty to cover all of them. The most specific scheme wins.
+    """
+
+    name = models.CharField(max_length=100)
+    program = models.ForeignKey(
+        Program,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="grading_schemes",
+    )
+    session = models.ForeignKey(
+        Session,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="grading_schemes",
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("program", "session")
+        # unique_together lets NULLs repeat; one scheme per scope all the same
+        constraints = [
+            models.UniqueConstraint(
+                fields=["program"],
+                condition=models.Q(session__isnull=True),
+                name="unique_grading_scheme_per_program",
+            ),
+            models.UniqueConstraint(
+                fields=["session"],
+                condition=models.Q(program__isnull=True),
+                name="unique_grading_scheme_per_session",
+            ),
+            models.UniqueConstraint(
+                Coalesce("program", 0),
+                condition=models.Q(program__isnull=True, session__isnull=True),
+                name="unique_default_grading_scheme",
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        # The constraints with a condition are not checked by model validation
+        same_scope = GradingScheme.objects.filter(
+            program_id=self.program_id, session_id=self.session_id
+        ).exclude(pk=self.pk)
+        if same_scope.exists():
+            raise ValidationError("A grading scheme for this program and session already exists.")
+
+
+class GradeBoundary(models.Model):
+    scheme = models.ForeignKey(
+        GradingScheme, on_delete=models.CASCADE, related_name="boundaries"
+    )
+    grade = models.CharField(choices=GRADE_CHOICES, max_length=2)
+    minimum = models.DecimalField(
+        max_digits=5, decimal_places=2, help_text="Lowest total that earns this grade"
+    )
+    point = models.DecimalField(max_digits=4, decimal_places=2)
+    passing = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ["-minimum"]
+        unique_together = ("scheme", "grade")
+
+    def __str__(self):
+        return f"{self.grade} from {self.minimum}"
+
+
+class PublishedResult(models.Model):
+    """A student's result pages frozen when a semester's results are published.
+
+    Written by ``result.publishing``; once a student has one, the result
+    pages show the latest published snapshot instead of the live scores.
+    """
+
+    student = models.ForeignKey(
+        Student, on_delete=models.CASCADE, related_name="published_results"
+    )
+    semester = models.CharField(max_length=100, choices=settings.SEMESTER_CHOICES)
+    session = models.CharField(max_length=100)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    fingerprint = models.CharField(max_length=64)
+    published_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ("student", "semester", "session")
+        indexes = [models.Index(fields=["student", "-published_at"])]
+
+    def __str__(self):
+        return f"Published result for {self.student} - {self.semester} Semester, {self.session}"
@@ -0,0 +1,363 @@
+"""PDF rendering of result sheets and course registration forms.
+
+Paragraph styles, table styles and the logo are built once per process.
+Documents are rendered into memory from plain data (see
+:func:`result_sheet_data` and :func:`registration_form_data`), which can be
+pickled to worker processes. Result sheets are cached under a fingerprint of
+that data, so an unchanged sheet is served from the cache and its
+fingerprint doubles as a stable ETag.
+"""
+import hashlib
+import json
+import os
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.html import escape
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT, TA_RIGHT
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import (
+    Image,
+    Paragraph,
+    SimpleDocTemplate,
+    Spacer,
+    Table,
+    TableStyle,
+)
+
+from .models import FAIL, PASS, TakenCourse
+
+DEFAULTS = {
+    "CACHE": "default",
+    "CACHE_TIMEOUT": 60 * 60 * 24 * 7,
+}
+
+# Change when the layout changes, so cached sheets are rendered again
+LAYOUT_VERSION = 1
+
+CM = 2.54
+
+RESULT_SHEET_HEADER = ("S/N", "ID NO.", "FULL NAME", "TOTAL", "GRADE", "POINT", "COMMENT")
+
+REGISTRATION_FORM_HEADER = ("S/No", "Course Code", "Course Title", "Unit")
+
+# Header row in white on black, grid around the student rows
+RESULT_TABLE_STYLE = [
+    ("BACKGROUND", (0, 0), (-1, 0), colors.black),
+    ("TEXTCOLOR", (1, 0), (-1, 0), colors.white),
+    ("TEXTCOLOR", (0, 0), (0, 0), colors.cyan),
+    ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+    ("VALIGN", (0, 0), (-1, 0), "MIDDLE"),
+    ("INNERGRID", (0, 1), (-1, -1), 0.05, colors.black),
+    ("BOX", (0, 0), (-1, -1), 0.1, colors.black),
+]
+
+
+# Header row centred, grid around every cell
+REGISTRATION_TABLE_STYLE = [
+    ("ALIGN", (0, 0), (1, -1), "CENTER"),
+    ("ALIGN", (3, 0), (3, -1), "CENTER"),
+    ("ALIGN", (2, 0), (2, -1), "LEFT"),
+    ("VALIGN", (0, 0), (-1, 0), "MIDDLE"),
+    ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
+    ("INNERGRID", (0, 0), (-1, -1), 0.25, colors.black),
+    ("BOX", (0, 0), (-1, -1), 0.25, colors.black),
+]
+
+
+def pdf_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "RESULT_PDF", {})}
+
+
+@lru_cache(maxsize=None)
+def styles() -> dict:
+    """Paragraph styles shared by every sheet."""
+    normal = getSampleStyleSheet()["Normal"]
+    return {
+        "normal": normal,
+        "right": ParagraphStyle(name="right", parent=normal, alignment=TA_RIGHT),
+        "title": ParagraphStyle(
+            name="title", parent=normal, alignment=TA_CENTER, fontName="Helvetica",
+            fontSize=12, leading=15,
+        ),
+        "subtitle": ParagraphStyle(
+            name="subtitle", parent=normal, alignment=TA_CENTER, fontName="Helvetica",
+            fontSize=10, leading=15,
+        ),
+        "form_title": ParagraphStyle(
+            name="form_title", parent=normal, alignment=TA_CENTER, fontName="Helvetica",
+            fontSize=12, leading=18,
+        ),
+        "school": ParagraphStyle(
+            name="school", parent=normal, alignment=TA_CENTER, fontName="Helvetica",
+            fontSize=10, leading=18,
+        ),
+        "department": ParagraphStyle(
+            name="department", parent=normal, alignment=TA_CENTER, fontName="Helvetica",
+            fontSize=9, leading=18,
+        ),
+        "semester": ParagraphStyle(
+            name="semester", parent=normal, alignment=TA_LEFT, fontName="Helvetica",
+            fontSize=9, leading=18,
+        ),
+        "credit_total": ParagraphStyle(
+            name="credit_total", parent=normal, alignment=TA_LEFT, fontName="Helvetica",
+            fontSize=8, leading=18,
+        ),
+        "certification": ParagraphStyle(
+            name="certification", parent=normal, alignment=TA_JUSTIFY,
+            fontName="Helvetica", fontSize=8, leading=18,
+        ),
+    }
+
+
+@lru_cache(maxsize=None)
+def logo_bytes() -> bytes:
+    """The brand image, read from disk once."""
+    with open(os.path.join(settings.STATICFILES_DIRS[0], "img", "brand.png"), "rb") as f:
+        return f.read()
+
+
+def logo(offset_x: float, offset_y: float) -> Image:
+    image = Image(BytesIO(logo_bytes()), 1 * inch, 1 * inch)
+    image._offs_x = offset_x
+    image._offs_y = offset_y
+    return image
+
+
+def picture(path: str, offset_x: float, offset_y: float):
+    """A 1 inch image placed by offset, or None if the file is missing."""
+    if not path or not os.path.exists(path):
+        return None
+    image = Image(path, 1 * inch, 1 * inch)
+    image._offs_x = offset_x
+    image._offs_y = offset_y
+    return image
+
+
+def result_sheet_data(course, lecturer, semester, session, taken_courses=None) -> dict:
+    """Everything printed on a course's result sheet, as plain data.
+
+    Reads the course's ``TakenCourse`` rows with their students in one query,
+    unless they are given (with ``student__student`` loaded).
+    """
+    rows = taken_courses
+    if rows is None:
+        rows = (
+            TakenCourse.objects.filter(course=course)
+            .select_related("student__student")
+            .order_by("pk")
+        )
+    students = [
+        [
+            taken.student.student.username.upper(),
+            taken.student.student.get_full_name.capitalize(),
+            str(taken.total),
+            taken.grade,
+            str(taken.point),
+            taken.comment,
+        ]
+        for taken in rows
+    ]
+    return {
+        "semester": str(semester),
+        "session": str(session),
+        "course": str(course),
+        "level": course.level,
+        "lecturer": lecturer.get_full_name if lecturer else "",
+        "rows": students,
+        "passed": sum(row[5] == PASS for row in students),
+        "failed": sum(row[5] == FAIL for row in students),
+    }
+
+
+def fingerprint(data: dict) -> str:
+    """Hash identifying the rendered output of ``data``."""
+    payload = json.dumps([LAYOUT_VERSION, data], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cached_result_sheet(data: dict) -> tuple:
+    """Return ``(pdf bytes, fingerprint)``, rendering only on a cache miss."""
+    key = fingerprint(data)
+    options = pdf_settings()
+    cache = caches[options["CACHE"]]
+    pdf = cache.get(f"result_sheet:{key}")
+    if pdf is None:
+        pdf = render_result_sheet(data)
+        cache.set(f"result_sheet:{key}", pdf, options["CACHE_TIMEOUT"])
+    return pdf, key
+
+
+def render_result_sheet(data: dict) -> bytes:
+    """Render a result sheet from :func:`result_sheet_data` output."""
+    style = styles()
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer, rightMargin=0, leftMargin=6.5 * CM, topMargin=0.3 * CM, bottomMargin=0
+    )
+    story = [Spacer(1, 0.2), logo(-200, -45)]
+
+    title = f"<b> {data['semester']} Semester {data['session']} Result Sheet</b>"
+    story.append(Paragraph(title.upper(), style["title"]))
+    story.append(Spacer(1, 0.1 * inch))
+    lecturer = f"<b>Course lecturer: {data['lecturer']}</b>"
+    story.append(Paragraph(lecturer.upper(), style["subtitle"]))
+    story.append(Spacer(1, 0.1 * inch))
+    story.append(Paragraph(f"<b>Level: </b>{data['level']}".upper(), style["subtitle"]))
+    story.append(Spacer(1, 0.6 * inch))
+
+    body = [
+        [index, username, Paragraph(escape(name), style["normal"]), total, grade, point, comment]
+        for index, (username, name, total, grade, point, comment) in enumerate(
+            data["rows"], start=1
+        )
+    ]
+    commands = RESULT_TABLE_STYLE + [
+        ("TEXTCOLOR", (0, row), (-1, row), colors.red)
+        for row, (*_, grade, _, _) in enumerate(data["rows"], start=1)
+        if grade == "F"
+    ]
+    table = Table(
+        [RESULT_SHEET_HEADER] + body,
+        colWidths=len(RESULT_SHEET_HEADER) * [inch],
+        rowHeights=[0.5 * inch] + len(body) * [None],
+        repeatRows=1,
+    )
+    table.setStyle(TableStyle(commands))
+    story.append(table)
+
+    story.append(Spacer(1, 1 * inch))
+    story.append(Table([
+        [
+            Paragraph("<b>Date:</b>_____________________________", style["normal"]),
+            Paragraph(f"<b>No. of PASS:</b> {data['passed']}", style["right"]),
+        ],
+        [
+            Paragraph(
+                "<b>Siganture / Stamp:</b> _____________________________", style["normal"]
+            ),
+            Paragraph(f"<b>No. of FAIL: </b>{data['failed']}", style["right"]),
+        ],
+    ]))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def result_sheet_filename(data: dict) -> str:
+    name = f"{data['semester']}_semester_{data['session']}_{data['course']}_resultSheet.pdf"
+    return name.replace("/", "-")
+
+
+
+def registration_form_data(student, taken_courses, session) -> dict:
+    """Everything printed on a student's course registration form, as plain data.
+
+    Args:
+        student: The ``Student``, with ``student`` (the user) loaded.
+        taken_courses: The student's ``TakenCourse`` rows, with ``course``.
+        session: The current ``Session``.
+    """
+    user = student.student
+    semesters = {settings.FIRST: [], settings.SECOND: []}
+    for taken in taken_courses:
+        course = taken.course
+        if course.semester in semesters:
+            semesters[course.semester].append(
+                [course.code.upper(), course.title, course.credit]
+            )
+    if user.picture:
+        picture_path = user.picture.path
+    else:
+        picture_path = os.path.join(settings.MEDIA_ROOT, "default.png")
+    return {
+        "username": user.username,
+        "full_name": user.get_full_name,
+        "session": str(session),
+        "level": student.level,
+        "picture": picture_path,
+        "semesters": semesters,
+    }
+
+
+def render_registration_form(data: dict) -> bytes:
+    """Render a course registration form from :func:`registration_form_data` output."""
+    style = styles()
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, rightMargin=15, leftMargin=15, topMargin=0, bottomMargin=0)
+    story = [Spacer(1, 0.5), Spacer(1, 0.4 * inch)]
+
+    # TODO: Make the institution names dynamic
+    story.append(Paragraph(
+        "<b>EZOD UNIVERSITY OF TECHNOLOGY, ADAMA</b>", style["form_title"]
+    ))
+    story.append(Paragraph(
+        "<b>SCHOOL OF ELECTRICAL ENGINEERING & COMPUTING</b>", style["school"]
+    ))
+    story.append(Spacer(1, 0.1 * inch))
+    story.append(Paragraph(
+        "<b>DEPARTMENT OF COMPUTER SCIENCE & ENGINEERING</b>", style["department"]
+    ))
+    story.append(Spacer(1, 0.3 * inch))
+    story.append(Paragraph("<b><u>STUDENT COURSE REGISTRATION FORM</u></b>", style["form_title"]))
+
+    normal = style["normal"]
+    story.append(Table([
+        [Paragraph(f"<b>Registration Number : {escape(data['username'].upper())}</b>", normal)],
+        [Paragraph(f"<b>Name : {escape(data['full_name'].upper())}</b>", normal)],
+        [
+            Paragraph(f"<b>Session : {escape(data['session'].upper())}</b>", normal),
+            Paragraph(f"<b>Level: {data['level']}</b>", normal),
+        ],
+    ]))
+    story.append(Spacer(1, 0.6 * inch))
+
+    for semester, label in ((settings.FIRST, "FIRST"), (settings.SECOND, "SECOND")):
+        courses = data["semesters"][semester]
+        story.append(Paragraph(f"<b>{label} SEMESTER</b>", style["semester"]))
+        header = list(REGISTRATION_FORM_HEADER) + [
+            Paragraph("<b>Name, Signature of course lecturer & Date</b>", normal)
+        ]
+        body = [
+            [index, code, Paragraph(escape(title), normal), credit, ""]
+            for index, (code, title, credit) in enumerate(courses, start=1)
+        ]
+        table = Table(
+            [header] + body,
+            colWidths=5 * [1.4 * inch],
+            rowHeights=[0.5 * inch] + len(body) * [0.3 * inch],
+            repeatRows=1,
+        )
+        table.setStyle(TableStyle(REGISTRATION_TABLE_STYLE))
+        story.append(table)
+        total = sum(credit for _, _, credit in courses)
+        story.append(Paragraph(
+            f"<b>Total {label.title()} Semester Credit : {total}</b>", style["credit_total"]
+        ))
+        story.append(Spacer(1, 0.6 * inch if semester == settings.FIRST else 2))
+
+    story.append(Paragraph(
+        f"CERTIFICATION OF REGISTRATION: I certify that "
+        f"<b>{escape(data['full_name'].upper())}</b> has been duly registered for the "
+        f"<b>{data['level']} level </b> of study in the department of COMPUTER SICENCE "
+        f"& ENGINEERING and that the courses and credits registered are as approved "
+        f"by the senate of the University",
+        style["certification"],
+    ))
+
+    story.append(logo(-218, 480))
+    student_picture = picture(data["picture"], 218, 550)
+    if student_picture:
+        story.append(student_picture)
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def registration_form_filename(data: dict) -> str:
+    return f"{data['username']}.pdf".replace("/", "-")
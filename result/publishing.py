@@ -0,0 +1,171 @@
+"""Publishing of semester results as per-student snapshots.
+
+:func:`publish` freezes what each student's result pages show into a
+``PublishedResult`` row of plain JSON. From then on the student views read
+that row, one indexed lookup per page, instead of the live tables that
+lecturers keep writing to. Publishing again only rewrites the snapshots
+whose content changed, found by comparing fingerprints.
+"""
+import hashlib
+import json
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import Student
+from core.models import Semester, Session
+from .grading import SCORE_FIELDS
+from .loaders import StudentResults, load_results_for, load_student_results
+from .models import PublishedResult
+
+# Students loaded, compared and written per transaction by ``publish``
+PUBLISH_BATCH_SIZE = 500
+
+COURSE_FIELDS = ("title", "code", "slug", "credit", "semester")
+DECIMAL_FIELDS = (*SCORE_FIELDS, "total", "point")
+RESULT_FIELDS = ("semester", "session", "level", "gpa", "cgpa")
+
+
+def publish(semester: str = None, session: str = None, student_ids=None,
+            batch_size: int = PUBLISH_BATCH_SIZE, progress=None) -> dict:
+    """Publish the results of a semester.
+
+    Every student with a ``Result`` in the semester gets a snapshot; those
+    already published are rewritten only if their content changed.
+
+    Args:
+        semester: Defaults to the current semester.
+        session: Defaults to the current session.
+        student_ids: Only publish these students.
+        batch_size: Students per transaction.
+        progress: Optional ``callable(done, total)`` called after each batch.
+
+    Returns:
+        A dict with the number of snapshots ``created``, ``updated`` and
+        ``unchanged``.
+    """
+    semester = semester or Semester.objects.get(is_current_semester=True).semester
+    session = session or Session.objects.get(is_current_session=True).session
+    students = (
+        Student.objects.filter(result__semester=semester, result__session=session)
+        .distinct()
+        .order_by("pk")
+    )
+    if student_ids:
+        students = students.filter(pk__in=student_ids)
+    student_ids = list(students.values_list("pk", flat=True))
+
+    summary = {"created": 0, "updated": 0, "unchanged": 0}
+    for start in range(0, len(student_ids), batch_size):
+        batch = Student.objects.filter(pk__in=student_ids[start:start + batch_size])
+        _publish_batch(load_results_for(batch), semester, session, summary)
+        if progress:
+            progress(min(start + batch_size, len(student_ids)), len(student_ids))
+    return summary
+
+
+def student_results(user_id: int) -> StudentResults:
+    """Results for the pages of a student: the latest published snapshot,
+    or the live results if the student has none."""
+    data = (
+        PublishedResult.objects.filter(student__student_id=user_id)
+        .order_by("-published_at")
+        .values_list("data", flat=True)
+        .first()
+    )
+    if data is None:
+        return load_student_results(user_id)
+    return from_snapshot(data)
+
+
+def snapshot(results: StudentResults) -> dict:
+    """The JSON data of a student's result pages."""
+    return {
+        "student": {"level": results.student.level},
+        "semesters": {
+            semester: [_course_row(taken) for taken in rows]
+            for semester, rows in results.semesters.items()
+        },
+        "credits": results.credits,
+        "results": [
+            {field: getattr(result, field) for field in RESULT_FIELDS}
+            for result in results.results
+        ],
+        "previous_cgpa": results.previous_cgpa,
+    }
+
+
+def from_snapshot(data: dict) -> StudentResults:
+    """Rebuild :class:`StudentResults` from :func:`snapshot` data.
+
+    The rows are plain objects with the attributes the templates use.
+    """
+    semesters = {
+        semester: [_course_object(row) for row in rows]
+        for semester, rows in data["semesters"].items()
+    }
+    return StudentResults(
+        student=SimpleNamespace(**data["student"]),
+        courses=[taken for rows in semesters.values() for taken in rows],
+        results=[SimpleNamespace(**row) for row in data["results"]],
+        semesters=semesters,
+        credits=data["credits"],
+        previous_cgpa=data["previous_cgpa"],
+    )
+
+
+def fingerprint(data: dict) -> str:
+    """Hash of snapshot data, to tell which snapshots changed."""
+    payload = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# -- Private helpers ------------------------------------------------------
+
+def _publish_batch(loaded: dict, semester: str, session: str, summary: dict) -> None:
+    existing = {
+        published.student_id: published
+        for published in PublishedResult.objects.filter(
+            student_id__in=list(loaded), semester=semester, session=session
+        ).only("student_id", "fingerprint")
+    }
+    now = timezone.now()
+    created, updated = [], []
+    for student_id, results in loaded.items():
+        data = snapshot(results)
+        key = fingerprint(data)
+        published = existing.get(student_id)
+        if published is None:
+            created.append(
+                PublishedResult(
+                    student_id=student_id, semester=semester, session=session,
+                    data=data, fingerprint=key, published_at=now, updated_at=now,
+                )
+            )
+        elif published.fingerprint != key:
+            published.data, published.fingerprint, published.updated_at = data, key, now
+            updated.append(published)
+    with transaction.atomic():
+        PublishedResult.objects.bulk_create(created)
+        PublishedResult.objects.bulk_update(updated, ["data", "fingerprint", "updated_at"])
+    summary["created"] += len(created)
+    summary["updated"] += len(updated)
+    summary["unchanged"] += len(loaded) - len(created) - len(updated)
+
+
+def _course_row(taken) -> dict:
+    row = {field: getattr(taken, field) for field in (*DECIMAL_FIELDS, "grade", "comment")}
+    row["course"] = {field: getattr(taken.course, field) for field in COURSE_FIELDS}
+    return row
+
+
+def _course_object(row: dict) -> SimpleNamespace:
+    values = dict(row)
+    for field in DECIMAL_FIELDS:
+        if values[field] is not None:
+            values[field] = Decimal(values[field])
+    values["course"] = SimpleNamespace(**row["course"])
+    return SimpleNamespace(**values)
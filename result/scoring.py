@@ -0,0 +1,151 @@
+"""Bulk score entry for a course.
+
+``submit_scores`` grades every submitted row in one vectorized pass (see
+``result.grading``), writes them with one ``bulk_update``, adds the changes to
+the grade ledger (see ``result.ledger``), reads GPA and CGPA for all affected
+students from it and upserts their ``Result`` rows in bulk. The number of
+queries does not depend on the size of the class.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .analytics import invalidate
+from .grading import GRADED_FIELDS, SCORE_FIELDS, grade_rows
+from .ledger import apply_changes, student_gpas
+from .models import Result, TakenCourse
+
+# Scores are stored with max_digits=5, decimal_places=2
+MAX_SCORE = Decimal("999.99")
+TWO_PLACES = Decimal("0.01")
+
+
+class ScoreSubmissionError(ValueError):
+    """Raised when submitted scores are invalid; ``errors`` lists each problem."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(errors))
+
+
+def parse_scores(data) -> dict:
+    """Read the score form: one list of ``SCORE_FIELDS`` values per TakenCourse id.
+
+    Args:
+        data: A ``QueryDict`` keyed by TakenCourse id, as posted by
+            ``add_score_for``. Other keys (the CSRF token) are ignored.
+
+    Returns:
+        ``{taken_course_id: {field: Decimal}}``.
+
+    Raises:
+        ScoreSubmissionError: If any value is missing, not a number, negative
+            or too large.
+    """
+    scores, errors = {}, []
+    for key in data.keys():
+        if not key.isdigit():
+            continue
+        values = data.getlist(key)
+        if len(values) != len(SCORE_FIELDS):
+            errors.append(f"Row {key}: expected {len(SCORE_FIELDS)} scores")
+            continue
+        row = {}
+        for field, value in zip(SCORE_FIELDS, values):
+            try:
+                score = Decimal(str(value).strip() or "0")
+            except InvalidOperation:
+                score = None
+            if score is None or not score.is_finite():
+                errors.append(f"Row {key}: {field} is not a number")
+                continue
+            score = score.quantize(TWO_PLACES)
+            if not Decimal("0") <= score <= MAX_SCORE:
+                errors.append(f"Row {key}: {field} must be between 0 and {MAX_SCORE}")
+                continue
+            row[field] = score
+        scores[int(key)] = row
+    if errors:
+        raise ScoreSubmissionError(errors)
+    return scores
+
+
+def submit_scores(taken_courses, scores: dict, semester, session) -> dict:
+    """Save ``scores`` and refresh the GPA, CGPA and ``Result`` of each student.
+
+    Args:
+        taken_courses: ``TakenCourse`` queryset the submitted ids must belong
+            to, e.g. the lecturer's students in one course.
+        scores: Output of :func:`parse_scores`.
+        semester: The current ``Semester``; its GPA is recomputed.
+        session: The current ``Session``.
+
+    Returns:
+        A dict with the number of rows ``scored`` and of ``Result`` rows
+        ``created`` and ``updated``.
+
+    Raises:
+        ScoreSubmissionError: If an id is not in ``taken_courses``.
+    """
+    with transaction.atomic():
+        # Locked before grading, so the ledger gets the change from the point
+        # actually stored when a row is submitted twice at the same time
+        rows = list(
+            TakenCourse.objects.filter(pk__in=taken_courses.filter(pk__in=scores).values("pk"))
+            .select_related("course", "student")
+            .select_for_update(of=("self",))
+            .order_by("pk")
+        )
+        unknown = set(scores) - {row.pk for row in rows}
+        if unknown:
+            raise ScoreSubmissionError(
+                [f"Row {pk}: not a student of this course" for pk in sorted(unknown)]
+            )
+
+        for row in rows:
+            for field, value in scores[row.pk].items():
+                setattr(row, field, value)
+        grade_rows(rows)
+
+        students = {row.student_id: row.student for row in rows}
+        TakenCourse.objects.bulk_update(rows, SCORE_FIELDS + GRADED_FIELDS)
+        apply_changes(rows)
+        invalidate(rows)
+        gpas = student_gpas(students, semester.semester)
+        created, updated = upsert_results(students, gpas, str(semester), str(session))
+    return {"scored": len(rows), "created": created, "updated": updated}
+
+
+def upsert_results(students: dict, gpas: dict, semester: str, session: str) -> tuple:
+    """Create or update each student's ``Result`` for ``semester`` and ``session``.
+
+    ``students`` maps ids to ``Student`` objects and ``gpas`` is the output
+    of ``result.ledger.student_gpas``.
+
+    Returns:
+        ``(created, updated)`` row counts.
+    """
+    existing = Result.objects.filter(
+        student_id__in=list(students), semester=semester, session=session
+    )
+    by_key = {}
+    for result in existing:
+        by_key.setdefault((result.student_id, result.level), []).append(result)
+
+    to_update, to_create = [], []
+    for student_id, student in students.items():
+        gpa, cgpa = (float(value) for value in gpas[student_id])
+        matches = by_key.get((student_id, student.level))
+        if matches:
+            for result in matches:
+                result.gpa, result.cgpa = gpa, cgpa
+            to_update.extend(matches)
+        else:
+            to_create.append(Result(
+                student_id=student_id, gpa=gpa, cgpa=cgpa, semester=semester,
+                session=session, level=student.level,
+            ))
+    Result.objects.bulk_update(to_update, ["gpa", "cgpa"])
+    Result.objects.bulk_create(to_create)
+    return len(to_create), len(to_update)
+
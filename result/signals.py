@@ -0,0 +1,65 @@
+from django.utils import timezone
+
+from .analytics import invalidate
+from course.models import Course
+from .grading import regrade_course, reset_schemes
+from .ledger import COURSE_FIELDS, record_delete, record_save
+from .models import GradeBoundary, GradingScheme
+
+
+def post_save_taken_course_receiver(instance=None, created=False, update_fields=None, **kwargs):
+    """
+    Add the change in the course's grade points to the student's ledger, and
+    drop the cached grade statistics of its course and program
+    """
+    if kwargs.get("raw"):
+        return
+    invalidate([instance])
+    if update_fields is not None and not {"course", "point"} & set(update_fields):
+        return
+    record_save(instance, created)
+
+
+def post_delete_taken_course_receiver(instance=None, **kwargs):
+    """
+    Take a dropped course out of the student's ledger
+    """
+    record_delete(instance)
+    invalidate([instance])
+
+
+def pre_save_course_receiver(instance=None, raw=False, **kwargs):
+    """
+    Note whether the course's credit, level or semester is about to change
+    """
+    instance._ledger_changed = False
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    stored = Course.objects.filter(pk=instance.pk).values_list(*COURSE_FIELDS).first()
+    current = tuple(getattr(instance, field) for field in COURSE_FIELDS)
+    instance._ledger_changed = stored is not None and stored != current
+
+
+def post_save_course_receiver(instance=None, created=False, update_fields=None, **kwargs):
+    """
+    Regrade the course's rows and rebuild its students' ledger and GPAs
+    after its credit, level or semester changed
+    """
+    if kwargs.get("raw") or created or not getattr(instance, "_ledger_changed", False):
+        return
+    if update_fields is not None and not set(COURSE_FIELDS) & set(update_fields):
+        return
+    regrade_course(instance.pk)
+
+
+def grading_scheme_changed_receiver(instance=None, **kwargs):
+    """
+    Recompile the grading engines after a scheme, one of its boundaries or
+    the current session changes
+    """
+    if isinstance(instance, GradeBoundary):
+        # A new updated_at tells other processes to recompile the scheme
+        GradingScheme.objects.filter(pk=instance.scheme_id).update(
+            updated_at=timezone.now()
+        )
+    reset_schemes()
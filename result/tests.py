@@ -1,3 +1,827 @@
-from django.test import TestCase
+from decimal import Decimal
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import Student
+from core.models import Semester, Session
+from course.models import Course, CourseAllocation, Program
+from . import ledger
+from .analytics import course_analytics, program_analytics
+from .bulk_pdf import REGISTRATION_FORM, RENDERERS, collect_jobs, generate
+from .grading import GradingEngine, default_engine, engine_for, regrade, reset_schemes
+from .models import (
+    CumulativeLedger,
+    GradeBoundary,
+    GradeLedger,
+    GradingScheme,
+    PublishedResult,
+    Result,
+    TakenCourse,
+)
+from .pdf import fingerprint, render_result_sheet, result_sheet_data
+from .publishing import publish
+from .scoring import ScoreSubmissionError, parse_scores, submit_scores
+
+User = get_user_model()
+
+
+class ResultDataMixin:
+    """Program, current session and semester, a lecturer and a course."""
+
+    def setUp(self):
+        # Schemes cached by an earlier test may have been rolled back
+        reset_schemes()
+        self.addCleanup(reset_schemes)
+        self.program = Program.objects.create(title="Computer Science")
+        self.session = Session.objects.create(session="2024/2025", is_current_session=True)
+        self.semester = Semester.objects.create(
+            semester="First", is_current_semester=True, session=self.session
+        )
+        self.lecturer = User.objects.create_user(
+            username="lecturer", password="pw", is_lecturer=True
+        )
+        self.course = self.make_course("CS101", credit=3)
+        allocation = CourseAllocation.objects.create(
+            lecturer=self.lecturer, session=self.session
+        )
+        allocation.courses.add(self.course)
+        self.students = []
+
+    def make_course(self, code, credit=3, semester="First", level="Bachelor"):
+        return Course.objects.create(
+            title=f"Course {code}", code=code, credit=credit, program=self.program,
+            level=level, semester=semester,
+        )
+
+    def make_students(self, count, course=None, **user_fields):
+        start = len(self.students)
+        for i in range(start, start + count):
+            user = User.objects.create_user(
+                username=f"student{i}", password="pw", **user_fields
+            )
+            student = Student.objects.create(
+                student=user, level="Bachelor", program=self.program
+            )
+            TakenCourse.objects.create(student=student, course=course or self.course)
+            self.students.append(student)
+        return self.students[start:]
+
+    def score_form(self, rows):
+        """POST data for add_score_for: five scores per TakenCourse id."""
+        return {str(pk): [str(score) for score in scores] for pk, scores in rows.items()}
+
+
+class BulkScoreTests(ResultDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.lecturer)
+        self.url = f"/en/result/manage-score/{self.course.pk}/"
+
+    def post_scores(self, scores):
+        rows = {
+            taken.pk: scores
+            for taken in TakenCourse.objects.filter(course=self.course)
+        }
+        return self.client.post(self.url, self.score_form(rows))
+
+    def test_scores_are_graded_like_model_save(self):
+        self.make_students(2)
+        other = self.make_course("CS102", credit=2)
+        TakenCourse.objects.create(
+            student=self.students[0], course=other, assignment=Decimal("40"),
+            final_exam=Decimal("40"),
+        )
+
+        response = self.post_scores(["10", "15.5", "10", "5", "40"])
+        self.assertEqual(response.status_code, 302)
+
+        taken = TakenCourse.objects.get(student=self.students[0], course=self.course)
+        self.assertEqual(taken.total, Decimal("80.50"))
+        self.assertEqual((taken.grade, taken.comment), ("A-", "PASS"))
+        self.assertEqual(taken.point, Decimal("11.25"))
+
+        result = Result.objects.get(student=self.students[0])
+        self.assertEqual((result.semester, result.session), ("First", "2024/2025"))
+        self.assertAlmostEqual(result.gpa, float(taken.calculate_gpa()))
+        self.assertAlmostEqual(result.cgpa, float(taken.calculate_cgpa()))
+        self.assertEqual(Result.objects.count(), 2)
+
+        # A second submission updates the same Result rows
+        self.post_scores(["0", "0", "0", "0", "20"])
+        self.assertEqual(Result.objects.count(), 2)
+        self.assertEqual(Result.objects.get(student=self.students[1]).gpa, 0.0)
+
+    def test_query_count_does_not_grow_with_class_size(self):
+        # Measure resubmissions, so both runs update existing Result rows
+        self.make_students(3)
+        self.post_scores(["10", "10", "10", "10", "30"])
+        with CaptureQueriesContext(connection) as small:
+            self.post_scores(["10", "10", "10", "10", "35"])
+        self.make_students(40)
+        self.post_scores(["10", "10", "10", "10", "30"])
+        with CaptureQueriesContext(connection) as large:
+            self.post_scores(["10", "10", "10", "10", "35"])
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Result.objects.count(), 43)
+
+    def test_invalid_scores_save_nothing(self):
+        self.make_students(2)
+        rows = {taken.pk: ["10", "x", "10", "10", "10"] for taken in TakenCourse.objects.all()}
+        self.client.post(self.url, self.score_form(rows))
+        self.assertFalse(TakenCourse.objects.exclude(total=0).exists())
+        self.assertFalse(Result.objects.exists())
+
+    def test_rows_of_other_courses_are_rejected(self):
+        self.make_students(1)
+        outsider = TakenCourse.objects.create(
+            student=self.students[0], course=self.make_course("CS999")
+        )
+        self.client.post(self.url, self.score_form({outsider.pk: [10] * 5}))
+        outsider.refresh_from_db()
+        self.assertEqual(outsider.total, 0)
+
+    def test_parse_scores(self):
+        from django.http import QueryDict
+
+        data = QueryDict(mutable=True)
+        data.setlist("7", ["1", "2.5", "", "4", "5"])
+        data["csrfmiddlewaretoken"] = "x"
+        self.assertEqual(parse_scores(data)[7]["mid_exam"], Decimal("2.50"))
+        self.assertEqual(parse_scores(data)[7]["quiz"], Decimal("0.00"))
+
+        data.setlist("8", ["1", "-2", "3", "NaN", "5"])
+        with self.assertRaises(ScoreSubmissionError) as ctx:
+            parse_scores(data)
+        self.assertEqual(len(ctx.exception.errors), 2)
+
+    def test_student_gpas_match_model_methods(self):
+        student, = self.make_students(1)
+        second = self.make_course("CS201", credit=4, semester="Second")
+        for course, final in ((self.course, "47"), (second, "60")):
+            taken, _ = TakenCourse.objects.get_or_create(student=student, course=course)
+            taken.final_exam = Decimal(final)
+            taken.save()
+        taken = TakenCourse.objects.filter(student=student).first()
+        gpa, cgpa = ledger.student_gpas({student.pk: student}, "First")[student.pk]
+        self.assertEqual(gpa, taken.calculate_gpa())
+        self.assertEqual(cgpa, taken.calculate_cgpa())
+
+
+class GradeLedgerTests(ResultDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.student, = self.make_students(1)
+        self.taken = TakenCourse.objects.get(student=self.student)
+
+    def score(self, taken, final_exam):
+        taken.final_exam = Decimal(final_exam)
+        taken.save()
+
+    def test_saves_and_deletes_update_the_ledger(self):
+        self.score(self.taken, "80")  # A-, 3.75 x 3 credits
+        second = TakenCourse.objects.create(
+            student=self.student, course=self.make_course("CS201", 4, "Second")
+        )
+        self.score(second, "50")  # C-, 1.75 x 4 credits
+
+        first = GradeLedger.objects.get(student=self.student, semester="First")
+        self.assertEqual((first.points, first.credits), (Decimal("11.25"), 3))
+        total = CumulativeLedger.objects.get(student=self.student)
+        self.assertEqual((total.points, total.credits), (Decimal("18.25"), 7))
+        self.assertEqual(self.taken.calculate_cgpa(), Decimal("2.61"))
+        self.assertEqual(self.taken.calculate_gpa(), Decimal("3.75"))
+
+        # Rescoring a loaded row, moving it to another course, dropping one
+        taken = TakenCourse.objects.get(pk=self.taken.pk)
+        self.score(taken, "90")
+        second.course = self.make_course("CS301", 2, "Second")
+        second.save()
+        TakenCourse.objects.filter(pk=taken.pk).delete()
+
+        self.assertEqual(ledger.verify(), [])
+        self.assertEqual(second.calculate_cgpa(), Decimal("1.75"))
+
+    def test_score_save_does_not_read_the_history(self):
+        for i in range(10):
+            course = self.make_course(f"CS2{i:02}")
+            TakenCourse.objects.create(student=self.student, course=course)
+        taken = TakenCourse.objects.select_related("course").get(pk=self.taken.pk)
+        with self.assertNumQueries(5):
+            # UPDATE of the score and of the two ledger rows, in a savepoint
+            self.score(taken, "70")
+        with self.assertNumQueries(1):
+            self.assertEqual(taken.calculate_cgpa(), Decimal("0.27"))
+
+    def test_bulk_submission_keeps_the_ledger(self):
+        self.make_students(5)
+        self.client.force_login(self.lecturer)
+        rows = {
+            pk: ["10", "10", "10", "10", "25"]
+            for pk in TakenCourse.objects.values_list("pk", flat=True)
+        }
+        self.client.post(f"/en/result/manage-score/{self.course.pk}/", self.score_form(rows))
+
+        self.assertEqual(TakenCourse.objects.filter(grade="B-").count(), 6)
+        self.assertEqual(ledger.verify(), [])
+
+    def test_submission_locks_the_rows_it_grades(self):
+        locked = []
+        select_for_update = QuerySet.select_for_update
+
+        def spy(queryset, *args, **kwargs):
+            locked.append((queryset.model, connection.in_atomic_block))
+            return select_for_update(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, "select_for_update", spy):
+            submit_scores(
+                TakenCourse.objects.filter(course=self.course),
+                {self.taken.pk: {"final_exam": Decimal(60)}},
+                self.semester, self.session,
+            )
+        self.assertIn((TakenCourse, True), locked)
+        self.assertEqual(ledger.verify(), [])
+
+    def test_course_credit_change_rebuilds_the_ledger(self):
+        self.score(self.taken, "80")  # A-, 3.75 x 3 credits
+        other = TakenCourse.objects.create(
+            student=self.student, course=self.make_course("CS201", 3)
+        )
+        self.score(other, "50")  # C-, 1.75 x 3 credits
+        result = Result.objects.create(
+            student=self.student, gpa=2.75, cgpa=2.75, semester="First",
+            session=str(self.session), level="Bachelor",
+        )
+
+        self.course.credit = 1
+        self.course.save()
+        self.taken.refresh_from_db()
+        result.refresh_from_db()
+        self.assertEqual(self.taken.point, Decimal("3.75"))
+        self.assertEqual(ledger.verify(), [])
+        self.assertEqual((result.gpa, result.cgpa), (2.25, 2.25))
+
+        # Other edits leave the ledger alone
+        with mock.patch("result.signals.regrade_course") as regrade_course:
+            self.course.title = "Renamed"
+            self.course.save()
+        regrade_course.assert_not_called()
+
+    def test_command_verifies_and_rebuilds(self):
+        self.score(self.taken, "60")
+        TakenCourse.objects.filter(pk=self.taken.pk).update(point=Decimal("0.00"))
+
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("rebuild_grade_ledger", verify=True, stdout=out)
+        self.assertIn("expected 0.00 points / 3 credits, ledger has 7.50 / 3", out.getvalue())
+
+        call_command("rebuild_grade_ledger", stdout=StringIO())
+        self.assertEqual(ledger.verify(), [])
+        self.assertEqual(self.taken.calculate_cgpa(), Decimal("0.00"))
+
+
+@override_settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class GradeResultViewTests(ResultDataMixin, TestCase):
+    def test_credits_and_previous_cgpa(self):
+        student, = self.make_students(1, is_student=True)
+        TakenCourse.objects.create(
+            student=student, course=self.make_course("CS201", 4, "Second")
+        )
+        Result.objects.create(student=student, gpa=3, cgpa=3, semester="First", level="Bachelor")
+        Result.objects.create(student=student, gpa=2, cgpa=2.5, semester="Second", level="Bachelor")
+
+        self.client.force_login(student.student)
+        response = self.client.get("/en/result/grade/")
+
+        self.assertEqual(response.context["total_first_semester_credit"], 3)
+        self.assertEqual(response.context["total_sec_semester_credit"], 4)
+        self.assertEqual(response.context["previousCGPA"], 2.5)
+        self.assertEqual(
+            [taken.course.code for taken in response.context["second_semester_courses"]],
+            ["CS201"],
+        )
+
+    def test_query_count_does_not_grow_with_courses(self):
+        student, = self.make_students(1, is_student=True)
+        self.client.force_login(student.student)
+
+        def count_queries(url):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        for i in range(2):
+            Result.objects.create(
+                student=student, gpa=3, cgpa=3, semester=("First", "Second")[i],
+                level="Bachelor", session=self.session.session,
+            )
+        urls = ("/en/result/grade/", "/en/result/assessment/")
+        few = [count_queries(url) for url in urls]
+        for i in range(10):
+            TakenCourse.objects.create(
+                student=student,
+                course=self.make_course(f"CS3{i:02}", 2, ("First", "Second")[i % 2]),
+            )
+        self.assertEqual([count_queries(url) for url in urls], few)
+
+
+@override_settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class PublishedResultTests(ResultDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.make_students(2, is_student=True)
+        for student in self.students:
+            self.score(student, "50")
+            Result.objects.create(
+                student=student, gpa=2, cgpa=2, semester="First", level="Bachelor",
+                session="2024/2025",
+            )
+
+    def score(self, student, final_exam):
+        taken = TakenCourse.objects.get(student=student, course=self.course)
+        taken.final_exam = Decimal(final_exam)
+        taken.save()
+
+    def test_pages_read_the_snapshot(self):
+        self.assertEqual(publish(), {"created": 2, "updated": 0, "unchanged": 0})
+        self.score(self.students[0], "70")
+        self.client.force_login(self.students[0].student)
+
+        for url in ("/en/result/grade/", "/en/result/assessment/"):
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            reads = [query for query in queries if "result_" in query["sql"]]
+            self.assertEqual(len(reads), 1)
+            taken, = response.context["first_semester_courses"]
+            self.assertEqual(taken.total, Decimal("50.00"))
+            self.assertEqual(taken.course.code, "CS101")
+            self.assertEqual(response.context["total_first_semester_credit"], 3)
+            self.assertContains(response, self.course.get_absolute_url())
+
+    def test_republishing_rewrites_changed_snapshots_only(self):
+        publish()
+        self.score(self.students[0], "70")
+        self.assertEqual(publish(), {"created": 0, "updated": 1, "unchanged": 1})
+
+        out = StringIO()
+        call_command("publish_results", "--semester", "First", "--session", "2024/2025",
+                     stdout=out)
+        self.assertIn("0 snapshot(s) created, 0 updated, 2 unchanged", out.getvalue())
+        published = PublishedResult.objects.get(student=self.students[0])
+        self.assertEqual(published.data["semesters"]["First"][0]["total"], "70.00")
+
+    def test_students_without_a_snapshot_see_live_results(self):
+        publish(student_ids=[self.students[1].pk])
+        self.score(self.students[0], "70")
+        self.client.force_login(self.students[0].student)
+        response = self.client.get("/en/result/grade/")
+        self.assertEqual(response.context["courses"][0].total, Decimal("70.00"))
+
+
+class GradingEngineTests(ResultDataMixin, TestCase):
+    def model_grading(self, scores, credit):
+        taken = TakenCourse(course=Course(credit=credit))
+        taken.assignment, taken.mid_exam, taken.quiz, taken.attendance, taken.final_exam = scores
+        taken.total = taken.get_total()
+        taken.grade = taken.get_grade()
+        taken.point = taken.get_point()
+        taken.comment = taken.get_comment()
+        return taken.total, taken.grade, taken.point, taken.comment
+
+    def test_matches_model_methods(self):
+        rng = random.Random(7)
+        cents = [0, 1, 99, 50, 25]
+        rows, credits = [], []
+        for _ in range(2000):
+            rows.append([
+                Decimal(rng.randint(0, 25)) + Decimal(rng.choice(cents)) / 100
+                for _ in range(5)
+            ])
+            credits.append(rng.randint(0, 6))
+        # Totals right at and just below each boundary
+        for boundary in (0, 45, 50, 55, 60, 65, 70, 75, 80, 85, 90, 100):
+            for total in (Decimal(boundary), Decimal(boundary) - Decimal("0.01")):
+                if total >= 0:
+                    rows.append([total, 0, 0, 0, 0])
+                    credits.append(3)
+
+        graded = list(default_engine().grade(rows, credits).rows())
+        for row, credit, result in zip(rows, credits, graded):
+            self.assertEqual(result, self.model_grading(row, credit), row)
+
+    def test_rejects_more_than_two_decimal_places(self):
+        with self.assertRaises(ValueError):
+            default_engine().grade([[Decimal("10.005"), 0, 0, 0, 0]], [3])
+
+    def test_regrade_after_a_boundary_change(self):
+        self.make_students(5)
+        for taken, final in zip(TakenCourse.objects.all(), (40, 44, 45, 60, 95)):
+            taken.final_exam = Decimal(final)
+            taken.save()
+
+        stricter = GradingEngine(
+            boundaries=[(90, "A+"), (60, "C"), (50, "D"), (0, "F")],
+        )
+        progress = []
+        changed = regrade(engine=stricter, batch_size=2,
+                          progress=lambda done, changed: progress.append((done, changed)))
+
+        self.assertEqual(changed, 2)
+        self.assertEqual(progress, [(2, 0), (4, 2), (5, 2)])
+        grades = list(TakenCourse.objects.order_by("pk").values_list("grade", "point"))
+        self.assertEqual(grades, [
+            ("F", Decimal("0")), ("F", Decimal("0")), ("F", Decimal("0")),
+            ("C", Decimal("6")), ("A+", Decimal("12")),
+        ])
+        self.assertEqual(ledger.verify(), [])
+
+        # Back to the default policy
+        self.assertEqual(regrade(), 2)
+        self.assertEqual(regrade(), 0)
+
+
+class GradingSchemeTests(ResultDataMixin, TestCase):
+    def make_scheme(self, name, boundaries, **scope):
+        scheme = GradingScheme.objects.create(name=name, **scope)
+        for minimum, grade, point, passing in boundaries:
+            GradeBoundary.objects.create(
+                scheme=scheme, grade=grade, minimum=minimum, point=point, passing=passing
+            )
+        return scheme
+
+    def test_most_specific_scheme_applies(self):
+        other = Program.objects.create(title="Physics")
+        self.make_scheme("Global", [(50, "A", 4, True), (0, "F", 0, False)])
+        self.make_scheme(
+            "Program", [(70, "A", 4, True), (0, "F", 0, False)], program=self.program
+        )
+        self.make_scheme(
+            "Program and session", [(80, "A", 4, True), (0, "F", 0, False)],
+            program=self.program, session=self.session,
+        )
+        old_session = Session.objects.create(session="2023/2024")
+
+        def threshold(engine):
+            return engine.thresholds.tolist()
+
+        self.assertEqual(threshold(engine_for(self.program.pk)), [0, 8000])
+        self.assertEqual(threshold(engine_for(self.program.pk, old_session.pk)), [0, 7000])
+        self.assertEqual(threshold(engine_for(other.pk)), [0, 5000])
+        with self.assertNumQueries(0):
+            engine_for(self.program.pk)
+
+        GradingScheme.objects.all().delete()
+        self.assertIs(engine_for(self.program.pk), default_engine())
+
+    def test_save_and_regrade_follow_the_scheme(self):
+        self.make_students(3)
+        for taken, final in zip(TakenCourse.objects.order_by("pk"), (40, 62, 85)):
+            taken.final_exam = Decimal(final)
+            taken.save()
+        for student in self.students:
+            Result.objects.create(
+                student=student, gpa=0, cgpa=0, semester="First",
+                session=str(self.session), level="Bachelor",
+            )
+
+        scheme = self.make_scheme(
+            "Pass/fail", [(60, "A", Decimal("3.50"), True), (0, "D", 1, False)],
+            program=self.program,
+        )
+        # New scores are graded with the scheme straight away
+        student, = self.make_students(1)
+        taken = TakenCourse.objects.get(student=student)
+        taken.final_exam = Decimal("59.99")
+        taken.save()
+        self.assertEqual((taken.grade, taken.point, taken.comment), ("D", 3, "FAIL"))
+
+        out = StringIO()
+        call_command("regrade_results", batch_size=2, stdout=out)
+        self.assertIn("2/4 row(s) graded, 2 changed", out.getvalue())
+        self.assertIn("Regraded 4 row(s), 3 changed", out.getvalue())
+        grades = TakenCourse.objects.order_by("pk").values_list("grade", "point", "comment")
+        self.assertEqual(list(grades), [
+            ("D", Decimal("3"), "FAIL"),
+            ("A", Decimal("10.5"), "PASS"),
+            ("A", Decimal("10.5"), "PASS"),
+            ("D", Decimal("3"), "FAIL"),
+        ])
+        self.assertEqual(ledger.verify(), [])
+        result = Result.objects.get(student=self.students[1])
+        self.assertEqual((result.gpa, result.cgpa), (3.5, 3.5))
+
+        # Editing a boundary is picked up without a restart
+        boundary = scheme.boundaries.get(grade="A")
+        boundary.minimum = 80
+        boundary.save()
+        self.assertEqual(regrade(), 1)
+        self.assertEqual(Result.objects.get(student=self.students[1]).gpa, 1.0)
+
+    def test_rows_of_past_sessions_keep_their_scheme(self):
+        student, = self.make_students(1)
+        taken = TakenCourse.objects.get(student=student)
+        self.assertEqual(taken.session, self.session)
+        taken.final_exam = Decimal(65)
+        taken.save()
+        self.assertEqual(taken.grade, "B-")
+
+        # The next session gets a stricter scheme
+        self.session.is_current_session = False
+        self.session.save()
+        new_session = Session.objects.create(session="2025/2026", is_current_session=True)
+        self.make_scheme(
+            "Strict", [(70, "A", 4, True), (0, "F", 0, False)], session=new_session
+        )
+        reset_schemes()
+
+        # Re-saving or regrading the past session's row keeps its grade
+        taken.save()
+        self.assertEqual(taken.grade, "B-")
+        self.assertEqual(regrade(), 0)
+        call_command("regrade_results", stdout=StringIO())
+        self.assertEqual(TakenCourse.objects.get(pk=taken.pk).grade, "B-")
+
+        # Rows of the new session are graded with its scheme
+        other_course = self.make_course("CS201", 3)
+        fresh = TakenCourse.objects.create(
+            student=student, course=other_course, final_exam=Decimal(65)
+        )
+        self.assertEqual((fresh.session, fresh.grade), (new_session, "F"))
+
+    def test_regrade_keeps_scores_saved_while_it_runs(self):
+        student, = self.make_students(1)
+        taken = TakenCourse.objects.get(student=student)
+        self.make_scheme(
+            "Pass/fail", [(60, "A", 4, True), (0, "F", 0, False)], program=self.program
+        )
+        select_for_update = QuerySet.select_for_update
+
+        def score_meanwhile(queryset, *args, **kwargs):
+            # A lecturer posts a score after the chunk's ids were listed
+            taken.final_exam = Decimal(70)
+            taken.save()
+            return select_for_update(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, "select_for_update", score_meanwhile):
+            regrade()
+        taken.refresh_from_db()
+        self.assertEqual((taken.final_exam, taken.grade), (Decimal(70), "A"))
+        self.assertEqual(ledger.verify(), [])
+
+    def test_one_scheme_per_scope(self):
+        self.make_scheme("Default", [])
+        self.make_scheme("Program", [], program=self.program)
+        self.make_scheme("Session", [], session=self.session)
+        for scope in ({}, {"program": self.program}, {"session": self.session}):
+            with self.assertRaises(ValidationError):
+                GradingScheme(name="Duplicate", **scope).clean()
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                GradingScheme.objects.create(name="Duplicate", **scope)
+
+
+class ResultSheetPdfTests(ResultDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        self.make_students(3)
+        self.client.force_login(self.lecturer)
+        self.url = f"/en/result/result/print/{self.course.pk}/"
+
+    def test_sheet_is_cached_by_content(self):
+        media = tempfile.mkdtemp()
+        with override_settings(MEDIA_ROOT=media), \
+                mock.patch("result.pdf.render_result_sheet", wraps=render_result_sheet) as render:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+        self.assertEqual(first["Content-Type"], "application/pdf")
+        self.assertTrue(first.content.startswith(b"%PDF"))
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(os.listdir(media), [])
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+        taken = TakenCourse.objects.first()
+        taken.final_exam = Decimal("45")
+        taken.save()
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+
+    def test_sheet_data(self):
+        taken = TakenCourse.objects.first()
+        taken.final_exam = Decimal("50")
+        taken.save()
+        with self.assertNumQueries(1):
+            data = result_sheet_data(self.course, self.lecturer, self.semester, self.session)
+        self.assertEqual((data["passed"], data["failed"]), (1, 2))
+        self.assertEqual(data["rows"][0][2:], ["50.00", "C-", "5.25", "PASS"])
+        self.assertEqual(fingerprint(data), fingerprint(json.loads(json.dumps(data))))
+
+
+class BulkPdfTests(ResultDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.make_students(3)
+        self.other = self.make_course("CS102", credit=2, semester="Second")
+        for student in self.students[:2]:
+            TakenCourse.objects.create(student=student, course=self.other)
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output, True)
+
+    def test_collect_jobs_uses_a_fixed_number_of_queries(self):
+        with self.assertNumQueries(4):
+            jobs = collect_jobs()
+        self.make_students(10)
+        with self.assertNumQueries(4):
+            more = collect_jobs()
+        self.assertEqual(len(jobs), 2 + 3)
+        self.assertEqual(len(more), 2 + 13)
+        sheet = next(job for job in jobs if job["name"].startswith("result_sheets/"))
+        self.assertEqual(sheet["data"]["lecturer"], self.lecturer.get_full_name)
+        # Plain data only, so the jobs can be sent to other processes
+        self.assertEqual(json.loads(json.dumps(jobs)), jobs)
+
+    def test_directory_output_resumes(self):
+        output = os.path.join(self.output, "pdfs")
+        broken = mock.Mock(side_effect=OSError("disk full"))
+        with mock.patch.dict(RENDERERS, {REGISTRATION_FORM: broken}):
+            summary = generate(collect_jobs(), output, workers=0)
+        self.assertEqual(summary["written"], 2)
+        self.assertEqual(len(summary["failed"]), 3)
+
+        summary = generate(collect_jobs(), output, workers=0)
+        self.assertEqual((summary["written"], summary["skipped"]), (3, 2))
+        files = sorted(os.listdir(os.path.join(output, "registration_forms")))
+        self.assertEqual(len(files), 3)
+        with open(os.path.join(output, "registration_forms", files[0]), "rb") as f:
+            self.assertTrue(f.read().startswith(b"%PDF"))
+
+        # Only the sheet whose scores changed is rendered again
+        taken = TakenCourse.objects.filter(course=self.other).first()
+        taken.final_exam = Decimal("70")
+        taken.save()
+        summary = generate(collect_jobs(), output, workers=0)
+        self.assertEqual((summary["written"], summary["skipped"]), (1, 4))
+
+    def test_command_renders_into_a_zip_with_worker_processes(self):
+        output = os.path.join(self.output, "results.zip")
+        out = StringIO()
+        call_command("generate_result_pdfs", output, workers=2, stdout=out)
+        self.assertIn("5/5 rendered, 0 failed", out.getvalue())
+        with zipfile.ZipFile(output) as archive:
+            names = archive.namelist()
+            self.assertEqual(len(names), 5)
+            self.assertTrue(all(archive.read(name).startswith(b"%PDF") for name in names))
+
+        call_command(
+            "generate_result_pdfs", output, kind=[REGISTRATION_FORM], workers=0, stdout=out
+        )
+        self.assertIn("0 written, 3 already up to date", out.getvalue())
+
+    def test_admin_action_downloads_a_zip(self):
+        admin_user = User.objects.create_superuser(username="admin", password="pw")
+        self.client.force_login(admin_user)
+        response = self.client.post(
+            reverse("admin:course_course_changelist"),
+            {"action": "download_result_pdfs", "_selected_action": [self.other.pk]},
+        )
+        self.assertEqual(response["Content-Type"], "application/zip")
+        with zipfile.ZipFile(BytesIO(b"".join(response.streaming_content))) as archive:
+            names = archive.namelist()
+        self.assertEqual(len(names), 1 + 2)
+
+    @override_settings(
+        STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage"
+    )
+    def test_admin_action_refuses_large_selections(self):
+        admin_user = User.objects.create_superuser(username="admin", password="pw")
+        self.client.force_login(admin_user)
+        with mock.patch("course.admin.MAX_ADMIN_PDFS", 2), mock.patch(
+            "course.admin.generate"
+        ) as generate:
+            response = self.client.post(
+                reverse("admin:course_course_changelist"),
+                {"action": "download_result_pdfs", "_selected_action": [self.other.pk]},
+                follow=True,
+            )
+        generate.assert_not_called()
+        self.assertContains(response, f"generate_result_pdfs results.zip --course {self.other.pk}")
+
+
+@override_settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class RegistrationFormTests(ResultDataMixin, TestCase):
+    def test_form_is_rendered_in_memory(self):
+        student, = self.make_students(1, is_student=True)
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        self.client.force_login(student.student)
+        with override_settings(MEDIA_ROOT=media):
+            response = self.client.get("/en/result/registration/form/")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(response.content.startswith(b"%PDF"))
+        self.assertEqual(os.listdir(media), [])
+
+
+@override_settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class GradeAnalyticsTests(ResultDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        self.addCleanup(caches["default"].clear)
+        self.make_students(4)
+        for taken, final_exam in zip(TakenCourse.objects.order_by("pk"), (40, 50, 60, 90)):
+            taken.final_exam = Decimal(final_exam)
+            taken.save()
+
+    def test_course_figures(self):
+        stats = course_analytics([self.course.pk])[self.course.pk]
+        self.assertEqual(stats["students"], 4)
+        self.assertEqual((stats["mean"], stats["median"], stats["stddev"]), (60.0, 55.0, 18.71))
+        self.assertEqual((stats["passed"], stats["failed"], stats["pass_rate"]), (3, 1, 0.75))
+        self.assertEqual(stats["grades"]["F"], 1)
+        self.assertEqual(sum(stats["grades"].values()), 4)
+        self.assertEqual(stats["histogram"][4], {"range": "40-50", "count": 1})
+        self.assertEqual(stats["histogram"][9]["count"], 1)
+        self.assertEqual(stats["components"]["final_exam"], 60.0)
+        self.assertEqual(stats["components"]["quiz"], 0.0)
+
+        empty = self.make_course("CS102")
+        stats = course_analytics([empty.pk])[empty.pk]
+        self.assertEqual((stats["students"], stats["mean"], stats["pass_rate"]), (0, None, None))
+
+    def test_one_query_per_scope_and_cached_until_a_save(self):
+        other = self.make_course("CS102")
+        with self.assertNumQueries(1):
+            course_analytics([self.course.pk, other.pk])
+        with self.assertNumQueries(1):
+            program_analytics([self.program.pk])
+        with self.assertNumQueries(0):
+            course_analytics([self.course.pk])
+            program_analytics([self.program.pk])
+
+        taken = TakenCourse.objects.filter(course=self.course).order_by("pk").first()
+        taken.final_exam = Decimal(80)
+        with self.captureOnCommitCallbacks(execute=True):
+            taken.save()
+        self.assertEqual(course_analytics([self.course.pk])[self.course.pk]["mean"], 70.0)
+        self.assertEqual(program_analytics([self.program.pk])[self.program.pk]["mean"], 70.0)
+        with self.assertNumQueries(0):
+            course_analytics([other.pk])
+
+    def test_bulk_score_submission_invalidates(self):
+        course_analytics([self.course.pk])
+        rows = {taken.pk: [0, 0, 0, 0, 20] for taken in TakenCourse.objects.all()}
+        self.client.force_login(self.lecturer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/en/result/manage-score/{self.course.pk}/", self.score_form(rows))
+        stats = course_analytics([self.course.pk])[self.course.pk]
+        self.assertEqual((stats["mean"], stats["pass_rate"]), (20.0, 0.0))
+
+    def test_json_endpoint(self):
+        url = reverse("grade_analytics")
+        self.client.force_login(self.lecturer)
+        data = self.client.get(url).json()
+        self.assertEqual(list(data["courses"]), [str(self.course.pk)])
+        self.assertEqual(data["courses"][str(self.course.pk)]["students"], 4)
+        self.assertEqual(data["programs"], {})
+
+        other = self.make_course("CS102")
+        self.assertEqual(self.client.get(url, {"course": other.pk}).status_code, 403)
+        self.assertEqual(self.client.get(url, {"course": "x"}).status_code, 400)
+
+        admin = User.objects.create_superuser(username="admin", password="pw")
+        self.client.force_login(admin)
+        data = self.client.get(url, {"program": self.program.pk}).json()
+        self.assertEqual(data["courses"], {})
+        self.assertEqual(data["programs"][str(self.program.pk)]["pass_rate"], 0.75)
+
+    def test_dashboard_panel(self):
+        admin = User.objects.create_superuser(username="admin", password="pw")
+        self.client.force_login(admin)
+        response = self.client.get(reverse("dashboard"))
+        row, = response.context["grade_analytics"]
+        self.assertEqual((row["program"], row["mean"]), ("Computer Science", 60.0))
+        self.assertContains(response, "75%")
 
-# Create your tests here.
@@ -6,6 +6,7 @@ from .views import (
     assessment_result,
     course_registration_form,
     result_sheet_pdf_view,
+    grade_analytics,
 )
 
 
@@ -18,4 +19,5 @@ urlpatterns = [
     path(
         "registration/form/", course_registration_form, name="course_registration_form"
     ),
+    path("analytics/", grade_analytics, name="grade_analytics"),
 ]